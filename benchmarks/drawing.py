@@ -0,0 +1,46 @@
+"""Benchmark PNG rendering against the old pngcanvas implementation.
+
+Usage: python benchmarks/drawing.py
+"""
+import random
+import timeit
+
+from colorbot.twitter.drawing import WIDTH, HEIGHT, create_png, solid_png
+
+
+def pngcanvas_png(r, g, b):
+    import pngcanvas
+
+    canvas = pngcanvas.PNGCanvas(WIDTH, HEIGHT, bgcolor=(r, g, b, 0xff))
+    return canvas.dump()
+
+
+def report(name, func, number):
+    seconds = timeit.timeit(func, number=number) / number
+    print("%-24s %10.2f us/image" % (name, seconds * 1e6))
+
+
+def main():
+    colors = [tuple(random.randrange(256) for _ in range(3))
+              for _ in range(10000)]
+    colors_iter = iter(colors * 100)
+
+    def uncached():
+        solid_png.__wrapped__(*next(colors_iter))
+
+    def cached():
+        create_png(0.5, -0.5, 0.25)
+
+    report("zlib encoder (uncached)", uncached, 10000)
+    report("zlib encoder (cached)", cached, 10000)
+
+    try:
+        import pngcanvas  # noqa
+    except ImportError:
+        print("pngcanvas not installed, skipping comparison")
+    else:
+        report("pngcanvas", lambda: pngcanvas_png(*next(colors_iter)), 20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark building batches from the encoded dataset against the old
+per-color loop.
+
+Usage: python benchmarks/gather_batch.py DATA_DIR [BATCHES] [BATCH_SIZE]
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from colorbot import constants, data
+from colorbot.dataset import load_dataset
+
+
+def loop_batch(batch, vocab):
+    """Build a batch one color at a time, like prepare_batch used to.
+    """
+    batch_size = len(batch)
+    max_len = max(len(c.name) for c in batch)
+
+    encoder_input = np.zeros([batch_size, max_len], np.int32)
+    encoder_length = np.zeros([batch_size], np.int32)
+    encoder_target = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
+
+    decoder_state = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
+    decoder_input = np.zeros([batch_size, max_len - 1], np.int32)
+    decoder_length = np.zeros([batch_size], np.int32)
+    decoder_mask = np.zeros([batch_size, max_len - 1], np.float32)
+    decoder_label = np.zeros([batch_size, max_len - 1], np.int32)
+
+    for i, color in enumerate(batch):
+        enc_name = [vocab[c] for c in color.name]
+
+        encoder_input[i, :len(enc_name)] = enc_name
+        encoder_length[i] = len(enc_name)
+        encoder_target[i, :] = color.r, color.g, color.b
+
+        decoder_state[i, :] = color.r, color.g, color.b
+        decoder_input[i, :len(enc_name) - 1] = enc_name[:-1]
+        decoder_length[i] = len(enc_name) - 1
+        decoder_mask[i, :len(enc_name) - 1] = 1.0
+        decoder_label[i, :len(enc_name) - 1] = enc_name[1:]
+
+    return data.Batch(
+        encoder_input,
+        encoder_length,
+        encoder_target,
+        decoder_state,
+        decoder_input,
+        decoder_length,
+        decoder_mask,
+        decoder_label,
+    )
+
+
+def report(name, func, number):
+    seconds = timeit.timeit(func, number=number) / number
+    print("%-24s %10.1f us/batch" % (name, seconds * 1e6))
+    return seconds
+
+
+def main():
+    data_dir = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    dataset = load_dataset(data_dir)
+    vocab = dataset.vocab
+    colors = dataset.colors()
+    encoded = dataset.encoded
+
+    rng = np.random.RandomState(0)
+    batches = [rng.randint(0, len(colors), batch_size) for _ in range(count)]
+    loop_iter = iter(batches * 2)
+    gather_iter = iter(batches * 2)
+
+    loop = report("per-color loop",
+                  lambda: loop_batch([colors[i] for i in next(loop_iter)],
+                                     vocab),
+                  count)
+    gather = report("gather_batch",
+                    lambda: data.gather_batch(encoded, next(gather_iter)),
+                    count)
+
+    print("%.1fx faster" % (loop / gather))
+
+
+if __name__ == "__main__":
+    main()
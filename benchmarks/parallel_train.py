@@ -0,0 +1,46 @@
+"""Benchmark how data parallel training throughput scales with workers.
+
+Usage: python benchmarks/parallel_train.py DATA_DIR [SECONDS] [MAX_WORKERS]
+
+Extra arguments after MAX_WORKERS are passed to colorbot_train, e.g.
+--async or -c 2000.
+"""
+import multiprocessing
+import sys
+
+from colorbot.dataset import load_dataset
+from colorbot.parallel import train_parallel
+from colorbot.scripts.train import build_parser
+
+
+def main():
+    data_dir = sys.argv[1]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else \
+        multiprocessing.cpu_count()
+    extra = sys.argv[4:]
+
+    colors = load_dataset(data_dir)
+    vocab = colors.vocab
+    encoded = colors.encoded
+
+    workers = 1
+    base = None
+
+    while workers <= max_workers:
+        args = build_parser().parse_args(
+            extra + ["--workers", str(workers), data_dir])
+        rate = train_parallel(args, encoded, len(vocab) // 2,
+                              duration=seconds, save=False)
+
+        if base is None:
+            base = rate
+
+        print("%3d workers %10.1f examples/s %6.2fx" % (
+            workers, rate, rate / base if base > 0 else 0.0))
+
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
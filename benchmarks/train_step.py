@@ -0,0 +1,53 @@
+"""Benchmark fused training steps against one session run per model.
+
+Usage: python benchmarks/train_step.py DATA_DIR [STEPS] [HIDDEN_SIZE]
+"""
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from colorbot import data, encoder, decoder
+from colorbot.dataset import load_dataset
+from colorbot.scripts.train import train_step
+
+
+def report(name, session, encoder_model, decoder_model, batches, fused):
+    # Warm up
+    for batch in batches[:5]:
+        train_step(session, encoder_model, decoder_model, batch, fused)
+
+    start = time.time()
+
+    for batch in batches:
+        train_step(session, encoder_model, decoder_model, batch, fused)
+
+    seconds = time.time() - start
+    print("%-24s %10.1f steps/s" % (name, len(batches) / seconds))
+
+
+def main():
+    data_dir = sys.argv[1]
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    hidden_size = int(sys.argv[3]) if len(sys.argv) > 3 else 150
+
+    colors = load_dataset(data_dir)
+    vocab = colors.vocab
+    encoded = colors.encoded
+    order = np.random.permutation(len(encoded.lengths))
+    batches = [data.gather_batch(encoded, order[i:i + 50])
+               for i in range(0, min(steps * 50, len(order)), 50)]
+
+    session = tf.Session()
+    encoder_model = encoder.Encoder(hidden_size, len(vocab) // 2)
+    decoder_model = decoder.Decoder(hidden_size, len(vocab) // 2)
+    session.run(tf.initialize_all_variables())
+
+    report("separate runs", session, encoder_model, decoder_model, batches,
+           False)
+    report("fused run", session, encoder_model, decoder_model, batches, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Precomputed names for a quantized RGB grid.
+
+The atlas file starts with `MAGIC`, then a 4 byte little endian header
+length and a JSON header, then a [cells, names per cell] uint8 array of name
+lengths and a [cells, names per cell, max length] array of name character
+ids, both starting at offsets (relative to the end of the header) given in
+the header so they can be memory mapped. Cells are ordered by R, then G, then
+B.
+"""
+import glob
+import hashlib
+import logging
+
+import numpy as np
+from colorbot import binfile
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CBATLAS\x00"
+
+VERSION = 1
+"""int: Version of the atlas file format"""
+
+
+def checkpoint_digest(param_path):
+    """Compute a digest identifying a set of model parameters.
+
+    Exported .npz weights carry the digest of the checkpoint they were
+    exported from, so they have the same digest as that checkpoint.
+
+    Args:
+        param_path (str): Path of the model parameters file, or of exported
+            .npz weights
+
+    Returns:
+        str: Hex SHA-256 digest of the parameter files.
+    """
+    if param_path.endswith(".npz"):
+        with np.load(param_path) as npz:
+            if "checkpoint" in npz.files:
+                return str(npz["checkpoint"])
+
+        # Exported before the digest was recorded
+        paths = [param_path]
+    else:
+        # Checkpoints may be split over several files
+        paths = sorted(p for p in glob.glob(param_path + "*")
+                       if p == param_path or p[len(param_path)] == ".")
+        paths = [p for p in paths if not p.endswith(".npz")]
+
+    digest = hashlib.sha256()
+
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cell_centers(grid_size):
+    """Get the color at the center of every grid cell.
+
+    Args:
+        grid_size (int): Number of cells along each axis
+
+    Returns:
+        A float32 [grid_size ** 3, 3] array of colors.
+    """
+    axis = -1.0 + (np.arange(grid_size) + 0.5) * 2.0 / grid_size
+    grid = np.meshgrid(axis, axis, axis, indexing="ij")
+
+    return np.stack(grid, -1).reshape([-1, 3]).astype(np.float32)
+
+
+class NameAtlas(object):
+    """Memory mapped atlas of precomputed color names.
+
+    Attributes:
+        grid_size (int): Number of grid cells along each axis
+        names_per_cell (int): Maximum number of names stored per cell
+        checkpoint (str): Digest of the parameters the atlas was built from
+        chars (list): Characters of the vocabulary, by id
+    """
+
+    def __init__(self, path):
+        """Open an atlas file.
+
+        Args:
+            path (str): Path of the atlas file
+        """
+        with open(path, "rb") as f:
+            header, data_start = binfile.read_header(f, MAGIC)
+
+        if header["version"] != VERSION:
+            raise ValueError("Unsupported atlas version %d" %
+                             header["version"])
+
+        self.grid_size = header["grid_size"]
+        self.names_per_cell = header["names_per_cell"]
+        self.checkpoint = header["checkpoint"]
+        self.chars = header["chars"]
+
+        cells = self.grid_size ** 3
+
+        self._lengths = np.memmap(
+            path, np.uint8, "r", data_start + header["lengths_offset"],
+            (cells, self.names_per_cell))
+        self._ids = np.memmap(
+            path, np.dtype(header["dtype"]), "r",
+            data_start + header["ids_offset"],
+            (cells, self.names_per_cell, header["max_length"]))
+
+    def _cell(self, rgb):
+        g = self.grid_size
+        cell = [min(max(int((c + 1.0) / 2.0 * g), 0), g - 1) for c in rgb]
+        return (cell[0] * g + cell[1]) * g + cell[2]
+
+    def names(self, rgb):
+        """Get the names stored for the cell containing a color.
+
+        Args:
+            rgb: A 3-tuple of R, G, and B floats on [-1.0, 1.0]
+
+        Returns:
+            A list of names (without start/end symbols), possibly empty.
+        """
+        cell = self._cell(rgb)
+        names = []
+
+        for ids, length in zip(self._ids[cell].tolist(),
+                               self._lengths[cell].tolist()):
+            if length > 0:
+                names.append("".join(self.chars[i] for i in ids[:length]))
+
+        return names
+
+
+def load_atlas(path, param_path):
+    """Open an atlas, checking it was built from the given parameters.
+
+    Args:
+        path (str): Path of the atlas file
+        param_path (str): Path of the parameters in use
+
+    Returns:
+        A NameAtlas, or None if it was built from different parameters.
+    """
+    atlas = NameAtlas(path)
+
+    if atlas.checkpoint != checkpoint_digest(param_path):
+        logger.warning("Atlas %s was built from different parameters than "
+                       "%s, not using it" % (path, param_path))
+        return None
+
+    return atlas
@@ -0,0 +1,49 @@
+"""Headers of the binary, memory mapped data files.
+
+Each file starts with a magic string identifying its type, then a 4 byte
+little endian header length and a JSON header, padded so the data after it
+starts on an 8 byte boundary.
+"""
+import json
+import struct
+
+
+def write_header(f, header, magic):
+    """Write the magic string and a JSON header, padded to 8 bytes.
+
+    Args:
+        f: The binary file object to write to
+        header (dict): The header
+        magic (bytes): The magic string identifying the file type
+
+    Returns:
+        int: Number of bytes written.
+    """
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    size = len(magic) + 4 + len(header_bytes)
+    header_bytes += b" " * (-size % 8)
+
+    f.write(magic)
+    f.write(struct.pack("<I", len(header_bytes)))
+    f.write(header_bytes)
+
+    return len(magic) + 4 + len(header_bytes)
+
+
+def read_header(f, magic):
+    """Read the header written by `write_header`.
+
+    Args:
+        f: The binary file object, at the start of the file
+        magic (bytes): The magic string identifying the file type
+
+    Returns:
+        A tuple of the header dict and the number of bytes read.
+    """
+    if f.read(len(magic)) != magic:
+        raise ValueError("Unexpected file type, expected %r" % magic)
+
+    header_len, = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_len).decode("utf-8"))
+
+    return header, len(magic) + 4 + header_len
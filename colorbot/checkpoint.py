@@ -0,0 +1,181 @@
+"""Checkpoints written in the background while training continues.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def save_state(path, state):
+    """Save the training state that goes with a checkpoint.
+
+    Args:
+        path (str): Path of the state file
+        state (dict): JSON serializable training state
+    """
+    with open(path + ".tmp", "w") as f:
+        f.write(json.dumps(state, sort_keys=True, indent=2))
+
+    # Replace the old state in one step, so a crash never leaves half a file
+    os.replace(path + ".tmp", path)
+
+
+def load_state(path):
+    """Load the state saved by `save_state`.
+
+    Args:
+        path (str): Path of the state file
+
+    Returns:
+        The state dict, or None if there is no state file.
+    """
+    try:
+        with open(path) as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+class CheckpointWriter(object):
+    """Save checkpoints on a background thread.
+
+    Saving only stalls training for the time it takes to copy the variable
+    values out of the session. The copies are written by a separate graph
+    and session on the writer thread, as a regular checkpoint that a
+    `tf.train.Saver` over the original variables can restore. If a new
+    checkpoint is requested while one of the same kind is waiting to be
+    written, only the newest pending one is kept.
+
+    Attributes:
+        best_checkpoint (str): Path of the last best checkpoint written, or
+            None if none was written yet
+    """
+
+    def __init__(self, variables, path, state_path, max_to_keep=5,
+                 best_path=None):
+        """Start the writer thread.
+
+        Args:
+            variables: List of the variables to save
+            path (str): Checkpoint path prefix, checkpoints are saved to
+                `path-<step>`
+            state_path (str): Path of the training state file written after
+                each checkpoint
+            max_to_keep (int): Number of recent checkpoints to keep
+            best_path (str): Path best checkpoints are saved to, each
+                replacing the last one
+        """
+        self.variables = list(variables)
+        self.path = path
+        self.state_path = state_path
+        self.max_to_keep = max_to_keep
+        self.best_path = best_path
+        self.best_checkpoint = None
+
+        self._pending = OrderedDict()
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def save(self, session, step, state, best=False):
+        """Copy the variables and queue them to be written.
+
+        Args:
+            session: The training session
+            step (int): The global step, used in the checkpoint's name
+            state (dict): Training state to save once the checkpoint is
+                written, its "checkpoint" key is set to the checkpoint path
+                and its "best_checkpoint" key to `best_checkpoint`
+            best (bool): Save to `best_path` instead. The training state
+                isn't saved, but `best_checkpoint` is set once it's written.
+        """
+        values = session.run(self.variables)
+        kind = "best" if best else "latest"
+
+        with self._cond:
+            # Requeue at the end, so checkpoints are written in order
+            self._pending.pop(kind, None)
+            self._pending[kind] = (values, step, dict(state))
+            self._cond.notify()
+
+    def close(self):
+        """Finish writing any pending checkpoint and stop the thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+        self._thread.join()
+
+    def _build(self):
+        # Only the writer needs TF, the state files are plain JSON
+        import tensorflow as tf
+
+        graph = tf.Graph()
+
+        with graph.as_default():
+            placeholders = []
+            assigns = []
+            names = {}
+
+            for var in self.variables:
+                dtype = var.dtype.base_dtype
+                shape = var.get_shape()
+
+                copy = tf.Variable(tf.zeros(shape, dtype), trainable=False)
+                placeholder = tf.placeholder(dtype, shape)
+
+                placeholders.append(placeholder)
+                assigns.append(tf.assign(copy, placeholder))
+                names[var.op.name] = copy
+
+            saver = tf.train.Saver(names, max_to_keep=self.max_to_keep)
+            best_saver = tf.train.Saver(names, max_to_keep=1)
+
+        return (tf.Session(graph=graph), placeholders, assigns, saver,
+                best_saver)
+
+    def _run(self):
+        session, placeholders, assigns, saver, best_saver = self._build()
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+
+                if not self._pending:
+                    break
+
+                kind, (values, step, state) = self._pending.popitem(
+                    last=False)
+
+            try:
+                session.run(assigns, feed_dict=dict(zip(placeholders, values)))
+
+                if kind == "best":
+                    self.best_checkpoint = best_saver.save(
+                        session, self.best_path,
+                        latest_filename="checkpoint_best")
+
+                    logger.info("Saved best checkpoint %s" %
+                                self.best_checkpoint)
+                    continue
+
+                if self.best_checkpoint is not None:
+                    state["best_checkpoint"] = self.best_checkpoint
+
+                state["checkpoint"] = saver.save(session, self.path,
+                                                 global_step=step)
+                save_state(self.state_path, state)
+
+                logger.info("Saved checkpoint %s" % state["checkpoint"])
+            except Exception:
+                logger.exception("Error saving checkpoint")
+
+        session.close()
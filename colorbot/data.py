@@ -1,13 +1,33 @@
 """Module related to color data and samples.
 """
+import itertools
 import json
-from collections import namedtuple
+import time
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from colorbot import constants
 
 Color = namedtuple("Color", ("name", "r", "g", "b"))
 
+EncodedColors = namedtuple("EncodedColors", (
+    "ids",
+    "offsets",
+    "lengths",
+    "rgb",
+))
+"""Colors encoded into flat arrays.
+
+Attributes:
+    ids: An integer array of all names' character ids, back to back,
+        followed by a 0
+    offsets: An int64 [colors + 1] array, name i is
+        ids[offsets[i]:offsets[i + 1]]
+    lengths: An int32 [colors] array of name lengths
+    rgb: A float32 [colors, 3] array of colors
+"""
+
 Batch = namedtuple("Batch", (
     "encoder_input",
     "encoder_length",
@@ -42,6 +62,35 @@ def build_vocab(colors):
     return vocab
 
 
+def extend_vocab(vocab, colors):
+    """Add the characters of new colors to a vocabulary.
+
+    Existing characters keep their ids, new ones are numbered after them in
+    sorted order, so extending an empty vocabulary is the same as
+    `build_vocab`.
+
+    Args:
+        vocab: The vocabulary dict
+        colors: Iterable of Colors
+
+    Returns:
+        A new vocabulary dict.
+    """
+    char_set = set()
+
+    for color in colors:
+        char_set.update(color.name)
+
+    vocab = dict(vocab)
+    size = len(vocab) // 2
+
+    for i, c in enumerate(sorted(char_set - set(vocab)), size):
+        vocab[i] = c
+        vocab[c] = i
+
+    return vocab
+
+
 def save_vocab(vocab, f):
     """Save the vocab to a file.
     """
@@ -130,49 +179,314 @@ def yield_batches(iter, batch_size):
         yield batch
 
 
-def prepare_batch(batch, vocab):
-    """Turn a list of colors into a Batch object.
+def bucket_indices(lengths, max_chars, rng=np.random):
+    """Group sequences of similar length into shuffled batches.
+
+    Sequences are sorted by length (in random order within a length) and cut
+    into batches whose padded size, i.e. the batch size times the longest
+    sequence, doesn't exceed `max_chars`. The batches are returned in random
+    order.
 
     Args:
-        batch: The list of Color objects
+        lengths: Array of sequence lengths
+        max_chars (int): Maximum number of padded characters per batch
+        rng: The NumPy random number generator to shuffle with
+
+    Returns:
+        A list of int arrays of indices into `lengths`.
+    """
+    lengths = np.asarray(lengths)
+
+    # Stable sort, so sequences of the same length stay shuffled
+    order = rng.permutation(len(lengths))
+    order = order[np.argsort(lengths[order], kind="mergesort")]
+
+    batches = []
+    start = 0
+
+    for i, length in enumerate(lengths[order].tolist()):
+        # Sorted by length, so this sequence is the batch's longest
+        if i > start and (i - start + 1) * length > max_chars:
+            batches.append(order[start:i])
+            start = i
+
+    if start < len(order):
+        batches.append(order[start:])
+
+    return [batches[i] for i in rng.permutation(len(batches))]
+
+
+def index_batches(lengths, batch_size, max_chars=None, rng=np.random):
+    """Split colors into shuffled batches of indices for an epoch.
+
+    Args:
+        lengths: Array of encoded name lengths
+        batch_size (int): Number of colors per batch
+        max_chars (int): Bucket the colors by length with `bucket_indices`
+            instead, with at most this many padded characters per batch, or
+            None to use `batch_size`
+        rng: The NumPy random number generator to shuffle with
+
+    Returns:
+        A list of int arrays of indices into `lengths`.
+    """
+    if max_chars is not None:
+        return bucket_indices(lengths, max_chars, rng)
+
+    order = rng.permutation(len(lengths))
+
+    return [order[i:i + batch_size]
+            for i in range(0, len(order), batch_size)]
+
+
+def yield_bucketed_batches(colors, max_chars, rng=np.random):
+    """Group colors with names of similar length into shuffled batches.
+
+    See `bucket_indices`.
+
+    Args:
+        colors: Iterable of Colors
+        max_chars (int): Maximum number of padded characters per batch
+        rng: The NumPy random number generator to shuffle with
+
+    Yields:
+        Lists of Colors.
+    """
+    colors = list(colors)
+    lengths = [len(c.name) for c in colors]
+
+    for indices in bucket_indices(lengths, max_chars, rng):
+        yield [colors[i] for i in indices.tolist()]
+
+
+def validation_split(count, fraction, seed=0):
+    """Split the colors into training and validation sets.
+
+    The split only depends on `count`, `fraction` and `seed`, so a resumed
+    run validates on the same colors.
+
+    Args:
+        count (int): Number of colors
+        fraction (float): Fraction of the colors to hold out for validation
+        seed (int): Seed of the random split
+
+    Returns:
+        A tuple of sorted int arrays of training and validation indices.
+    """
+    order = np.random.RandomState(seed).permutation(count)
+    held_out = int(round(count * fraction))
+
+    return np.sort(order[held_out:]), np.sort(order[:held_out])
+
+
+def padding_ratio(lengths, batches):
+    """Compute the fraction of padding in a set of batches.
+
+    Args:
+        lengths: Array of sequence lengths
+        batches: Iterable of arrays of indices into `lengths`
+
+    Returns:
+        float: Padded characters divided by all characters.
+    """
+    lengths = np.asarray(lengths)
+
+    real = 0
+    total = 0
+
+    for indices in batches:
+        batch_lengths = lengths[indices]
+        real += int(np.sum(batch_lengths))
+        total += len(batch_lengths) * int(np.max(batch_lengths))
+
+    return 1.0 - real / total if total > 0 else 0.0
+
+
+def encode_colors(colors, vocab):
+    """Encode colors into flat arrays.
+
+    Names are stored back to back, so memory scales with the total number of
+    characters.
+
+    Args:
+        colors: Sequence of Colors
         vocab: The vocabulary dict
 
     Returns:
-        A Batch object.
+        An EncodedColors object.
+    """
+    names = [c.name for c in colors]
+
+    lengths = np.fromiter((len(n) for n in names), np.int32, len(names))
+    offsets = np.zeros([len(names) + 1], np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # Map code points to ids through the (small) set of distinct characters
+    codes = np.frombuffer("".join(names).encode("utf-32-le"), np.uint32)
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    code_ids = np.array([vocab[chr(c)] for c in unique_codes.tolist()],
+                        np.int32)
+
+    # Padding reads the extra 0 at the end
+    ids = np.zeros([len(codes) + 1], np.int32)
+    ids[:-1] = code_ids[inverse.reshape([-1])]
+
+    rgb = np.array([c[1:4] for c in colors], np.float32)
+    rgb = rgb.reshape([-1, constants.COLOR_SIZE])
+
+    return EncodedColors(ids, offsets, lengths, rgb)
+
+
+def concat_encoded(first, second):
+    """Join two sets of encoded colors.
+
+    Args:
+        first: An EncodedColors object
+        second: An EncodedColors object, encoded with the same vocabulary or
+            an extension of it
+
+    Returns:
+        An EncodedColors object with the colors of `first`, then `second`.
     """
-    batch_size = len(batch)
-    max_len = max(len(c.name) for c in batch)
+    return EncodedColors(
+        np.concatenate([first.ids[:-1], second.ids]),
+        np.concatenate([first.offsets[:-1],
+                        second.offsets + first.offsets[-1]]),
+        np.concatenate([first.lengths, second.lengths]),
+        np.concatenate([first.rgb, second.rgb]),
+    )
+
 
-    encoder_input = np.zeros([batch_size, max_len], np.int32)
-    encoder_length = np.zeros([batch_size], np.int32)
-    encoder_target = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
+def select_encoded(encoded, rows):
+    """Keep some of a set of encoded colors.
 
-    decoder_state = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
-    decoder_input = np.zeros([batch_size, max_len - 1], np.int32)
-    decoder_length = np.zeros([batch_size], np.int32)
-    decoder_mask = np.zeros([batch_size, max_len - 1], np.float32)
-    decoder_label = np.zeros([batch_size, max_len - 1], np.int32)
+    Args:
+        encoded: An EncodedColors object
+        rows: Array of the indices of the colors to keep, in the order to
+            keep them in
+
+    Returns:
+        An EncodedColors object with only those colors.
+    """
+    rows = np.asarray(rows, np.int64)
 
-    for i, color in enumerate(batch):
-        enc_name = [vocab[c] for c in color.name]
+    lengths = encoded.lengths[rows]
+    offsets = np.zeros([len(rows) + 1], np.int64)
+    np.cumsum(lengths, out=offsets[1:])
 
-        encoder_input[i, :len(enc_name)] = enc_name
-        encoder_length[i] = len(enc_name)
-        encoder_target[i, :] = color.r, color.g, color.b
+    # Index of every kept character in the old ids
+    shift = np.repeat(encoded.offsets[rows] - offsets[:-1], lengths)
+    positions = shift + np.arange(offsets[-1])
 
-        decoder_state[i, :] = color.r, color.g, color.b
-        decoder_input[i, :len(enc_name) - 1] = enc_name[:-1]
-        decoder_length[i] = len(enc_name) - 1
-        decoder_mask[i, :len(enc_name) - 1] = 1.0
-        decoder_label[i, :len(enc_name) - 1] = enc_name[1:]
+    ids = np.zeros([offsets[-1] + 1], np.int32)
+    ids[:-1] = encoded.ids[positions]
+
+    return EncodedColors(ids, offsets, lengths, encoded.rgb[rows])
+
+
+def gather_batch(encoded, indices):
+    """Build a Batch from encoded colors.
+
+    Args:
+        encoded: An EncodedColors object
+        indices: Array of indices of the colors to put in the batch
+
+    Returns:
+        A Batch object.
+    """
+    indices = np.asarray(indices)
+
+    lengths = encoded.lengths[indices]
+    max_len = int(np.max(lengths))
+
+    # [batch size, max len] positions into the flat id array, with padding
+    # pointing at the 0 after the last name
+    steps = np.arange(max_len, dtype=np.int64)
+    mask = steps < lengths[:, np.newaxis]
+    positions = encoded.offsets[indices, np.newaxis] + steps
+    positions[~mask] = len(encoded.ids) - 1
+
+    encoder_input = encoded.ids[positions].astype(np.int32, copy=False)
+    encoder_target = encoded.rgb[indices]
+
+    decoder_mask = mask[:, 1:]
 
     return Batch(
         encoder_input,
-        encoder_length,
+        lengths,
         encoder_target,
-        decoder_state,
-        decoder_input,
-        decoder_length,
-        decoder_mask,
-        decoder_label,
+        encoder_target,
+        encoder_input[:, :-1] * decoder_mask,
+        lengths - 1,
+        decoder_mask.astype(np.float32),
+        encoder_input[:, 1:],
     )
+
+
+class Prefetcher(object):
+    """Iterate over batches built ahead of time on background threads.
+
+    Up to `depth` batches are built ahead of the one being consumed. Batches
+    are yielded in the order of `batches`, however many threads there are.
+
+    Attributes:
+        wait_time (float): Total seconds spent waiting for batches to be built
+    """
+
+    def __init__(self, encoded, batches, depth=4, threads=1):
+        """Create the prefetcher.
+
+        Args:
+            encoded: An EncodedColors object
+            batches: Iterable of arrays of indices into `encoded`
+            depth (int): Maximum number of batches built ahead
+            threads (int): Number of threads building batches
+        """
+        self.encoded = encoded
+        self.batches = batches
+        self.depth = depth
+        self.threads = threads
+        self.wait_time = 0.0
+
+    def __iter__(self):
+        executor = ThreadPoolExecutor(self.threads)
+        batches = iter(self.batches)
+        pending = deque()
+
+        def submit(count):
+            for indices in itertools.islice(batches, count):
+                pending.append(executor.submit(
+                    gather_batch, self.encoded, indices))
+
+        try:
+            submit(self.depth)
+
+            while len(pending) > 0:
+                future = pending.popleft()
+
+                start = time.time()
+                batch = future.result()
+                self.wait_time += time.time() - start
+
+                submit(1)
+
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
+
+            executor.shutdown()
+
+
+def prepare_batch(batch, vocab):
+    """Turn a list of colors into a Batch object.
+
+    Args:
+        batch: The list of Color objects
+        vocab: The vocabulary dict
+
+    Returns:
+        A Batch object.
+    """
+    encoded = encode_colors(batch, vocab)
+    return gather_batch(encoded, np.arange(len(batch)))
@@ -0,0 +1,173 @@
+"""Binary, memory mapped color dataset.
+
+The dataset file starts with `MAGIC`, then a 4 byte little endian header
+length and a JSON header holding the vocabulary, then a float32 [colors, 3]
+array of colors, an int64 [colors + 1] array of name offsets and an array of
+the names' character ids back to back, followed by a 0. The arrays start at
+offsets (relative to the end of the header) given in the header so they can
+be memory mapped, and together are an `EncodedColors`.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+from colorbot import binfile, constants, data
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CBCOLOR\x00"
+
+VERSION = 1
+"""int: Version of the dataset file format"""
+
+
+def _align(size):
+    return size + (-size % 8)
+
+
+def write_dataset(f, colors, vocab):
+    """Write colors to a dataset file.
+
+    Args:
+        f: The binary file object to write to
+        colors: Sequence of Colors
+        vocab: The vocabulary dict
+    """
+    write_encoded(f, data.encode_colors(colors, vocab), vocab)
+
+
+def write_encoded(f, encoded, vocab):
+    """Write encoded colors to a dataset file.
+
+    Args:
+        f: The binary file object to write to
+        encoded: An EncodedColors object
+        vocab: The vocabulary dict the colors were encoded with
+    """
+    vocab_size = len(vocab) // 2
+    dtype = np.uint8 if vocab_size <= 256 else np.uint16
+
+    rgb_size = _align(encoded.rgb.nbytes)
+    offsets_size = _align(encoded.offsets.nbytes)
+
+    header = {
+        "version": VERSION,
+        "count": len(encoded.lengths),
+        "chars": [vocab[i] for i in range(vocab_size)],
+        "dtype": np.dtype(dtype).name,
+        "total_ids": len(encoded.ids),
+        "rgb_offset": 0,
+        "offsets_offset": rgb_size,
+        "ids_offset": rgb_size + offsets_size,
+    }
+
+    binfile.write_header(f, header, MAGIC)
+
+    for array in (encoded.rgb, encoded.offsets, encoded.ids.astype(dtype)):
+        f.write(array.tobytes())
+        f.write(b"\x00" * (-array.nbytes % 8))
+
+
+class ColorDataset(object):
+    """Memory mapped dataset file.
+
+    Attributes:
+        vocab: The vocabulary dict
+        encoded: An EncodedColors object whose arrays map the file
+    """
+
+    def __init__(self, path):
+        """Open a dataset file.
+
+        Args:
+            path (str): Path of the dataset file
+        """
+        with open(path, "rb") as f:
+            header, data_start = binfile.read_header(f, MAGIC)
+
+        if header["version"] != VERSION:
+            raise ValueError("Unsupported dataset version %d" %
+                             header["version"])
+
+        count = header["count"]
+        chars = header["chars"]
+
+        self.vocab = {i: c for i, c in enumerate(chars)}
+        self.vocab.update({c: i for i, c in enumerate(chars)})
+
+        rgb = np.memmap(path, np.float32, "r",
+                        data_start + header["rgb_offset"],
+                        (count, constants.COLOR_SIZE))
+        offsets = np.memmap(path, np.int64, "r",
+                            data_start + header["offsets_offset"],
+                            (count + 1,))
+        ids = np.memmap(path, np.dtype(header["dtype"]), "r",
+                        data_start + header["ids_offset"],
+                        (header["total_ids"],))
+
+        lengths = np.diff(offsets).astype(np.int32)
+
+        self.encoded = data.EncodedColors(ids, offsets, lengths, rgb)
+        self._chars = chars
+
+    def __len__(self):
+        return len(self.encoded.lengths)
+
+    def names(self):
+        """Decode every name.
+
+        Returns:
+            A list of names, including start/end symbols.
+        """
+        codes = np.array([ord(c) for c in self._chars], np.uint32)
+        text = codes[self.encoded.ids[:-1]].tobytes().decode("utf-32-le")
+        offsets = self.encoded.offsets.tolist()
+
+        return [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def colors(self):
+        """Decode every color.
+
+        Returns:
+            A list of Colors.
+        """
+        return [data.Color(n, *rgb) for n, rgb in
+                zip(self.names(), self.encoded.rgb.tolist())]
+
+
+class _JSONDataset(ColorDataset):
+    """The same interface over an old colors.json and vocab.json.
+    """
+
+    def __init__(self, data_dir):
+        with open("%s/vocab.json" % data_dir) as f:
+            self.vocab = data.load_vocab(f)
+
+        with open("%s/colors.json" % data_dir) as f:
+            colors = [data.Color(*c) for c in json.loads(f.read())]
+
+        self.encoded = data.encode_colors(colors, self.vocab)
+        self._chars = [self.vocab[i] for i in range(len(self.vocab) // 2)]
+
+
+def load_dataset(data_dir):
+    """Open the dataset in a data directory.
+
+    Falls back to colors.json for data directories prepared before the
+    binary format.
+
+    Args:
+        data_dir (str): The data directory
+
+    Returns:
+        A ColorDataset.
+    """
+    path = "%s/colors.bin" % data_dir
+
+    if not os.path.exists(path) and \
+            os.path.exists("%s/colors.json" % data_dir):
+        logger.warn("%s not found, loading colors.json instead" % path)
+        return _JSONDataset(data_dir)
+
+    return ColorDataset(path)
@@ -3,7 +3,7 @@ from colorbot import tf_util, constants
 
 
 class Decoder(object):
-    def __init__(self, hidden_size, vocab_size):
+    def __init__(self, hidden_size, vocab_size, train=True):
         cell = tf.nn.rnn_cell.GRUCell(hidden_size)
 
         embed_params = tf_util.weights([vocab_size, hidden_size])
@@ -57,9 +57,20 @@ class Decoder(object):
             tf.reshape(mask, [-1]),
         )
 
-        trainer = tf.train.AdamOptimizer(0.001).minimize(
-            tf.reduce_sum(masked_loss) / tf.reduce_sum(mask),
-        )
+        objective = tf.reduce_sum(masked_loss) / tf.reduce_sum(mask)
+
+        if train:
+            trainer = tf.train.AdamOptimizer(0.001).minimize(objective)
+        else:
+            trainer = None
+
+        self.vocab_size = vocab_size
+        self.cell = cell
+        self.embed_params = embed_params
+        self.state_w = state_w
+        self.state_b = state_b
+        self.output_w = output_w
+        self.output_b = output_b
 
         self.state = state
         self.input = input
@@ -70,4 +81,113 @@ class Decoder(object):
         self.initial_state = initial_state
         self.final_state = final_state
         self.loss = masked_loss
+        self.objective = objective
         self.trainer = trainer
+
+    def feed(self, batch):
+        """Build the feed dict for a training step.
+
+        Args:
+            batch: The Batch
+
+        Returns:
+            A dict mapping the placeholders to the batch's arrays.
+        """
+        return {
+            self.state: batch.decoder_state,
+            self.input: batch.decoder_input,
+            self.length: batch.decoder_length,
+            self.mask: batch.decoder_mask,
+            self.label: batch.decoder_label,
+        }
+
+    def build_generator(self, max_length, start_id, end_id, temperature=1.0,
+                        top_k=None):
+        """Build a subgraph that samples whole sequences in one run.
+
+        The sampling loop runs inside the graph, feeding each sampled id back
+        in as the next input until every row has produced the end symbol or
+        `max_length` ids have been generated. It shares its parameters with
+        the training graph.
+
+        Sets the `gen_state`, `gen_ids` and `gen_length` attributes. Feed a
+        batch of colors to `gen_state`; `gen_ids` is then an int32 [batch size,
+        seq len] matrix of sampled ids starting with the start symbol, padded
+        with the end symbol, and `gen_length` the length of each sequence
+        including the start and end symbols.
+
+        Args:
+            max_length (int): Maximum sequence length, including the start
+                and end symbols
+            start_id (int): Vocab index of the start symbol
+            end_id (int): Vocab index of the end symbol
+            temperature (float): Divide the logits by this before sampling
+            top_k (int): Only sample from this many most likely ids, or None
+                to sample from all of them. Values of at least the vocab size
+                sample from all ids too.
+        """
+        state = tf.placeholder(tf.float32, [None, constants.COLOR_SIZE])
+
+        initial_state = tf.nn.elu(
+            tf.nn.xw_plus_b(state, self.state_w, self.state_b))
+
+        batch_size = tf.shape(state)[0]
+
+        start = tf.fill([batch_size], start_id)
+        end = tf.fill([batch_size], end_id)
+
+        ids = tf.TensorArray(tf.int32, size=0, dynamic_size=True)
+        ids = ids.write(0, start)
+
+        def cond(step, prev_id, hidden, ids, done, length):
+            return tf.logical_and(
+                tf.less(step, max_length),
+                tf.logical_not(tf.reduce_all(done)),
+            )
+
+        def body(step, prev_id, hidden, ids, done, length):
+            lookup_input = tf.nn.embedding_lookup(self.embed_params, prev_id)
+
+            # Reuse the RNN weights created by dynamic_rnn
+            with tf.variable_scope("Decoder", reuse=True):
+                output, hidden = self.cell(lookup_input, hidden)
+
+            logits = tf.nn.xw_plus_b(output, self.output_w, self.output_b)
+
+            if top_k is not None and top_k < self.vocab_size:
+                # Push everything below the k-th largest logit out of reach
+                values, _ = tf.nn.top_k(logits, top_k)
+                kth = tf.slice(values, [0, top_k - 1], [-1, 1])
+                logits -= 1e9 * tf.to_float(tf.less(logits, kth))
+
+            next_id = tf.to_int32(
+                tf.reshape(tf.multinomial(logits / temperature, 1), [-1]))
+
+            # Finished rows keep emitting the end symbol
+            next_id = tf.select(done, end, next_id)
+
+            ids = ids.write(step, next_id)
+            length += tf.to_int32(tf.logical_not(done))
+            done = tf.logical_or(done, tf.equal(next_id, end_id))
+
+            return step + 1, next_id, hidden, ids, done, length
+
+        _, _, _, ids, _, length = tf.while_loop(
+            cond,
+            body,
+            [
+                tf.constant(1),
+                start,
+                initial_state,
+                ids,
+                tf.equal(start, end),
+                tf.ones([batch_size], tf.int32),
+            ],
+        )
+
+        # [seq len, batch size] -> [batch size, seq len]
+        gen_ids = tf.transpose(ids.pack())
+
+        self.gen_state = state
+        self.gen_ids = gen_ids
+        self.gen_length = length
@@ -3,7 +3,7 @@ from colorbot import tf_util, constants
 
 
 class Encoder(object):
-    def __init__(self, hidden_size, vocab_size):
+    def __init__(self, hidden_size, vocab_size, train=True):
         cell = tf.nn.rnn_cell.GRUCell(hidden_size)
         state_size = cell.state_size
 
@@ -36,13 +36,37 @@ class Encoder(object):
         sse = tf.reduce_sum(tf.square(tf.sub(proj, target)), 1)
         mse = sse / constants.COLOR_SIZE
 
-        trainer = tf.train.AdamOptimizer(0.001).minimize(
-            tf.reduce_sum(mse),
-        )
+        objective = tf.reduce_sum(mse)
+
+        if train:
+            trainer = tf.train.AdamOptimizer(0.001).minimize(objective)
+        else:
+            trainer = None
+
+        self.cell = cell
+        self.embed_params = embed_params
+        self.output_w = output_w
+        self.output_b = output_b
 
         self.input = input
         self.length = length
         self.target = target
         self.output = proj
         self.loss = sse
+        self.objective = objective
         self.trainer = trainer
+
+    def feed(self, batch):
+        """Build the feed dict for a training step.
+
+        Args:
+            batch: The Batch
+
+        Returns:
+            A dict mapping the placeholders to the batch's arrays.
+        """
+        return {
+            self.input: batch.encoder_input,
+            self.length: batch.encoder_length,
+            self.target: batch.encoder_target,
+        }
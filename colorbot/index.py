@@ -0,0 +1,194 @@
+"""Lookup index over the scraped color dataset.
+"""
+import numpy as np
+from colorbot import constants
+
+RING_SCAN_RADIUS = 2
+"""int: Radius in cells up to which searches scan every cell around the
+query, farther cells are only visited if they hold colors"""
+
+
+class ColorIndex(object):
+    """Exact name lookup and nearest neighbor search over known colors.
+
+    Colors are bucketed into a uniform grid over the RGB cube. A nearest
+    neighbor search scans rings of cells around the query's cell, moving
+    outwards until no unscanned cell can hold anything closer. Beyond
+    `RING_SCAN_RADIUS`, only the cells that hold colors are visited, closest
+    first, so queries far from the data stay fast.
+
+    Attributes:
+        grid_size (int): Number of grid cells along each axis
+        names (list): Color names (with start/end symbols), sorted by cell
+        rgb: A float32 [colors, 3] array of colors, sorted by cell
+    """
+
+    def __init__(self, colors, grid_size=32):
+        """Build the index.
+
+        Args:
+            colors: Iterable of Colors or (name, r, g, b) tuples, with names
+                including start/end symbols and RGB on [-1.0, 1.0]
+            grid_size (int): Number of grid cells along each axis
+        """
+        colors = list(colors)
+
+        self.grid_size = grid_size
+        self._cell_width = 2.0 / grid_size
+
+        rgb = np.array([c[1:4] for c in colors], np.float32).reshape([-1, 3])
+        cells = self._cell_ids(self._cells(rgb))
+
+        order = np.argsort(cells, kind="mergesort")
+
+        self.names = [colors[i][0] for i in order.tolist()]
+        self.rgb = rgb[order]
+
+        # cell_start[i]:cell_start[i + 1] are the colors in cell i
+        self._cell_start = np.searchsorted(
+            cells[order], np.arange(grid_size ** 3 + 1))
+
+        # Ids and coordinates of the cells holding colors
+        self._nonempty = np.flatnonzero(np.diff(self._cell_start))
+        self._nonempty_cells = np.stack([
+            self._nonempty // (grid_size * grid_size),
+            self._nonempty // grid_size % grid_size,
+            self._nonempty % grid_size,
+        ], -1)
+
+        self._by_name = {}
+
+        for name, color in zip(self.names, self.rgb.tolist()):
+            self._by_name.setdefault(name, tuple(color))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def _cells(self, rgb):
+        cells = np.floor((np.asarray(rgb) + 1.0) / self._cell_width)
+        return np.clip(cells, 0, self.grid_size - 1).astype(np.int64)
+
+    def _cell_ids(self, cells):
+        g = self.grid_size
+        return (cells[..., 0] * g + cells[..., 1]) * g + cells[..., 2]
+
+    def _ring(self, center, radius):
+        """Get the ids of the cells at a Chebyshev distance from a cell.
+        """
+        offsets = np.arange(-radius, radius + 1)
+        cube = np.stack(np.meshgrid(offsets, offsets, offsets,
+                                    indexing="ij"), -1).reshape([-1, 3])
+
+        if radius > 0:
+            cube = cube[np.abs(cube).max(1) == radius]
+
+        cells = cube + center
+        in_grid = np.all((cells >= 0) & (cells < self.grid_size), 1)
+
+        return self._cell_ids(cells[in_grid])
+
+    def _scan(self, cells, query, k, found, dists):
+        """Add the colors of some cells to the k closest found so far.
+        """
+        starts = self._cell_start[cells]
+        counts = self._cell_start[cells + 1] - starts
+        total = int(counts.sum())
+
+        if total == 0:
+            return found, dists
+
+        # Indices of every color in the cells
+        ends = np.cumsum(counts)
+        idx = np.repeat(starts - (ends - counts), counts) + np.arange(total)
+
+        found = np.concatenate([found, idx])
+        dists = np.concatenate([
+            dists, np.sum((self.rgb[idx] - query) ** 2, 1)])
+
+        if len(found) > k:
+            keep = np.argpartition(dists, k - 1)[:k]
+            found = found[keep]
+            dists = dists[keep]
+
+        return found, dists
+
+    def _scan_far(self, query, center, k, found, dists):
+        """Scan the nonempty cells outside `RING_SCAN_RADIUS`, closest first,
+        until none can hold anything closer than the k found so far.
+        """
+        far = np.abs(self._nonempty_cells - center).max(1) > RING_SCAN_RADIUS
+        cells = self._nonempty[far]
+
+        # Squared distance from the query to the closest point of each cell
+        low = self._nonempty_cells[far] * self._cell_width - 1.0
+        gap = np.maximum(np.maximum(low - query,
+                                    query - (low + self._cell_width)), 0.0)
+        bounds = np.sum(gap ** 2, 1)
+
+        order = np.argsort(bounds, kind="mergesort")
+        start = 0
+        size = 1
+
+        while start < len(order):
+            if len(found) >= k and bounds[order[start]] > dists.max():
+                break
+
+            # Visit cells in growing batches to keep numpy calls few
+            found, dists = self._scan(cells[order[start:start + size]],
+                                      query, k, found, dists)
+            start += size
+            size *= 2
+
+        return found, dists
+
+    def lookup(self, name):
+        """Get the real color of a known name.
+
+        Args:
+            name (str): The name, including start/end symbols
+
+        Returns:
+            A 3-tuple of R, G, and B floats, or None if the name is unknown.
+        """
+        return self._by_name.get(name)
+
+    def nearest(self, rgb, k=1):
+        """Find the known colors closest to a color.
+
+        Args:
+            rgb: A 3-tuple of R, G, and B floats on [-1.0, 1.0]
+            k (int): Number of colors to find
+
+        Returns:
+            A list of up to `k` (name, rgb) tuples, closest first. Names
+            don't include the start/end symbols.
+        """
+        query = np.asarray(rgb, np.float32)
+        center = self._cells(query)
+
+        found = np.zeros([0], np.int64)
+        dists = np.zeros([0], np.float32)
+
+        for radius in range(min(RING_SCAN_RADIUS + 1, self.grid_size)):
+            found, dists = self._scan(self._ring(center, radius), query, k,
+                                      found, dists)
+
+            # Cells outside this ring are at least `radius` cells away
+            bound = radius * self._cell_width
+
+            if len(found) >= k and dists.max() <= bound ** 2:
+                break
+        else:
+            found, dists = self._scan_far(query, center, k, found, dists)
+
+        order = np.argsort(dists, kind="mergesort")
+
+        return [
+            (self.names[i][len(constants.START_SYMBOL):
+                           -len(constants.END_SYMBOL)],
+             tuple(self.rgb[i].tolist()))
+            for i in found[order].tolist()
+        ]
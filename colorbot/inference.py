@@ -0,0 +1,397 @@
+"""Model serving without TensorFlow.
+
+The encoder and decoder forward passes are reimplemented with NumPy, using
+weights exported from a checkpoint by `colorbot_export`.
+"""
+import logging
+
+import numpy as np
+from colorbot import constants
+from colorbot.sampling import sample_categorical
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBase(object):
+    """Name sampling and color guessing shared by the model implementations.
+
+    Subclasses implement `_initial_state`, `_step` and `_encode`.
+
+    Attributes:
+        vocab: The encoder/decoder vocabulary
+        name_set (set): A set of strings of existing color names
+        max_length (int): Maximum length of sampled names, including the start
+            and end symbols
+        temperature (float): Sampling temperature
+        top_k (int): Only sample from this many most likely characters, or
+            None for all of them
+        trie: NameTrie of the existing names. While sampling, the end symbol
+            is never picked when it would finish an existing name. None to
+            only reject existing names after sampling.
+    """
+
+    def __init__(self, vocab, name_set=None, max_length=50, temperature=1.0,
+                 top_k=None, trie=None):
+        self.vocab = vocab
+        self.name_set = name_set if name_set is not None else set()
+        self.max_length = max_length
+        self.temperature = temperature
+        self.top_k = top_k
+        self.trie = trie
+
+    def close(self):
+        """Release any resources held by the model.
+        """
+        pass
+
+    def _initial_state(self, rgbs):
+        """Compute the decoder's initial hidden state.
+
+        Args:
+            rgbs: A float32 [batch size, 3] array of colors
+
+        Returns:
+            A [batch size, hidden size] array.
+        """
+        raise NotImplementedError()
+
+    def _step(self, ids, state):
+        """Run the decoder for one step.
+
+        Args:
+            ids: An int32 [batch size] array of input ids
+            state: The [batch size, hidden size] hidden state
+
+        Returns:
+            A tuple of the [batch size, vocab size] output probabilities and
+            the new hidden state.
+        """
+        raise NotImplementedError()
+
+    def _encode(self, ids, lengths):
+        """Run the encoder.
+
+        Args:
+            ids: An int32 [batch size, seq len] array of input ids
+            lengths: An int32 [batch size] array of sequence lengths
+
+        Returns:
+            A float32 [batch size, 3] array of colors.
+        """
+        raise NotImplementedError()
+
+    def sample(self, rgb, count):
+        """Sample several candidate names for a color at once.
+
+        Args:
+            rgb: A 3-tuple of R, G, and B floats on [-1.0, 1.0]
+            count (int): Number of candidates to sample
+
+        Returns:
+            A list of `count` names (without start/end symbols). Rows that
+            didn't produce the end symbol in time are None.
+        """
+        return self.sample_batch([rgb], count)[0]
+
+    def sample_batch(self, rgbs, count):
+        """Sample several candidate names for each of several colors at once.
+
+        All candidates are decoded together as a [colors * count, 1] batch,
+        one character per step, until every row has produced the end symbol
+        or the maximum length is reached. With a trie, no candidate is an
+        existing name.
+
+        Args:
+            rgbs: A list of RGB 3-tuples
+            count (int): Number of candidates to sample per color
+
+        Returns:
+            A list with a list of `count` names (without start/end symbols) for
+            each color. Rows that didn't produce the end symbol in time are
+            None.
+        """
+        vocab = self.vocab
+        max_length = self.max_length
+        rows = len(rgbs) * count
+
+        start_id = vocab[constants.START_SYMBOL]
+        end_id = vocab[constants.END_SYMBOL]
+
+        name_seqs = np.zeros([rows, max_length], np.int32)
+        name_seqs[:, 0] = start_id
+        lengths = np.ones([rows], np.int32)
+        done = np.zeros([rows], np.bool_)
+
+        state = self._initial_state(
+            np.repeat(np.asarray(rgbs, np.float32), count, axis=0))
+
+        if self.trie is not None:
+            nodes = self.trie.step(np.zeros([rows], np.int32),
+                                   name_seqs[:, 0])
+
+        for step in range(1, max_length):
+            output, state = self._step(name_seqs[:, step - 1], state)
+
+            if self.trie is not None:
+                # Don't end rows whose prefix is an existing name. Rows with
+                # nothing left to sample keep their unmasked probabilities.
+                masked = np.array(output, np.float64)
+                masked[self.trie.is_name(nodes), end_id] = 0.0
+                totals = masked.sum(axis=1, keepdims=True)
+                output = np.where(totals > 0.0,
+                                  masked / np.maximum(totals, 1e-30), output)
+
+            next_ids = sample_categorical(output, self.temperature,
+                                          self.top_k)
+
+            if self.trie is not None:
+                nodes = self.trie.step(nodes, next_ids)
+
+            # Finished rows keep emitting the end symbol
+            name_seqs[:, step] = np.where(done, end_id, next_ids)
+            lengths += ~done
+            done |= next_ids == end_id
+
+            if done.all():
+                break
+
+        names = []
+
+        for row in range(rows):
+            if done[row]:
+                seq = name_seqs[row, 1:lengths[row] - 1]
+                names.append("".join(vocab[i] for i in seq.tolist()))
+            else:
+                names.append(None)
+
+        return [names[i:i + count] for i in range(0, rows, count)]
+
+    def name(self, rgb, tries=50, batch_size=50):
+        """Generate a new name for a color.
+
+        Args:
+            rgb: A 3-tuple of R, G, and B floats on [-1.0, 1.0]
+            tries (int): Give up after sampling this many names
+            batch_size (int): Number of candidates to sample at once
+
+        Returns:
+            str: The name (without start/end symbols), or None if no valid name
+                was generated.
+        """
+        return self.name_batch([rgb], tries, batch_size)[0]
+
+    def name_batch(self, rgbs, tries=50, batch_size=50):
+        """Generate new names for several colors at once.
+
+        Args:
+            rgbs: A list of RGB 3-tuples
+            tries (int): Give up after sampling this many names per color
+            batch_size (int): Number of candidates to sample at once per color
+
+        Returns:
+            A list of names (without start/end symbols), with None for colors
+            that no valid name was generated for.
+        """
+        pools = self.name_pools(rgbs, 1, tries, batch_size)
+        return [pool[0] if len(pool) > 0 else None for pool in pools]
+
+    def name_pools(self, rgbs, pool_size, tries=50, batch_size=50):
+        """Generate several distinct new names for each of several colors.
+
+        Args:
+            rgbs: A list of RGB 3-tuples
+            pool_size (int): Number of names to generate per color
+            tries (int): Give up after sampling this many names per color
+            batch_size (int): Number of candidates to sample at once per color
+
+        Returns:
+            A list with a list of up to `pool_size` names (without start/end
+            symbols) for each color.
+        """
+        pools = [[] for _ in rgbs]
+        pending = list(range(len(rgbs)))
+
+        while tries > 0 and len(pending) > 0:
+            count = min(tries, batch_size)
+            tries -= count
+
+            candidates = self.sample_batch([rgbs[i] for i in pending], count)
+
+            for i, color_candidates in zip(pending, candidates):
+                for name in color_candidates:
+                    # Skip names that didn't finish or that already exist
+                    if name is None or name in pools[i]:
+                        continue
+
+                    name_fmt = "%s%s%s" % (
+                        constants.START_SYMBOL,
+                        name,
+                        constants.END_SYMBOL,
+                    )
+
+                    if name_fmt not in self.name_set:
+                        pools[i].append(name)
+
+                        if len(pools[i]) == pool_size:
+                            break
+
+            pending = [i for i in pending if len(pools[i]) < pool_size]
+
+        return pools
+
+    def guess(self, name):
+        """Guess the color for a name.
+
+        Args:
+            name (str): The name, including start/end symbols. Every character
+                must be in the vocab.
+
+        Returns:
+            A 3-tuple of R, G, and B floats.
+        """
+        return self.guess_batch([name])[0]
+
+    def guess_batch(self, names):
+        """Guess the colors for several names in one encoder pass.
+
+        Args:
+            names: A list of names, including start/end symbols
+
+        Returns:
+            A list of RGB 3-tuples.
+        """
+        max_len = max(len(name) for name in names)
+
+        ids = np.zeros([len(names), max_len], np.int32)
+        lengths = np.zeros([len(names)], np.int32)
+
+        for i, name in enumerate(names):
+            ids[i, :len(name)] = [self.vocab[c] for c in name]
+            lengths[i] = len(name)
+
+        output = self._encode(ids, lengths)
+
+        return [tuple(rgb) for rgb in output.tolist()]
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def gru(x, h, gates_w, gates_b, candidate_w, candidate_b):
+    """One step of a GRU cell, matching `tf.nn.rnn_cell.GRUCell`.
+
+    Args:
+        x: The [batch size, input size] input
+        h: The [batch size, hidden size] hidden state
+        gates_w: The [input size + hidden size, 2 * hidden size] gate weights
+        gates_b: The [2 * hidden size] gate biases
+        candidate_w: The [input size + hidden size, hidden size] candidate
+            weights
+        candidate_b: The [hidden size] candidate biases
+
+    Returns:
+        The new [batch size, hidden size] hidden state.
+    """
+    gates = sigmoid(np.dot(np.concatenate([x, h], 1), gates_w) + gates_b)
+    r, u = np.split(gates, 2, axis=1)
+
+    c = np.tanh(np.dot(np.concatenate([x, r * h], 1), candidate_w) +
+                candidate_b)
+
+    return u * h + (1 - u) * c
+
+
+class NumpyModel(ModelBase):
+    """Both models evaluated with NumPy.
+
+    Attributes:
+        weights: Dict of weight arrays, as written by `colorbot_export`
+    """
+
+    def __init__(self, vocab, weights_path, name_set=None, **kwargs):
+        """Load exported weights.
+
+        Args:
+            vocab: The model vocabulary dict
+            weights_path (str): Path of the exported .npz file
+            name_set: Set of real color names to avoid, or None
+            **kwargs: Sampling options passed on to ModelBase
+        """
+        super(NumpyModel, self).__init__(vocab, name_set, **kwargs)
+
+        logger.info("Loading weights from %s" % weights_path)
+
+        with np.load(weights_path) as npz:
+            self.weights = {k: npz[k] for k in npz.files}
+
+    def _gru(self, prefix, x, h):
+        w = self.weights
+        return gru(
+            x, h,
+            w[prefix + "_gates_w"], w[prefix + "_gates_b"],
+            w[prefix + "_candidate_w"], w[prefix + "_candidate_b"],
+        )
+
+    def _initial_state(self, rgbs):
+        w = self.weights
+        return elu(np.dot(rgbs, w["decoder_state_w"]) + w["decoder_state_b"])
+
+    def _step(self, ids, state):
+        w = self.weights
+
+        state = self._gru("decoder", w["decoder_embed"][ids], state)
+        logits = np.dot(state, w["decoder_output_w"]) + w["decoder_output_b"]
+
+        return softmax(logits), state
+
+    def _encode(self, ids, lengths):
+        w = self.weights
+
+        batch_size, seq_len = ids.shape
+        hidden_size = w["encoder_embed"].shape[1]
+
+        state = np.zeros([batch_size, hidden_size], np.float32)
+
+        for step in range(seq_len):
+            new_state = self._gru("encoder", w["encoder_embed"][ids[:, step]],
+                                  state)
+
+            # Rows past their length keep their final state
+            active = (step < lengths)[:, np.newaxis]
+            state = np.where(active, new_state, state)
+
+        return np.tanh(
+            np.dot(state, w["encoder_output_w"]) + w["encoder_output_b"])
+
+
+def load_model(vocab, hidden_size, param_path, name_set=None, **kwargs):
+    """Load a model for serving.
+
+    Exported .npz weights are served with NumPy, anything else is treated as a
+    TensorFlow checkpoint. TensorFlow is only imported in the latter case.
+
+    Args:
+        vocab: The model vocabulary dict
+        hidden_size (int): The model's hidden size
+        param_path (str): Path of the parameters file
+        name_set: Set of real color names to avoid, or None
+        **kwargs: Sampling options passed on to ModelBase
+
+    Returns:
+        A ModelBase instance.
+    """
+    if param_path.endswith(".npz"):
+        return NumpyModel(vocab, param_path, name_set, **kwargs)
+
+    from colorbot.model import Model
+    return Model(vocab, hidden_size, param_path, name_set, **kwargs)
@@ -0,0 +1,250 @@
+"""Incremental merging of scraped colors into the dataset.
+"""
+import json
+import logging
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from colorbot import data
+
+logger = logging.getLogger(__name__)
+
+FIRST = "first"
+"""str: Duplicate policy keeping the color of the earliest source"""
+
+LAST = "last"
+"""str: Duplicate policy keeping the color of the latest source"""
+
+AVERAGE = "average"
+"""str: Duplicate policy averaging the colors of all sources"""
+
+KEEP = "keep"
+"""str: Duplicate policy keeping one color per source"""
+
+POLICIES = (FIRST, LAST, AVERAGE, KEEP)
+
+VERSION = 1
+"""int: Version of the index file format"""
+
+
+def magnitude_key(color):
+    """Sort key ordering colors from dark to light.
+    """
+    mag = (color.r + 1) ** 2 * (color.g + 1) ** 2 * (color.b + 1) ** 2
+    return mag, color.r, color.g, color.b
+
+
+class SourceIndex(object):
+    """Persistent index of every name's color in every source.
+
+    Each entry also records the dataset rows the name was written to, so a
+    later merge only touches the rows of names that changed.
+
+    Attributes:
+        policy (str): The duplicate policy, one of `POLICIES`
+        sources (list): Source names, earliest first
+        count (int): Number of rows in the dataset
+        entries: OrderedDict of name to a dict of "colors", mapping source
+            name to an [r, g, b] list, and "rows", a list of row indices
+    """
+
+    def __init__(self, policy, sources):
+        if policy not in POLICIES:
+            raise ValueError("Unknown duplicate policy %s" % policy)
+
+        self.policy = policy
+        self.sources = list(sources)
+        self.count = 0
+        self.entries = OrderedDict()
+
+    def update(self, source, colors):
+        """Record a source's colors.
+
+        Args:
+            source (str): The source name
+            colors: Iterable of Colors from the source
+
+        A name listed more than once keeps the color of its first listing.
+        Names the source listed before but not in `colors` are forgotten for
+        it. Names left without any source are removed by `merge`.
+
+        Returns:
+            A list of the names that are new or whose color changed, in the
+            order they first appear in `colors`, followed by the names the
+            source no longer lists.
+        """
+        changed = OrderedDict()
+        seen = set()
+
+        for color in colors:
+            if color.name in seen:
+                continue
+
+            seen.add(color.name)
+            entry = self.entries.get(color.name)
+
+            if entry is None:
+                entry = {"colors": {}, "rows": []}
+                self.entries[color.name] = entry
+
+            rgb = [color.r, color.g, color.b]
+
+            if entry["colors"].get(source) != rgb:
+                entry["colors"][source] = rgb
+                changed[color.name] = True
+
+        vanished = [name for name, entry in self.entries.items()
+                    if source in entry["colors"] and name not in seen]
+
+        for name in vanished:
+            del self.entries[name]["colors"][source]
+            changed[name] = True
+
+        if vanished:
+            logger.info("%d names no longer listed by %s" % (
+                len(vanished), source))
+            logger.debug("Names no longer listed by %s: %s" % (
+                source, ", ".join(n[1:-1] for n in vanished)))
+
+        return list(changed)
+
+    def resolve(self, name):
+        """Get the colors a name should have in the dataset.
+
+        Args:
+            name (str): The name, including start/end symbols
+
+        Returns:
+            A list of (r, g, b) tuples, one per dataset row.
+        """
+        colors = self.entries[name]["colors"]
+
+        # Sources no longer scraped go after the current ones
+        order = {s: i for i, s in enumerate(self.sources)}
+        by_source = [colors[s] for s in
+                     sorted(colors, key=lambda s: (order.get(s, len(order)),
+                                                   s))]
+
+        if self.policy == FIRST:
+            return [tuple(by_source[0])]
+        elif self.policy == LAST:
+            return [tuple(by_source[-1])]
+        elif self.policy == AVERAGE:
+            return [tuple(np.mean(by_source, 0).tolist())]
+        else:
+            return [tuple(c) for c in by_source]
+
+    def save(self, f):
+        """Save the index to a json file.
+
+        Args:
+            f: The file object to write to
+        """
+        f.write(json.dumps({
+            "version": VERSION,
+            "policy": self.policy,
+            "sources": self.sources,
+            "count": self.count,
+            "entries": list(self.entries.items()),
+        }))
+
+    def load(self, f):
+        """Load entries from a json file.
+
+        Args:
+            f: The file object
+
+        Returns:
+            bool: False if the file was saved with a different duplicate
+            policy or format version, in which case nothing is loaded.
+        """
+        saved = json.loads(f.read())
+
+        if saved["version"] != VERSION or saved["policy"] != self.policy:
+            return False
+
+        self.count = saved["count"]
+        self.entries = OrderedDict(saved["entries"])
+
+        logger.info("Loaded %d indexed names" % len(self.entries))
+
+        return True
+
+
+def merge(index, names, encoded, vocab):
+    """Bring the dataset up to date with the index for some names.
+
+    Rows of names whose resolved color changed are updated in place. Rows a
+    name no longer resolves to are removed, along with the names no source
+    lists any more, and the rows after them move up. Names that need more
+    rows get new ones, sorted dark to light and appended to the end. The
+    order of the remaining rows and existing character ids never change.
+
+    Args:
+        index: The SourceIndex
+        names: Iterable of the names to update
+        encoded: An EncodedColors object of the current dataset
+        vocab: The vocabulary dict of the current dataset
+
+    Returns:
+        A tuple of the new EncodedColors, the extended vocabulary, and the
+        numbers of updated, added and removed rows.
+    """
+    rgb = np.array(encoded.rgb, np.float32)
+    updated = 0
+    added = []
+    removed = []
+
+    for name in OrderedDict.fromkeys(names):
+        entry = index.entries[name]
+        rows = entry["rows"]
+        colors = index.resolve(name) if entry["colors"] else []
+
+        removed.extend(rows[len(colors):])
+        del rows[len(colors):]
+
+        if not colors:
+            del index.entries[name]
+            continue
+
+        for i, color in enumerate(colors):
+            if i >= len(rows):
+                added.append((i, data.Color(name, *color)))
+            elif not np.array_equal(rgb[rows[i]], np.float32(color)):
+                rgb[rows[i]] = color
+                updated += 1
+
+    encoded = data.EncodedColors(encoded.ids, encoded.offsets,
+                                 encoded.lengths, rgb)
+
+    if removed:
+        keep = np.ones([index.count], np.bool_)
+        keep[removed] = False
+        new_row = np.cumsum(keep) - 1
+
+        for entry in index.entries.values():
+            entry["rows"] = new_row[entry["rows"]].tolist()
+
+        encoded = data.select_encoded(encoded, np.flatnonzero(keep))
+        index.count -= len(removed)
+
+        logger.info("Removed %d rows" % len(removed))
+
+    added.sort(key=lambda a: magnitude_key(a[1]))
+
+    # A name's rows follow the order of its resolved colors
+    new_rows = defaultdict(list)
+
+    for row, (i, color) in enumerate(added, index.count):
+        new_rows[color.name].append((i, row))
+
+    for name, rows in new_rows.items():
+        index.entries[name]["rows"].extend(row for _, row in sorted(rows))
+
+    index.count += len(added)
+
+    added = [color for _, color in added]
+    vocab = data.extend_vocab(vocab, added)
+    encoded = data.concat_encoded(encoded, data.encode_colors(added, vocab))
+
+    return encoded, vocab, updated, len(added), len(removed)
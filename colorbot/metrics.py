@@ -0,0 +1,130 @@
+"""Structured training metrics.
+"""
+import json
+import multiprocessing
+import platform
+import threading
+import time
+from collections import defaultdict
+
+
+class MetricsLog(object):
+    """Append metrics records to a JSON lines file.
+
+    Every record is a JSON object on its own line, with a "type" and the
+    "time" it was written.
+    """
+
+    def __init__(self, path):
+        """Open the log.
+
+        Args:
+            path (str): Path of the file, records are appended to it
+        """
+        self.path = path
+
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def write(self, record_type, **fields):
+        """Write a record.
+
+        Args:
+            record_type (str): The record type
+            **fields: The record's fields, JSON serializable
+        """
+        record = dict(fields, type=record_type, time=time.time())
+
+        with self._lock:
+            self._file.write(json.dumps(record, sort_keys=True) + "\n")
+            self._file.flush()
+
+    def write_run(self, args):
+        """Write a record describing the run and the machine it's on.
+
+        Args:
+            args: The parsed command line arguments
+        """
+        self.write(
+            "run",
+            args=vars(args),
+            host=platform.node(),
+            machine=platform.machine(),
+            cpu_count=multiprocessing.cpu_count(),
+        )
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class StepStats(object):
+    """Accumulate per-step timings and throughput over a window of steps.
+
+    Attributes:
+        steps (int): Number of steps recorded
+        examples (int): Number of colors trained on
+        chars (int): Number of real (not padding) characters trained on
+        padded_chars (int): Number of characters including padding
+        timings: Dict of total seconds spent per phase
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start a new window.
+        """
+        self.start = time.time()
+        self.steps = 0
+        self.examples = 0
+        self.chars = 0
+        self.padded_chars = 0
+        self.timings = defaultdict(float)
+
+    def exclude(self, seconds):
+        """Leave time spent outside of training steps out of the window.
+
+        Args:
+            seconds (float): Seconds to leave out
+        """
+        self.start += seconds
+
+    def add(self, batch, timings=None):
+        """Record a step.
+
+        Args:
+            batch: The step's Batch
+            timings: Optional dict of seconds spent per phase of the step
+        """
+        for phase, seconds in (timings or {}).items():
+            self.timings[phase] += seconds
+
+        self.steps += 1
+        self.examples += len(batch.encoder_length)
+        self.chars += int(batch.encoder_length.sum())
+        self.padded_chars += batch.encoder_input.size
+
+    def summary(self):
+        """Summarize the window.
+
+        Returns:
+            A dict of throughput, padding efficiency, and the mean
+            milliseconds per step of each phase.
+        """
+        elapsed = max(time.time() - self.start, 1e-9)
+        steps = max(self.steps, 1)
+
+        summary = {
+            "steps": self.steps,
+            "seconds": elapsed,
+            "steps_per_sec": self.steps / elapsed,
+            "examples_per_sec": self.examples / elapsed,
+            "chars_per_sec": self.chars / elapsed,
+            "padding_efficiency": self.chars / max(self.padded_chars, 1),
+        }
+
+        for phase, seconds in self.timings.items():
+            summary["%s_ms" % phase] = seconds * 1000.0 / steps
+
+        return summary
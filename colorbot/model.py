@@ -0,0 +1,132 @@
+"""Long-lived model holder for serving.
+"""
+import logging
+
+import numpy as np
+import tensorflow as tf
+from colorbot import constants
+from colorbot.decoder import Decoder
+from colorbot.encoder import Encoder
+from colorbot.inference import ModelBase
+
+logger = logging.getLogger(__name__)
+
+
+class Model(ModelBase):
+    """Holds both models and a session with their parameters loaded.
+
+    The graph is built and the parameters are restored once, so the object can
+    be reused for any number of requests.
+
+    Attributes:
+        graph: The TensorFlow graph holding both models
+        session: The session the parameters are loaded into
+        encoder: The Encoder instance
+        decoder: The Decoder instance
+        in_graph (bool): True if names are sampled by the decoder's generator
+            subgraph instead of one session run per character. The generator
+            can't consult a trie, so this is False when one is given.
+    """
+
+    def __init__(self, vocab, hidden_size, param_path, name_set=None,
+                 in_graph=True, **kwargs):
+        """Build the models and restore their parameters.
+
+        Args:
+            vocab: The model vocabulary dict
+            hidden_size (int): The model's hidden size
+            param_path (str): Path of the model parameters file
+            name_set: Set of real color names to avoid, or None
+            in_graph (bool): Sample names with the in-graph generator
+            **kwargs: Sampling options passed on to ModelBase
+        """
+        super(Model, self).__init__(vocab, name_set, **kwargs)
+
+        self.in_graph = in_graph and self.trie is None
+
+        logger.info("Loading model from %s" % param_path)
+
+        self.graph = tf.Graph()
+
+        with self.graph.as_default():
+            self.encoder = Encoder(hidden_size, len(vocab) // 2)
+            self.decoder = Decoder(hidden_size, len(vocab) // 2)
+
+            if self.in_graph:
+                self.decoder.build_generator(
+                    self.max_length,
+                    vocab[constants.START_SYMBOL],
+                    vocab[constants.END_SYMBOL],
+                    self.temperature,
+                    self.top_k,
+                )
+
+            saver = tf.train.Saver()
+
+            self.session = tf.Session(graph=self.graph)
+            self.session.run(tf.initialize_all_variables())
+            saver.restore(self.session, param_path)
+
+    def close(self):
+        """Close the session.
+        """
+        self.session.close()
+
+    def _initial_state(self, rgbs):
+        return self.session.run(
+            self.decoder.initial_state,
+            feed_dict={
+                self.decoder.state: rgbs,
+            },
+        )
+
+    def _step(self, ids, state):
+        decoder = self.decoder
+        batch_size = ids.shape[0]
+
+        state, output = self.session.run(
+            [decoder.final_state, decoder.output],
+            feed_dict={
+                decoder.initial_state: state,
+                decoder.input: ids[:, np.newaxis],
+                decoder.length: np.ones([batch_size], np.int32),
+                decoder.mask: np.ones([batch_size, 1], np.float32),
+            },
+        )
+
+        return output, state
+
+    def _encode(self, ids, lengths):
+        return self.session.run(
+            self.encoder.output,
+            feed_dict={
+                self.encoder.input: ids,
+                self.encoder.length: lengths,
+            },
+        )
+
+    def sample_batch(self, rgbs, count):
+        if not self.in_graph:
+            return super(Model, self).sample_batch(rgbs, count)
+
+        # Sample candidate names with a single run of the generator
+        decoder = self.decoder
+        end_id = self.vocab[constants.END_SYMBOL]
+
+        ids, lengths = self.session.run(
+            [decoder.gen_ids, decoder.gen_length],
+            feed_dict={
+                decoder.gen_state: np.repeat(
+                    np.asarray(rgbs, np.float32), count, axis=0),
+            },
+        )
+
+        names = []
+
+        for seq, length in zip(ids.tolist(), lengths.tolist()):
+            if seq[length - 1] == end_id:
+                names.append("".join(self.vocab[i] for i in seq[1:length - 1]))
+            else:
+                names.append(None)
+
+        return [names[i:i + count] for i in range(0, len(names), count)]
@@ -0,0 +1,344 @@
+"""Data parallel training with worker processes on one machine.
+
+The model parameters live in a TF parameter server process, and each worker
+process trains on its own shard of the dataset.
+"""
+import logging
+import multiprocessing
+import signal
+import socket
+import time
+from collections import defaultdict
+
+import numpy as np
+import tensorflow as tf
+from colorbot import data, encoder, decoder, metrics, tf_util
+
+logger = logging.getLogger(__name__)
+
+STEP_TIMEOUT_MS = 10000
+"""int: Milliseconds a data parallel training step may wait for the other
+workers before it is abandoned"""
+
+UNSUPPORTED_OPTIONS = ["validation", "checkpoint_steps",
+                       "checkpoint_minutes", "resume", "patience",
+                       "trace_steps"]
+"""list: Training options that only apply to training in one process"""
+
+
+def free_ports(count):
+    """Find ports on localhost that are currently unused.
+
+    Args:
+        count (int): Number of ports
+
+    Returns:
+        A list of port numbers.
+    """
+    sockets = []
+
+    for _ in range(count):
+        s = socket.socket()
+        s.bind(("localhost", 0))
+        sockets.append(s)
+
+    ports = [s.getsockname()[1] for s in sockets]
+
+    for s in sockets:
+        s.close()
+
+    return ports
+
+
+def run_ps(cluster):
+    """Serve the shared model parameters until terminated.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server = tf.train.Server(cluster, "ps", 0)
+    server.join()
+
+
+def train_worker(args, encoded, vocab_size, cluster, task, stop, examples,
+                 save=True, metrics_path=None):
+    """Train on one shard of the dataset as part of a data parallel run.
+
+    Worker 0 is the chief, which initializes the model and saves it at the
+    end of the run.
+
+    Args:
+        args: The parsed command line arguments
+        encoded: The EncodedColors of the whole dataset
+        vocab_size (int): Number of characters in the vocabulary
+        cluster: The tf.train.ClusterSpec
+        task (int): Index of this worker
+        stop: A multiprocessing Event set to stop training
+        examples: A multiprocessing Value counting examples trained on
+        save (bool): Save the parameters at the end of the run
+        metrics_path (str): Path of the metrics log to append this worker's
+            step and epoch records to, or None to not record metrics
+    """
+    # The parent handles Ctrl-C and sets `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server = tf.train.Server(cluster, "worker", task)
+    is_chief = task == 0
+
+    # Every worker gets every workers-th color, the colors are sorted so this
+    # spreads them evenly
+    shard = np.arange(task, len(encoded.lengths), args.workers)
+
+    if args.seed is None:
+        rng = np.random.RandomState()
+    else:
+        rng = np.random.RandomState(args.seed + task)
+        tf.set_random_seed(args.seed)
+
+    device_setter = tf.train.replica_device_setter(
+        worker_device="/job:worker/task:%d" % task, cluster=cluster)
+
+    with tf.device(device_setter):
+        encoder_model = encoder.Encoder(args.hidden_size, vocab_size,
+                                        train=False)
+        encoder_vars = tf.trainable_variables()
+        decoder_model = decoder.Decoder(args.hidden_size, vocab_size,
+                                        train=False)
+        decoder_vars = tf.trainable_variables()[len(encoder_vars):]
+
+        global_step = tf.Variable(0, name="global_step", trainable=False)
+
+        # One Adam per model, applied in the same order as the models create
+        # theirs when training in one process, so the checkpoint has the same
+        # variables either way and every loader can restore it
+        optimizer = tf_util.SplitOptimizer([
+            (tf.train.AdamOptimizer(0.001), encoder_vars),
+            (tf.train.AdamOptimizer(0.001), decoder_vars),
+        ])
+
+        if not args.async_updates:
+            # One sync optimizer over both models' gradients, so there is a
+            # single token queue and step
+            optimizer = tf.train.SyncReplicasOptimizer(
+                optimizer,
+                replicas_to_aggregate=args.workers,
+                replica_id=task,
+                total_num_replicas=args.workers,
+            )
+
+        # The models share no variables, so the gradients of the summed
+        # objectives are each model's own
+        trainer = optimizer.minimize(
+            encoder_model.objective + decoder_model.objective,
+            global_step=global_step,
+        )
+
+        init_op = tf.initialize_all_variables()
+
+    saver = tf.train.Saver()
+
+    supervisor = tf.train.Supervisor(is_chief=is_chief, init_op=init_op,
+                                     global_step=global_step,
+                                     summary_op=None, saver=saver)
+    session = supervisor.prepare_or_wait_for_session(server.target)
+
+    if is_chief and not args.async_updates:
+        supervisor.start_queue_runners(
+            session, [optimizer.get_chief_queue_runner()])
+        session.run(optimizer.get_init_tokens_op())
+
+    # With synchronous updates a step blocks until every worker has
+    # contributed, which never happens once the others have stopped
+    run_options = tf.RunOptions(timeout_in_ms=STEP_TIMEOUT_MS)
+
+    if metrics_path is not None:
+        metrics_log = metrics.MetricsLog(metrics_path)
+
+        if is_chief:
+            metrics_log.write_run(args)
+    else:
+        metrics_log = None
+
+    window_stats = metrics.StepStats()
+    step = 0
+    epoch = 0
+    batches = None
+
+    while not stop.is_set():
+        epoch += 1
+        epoch_start = time.time()
+
+        enc_loss_num = 0
+        enc_loss_denom = 0
+        dec_loss_num = 0
+        dec_loss_denom = 0
+
+        if batches is None or args.max_chars is not None:
+            batches = [shard[b] for b in data.index_batches(
+                encoded.lengths[shard], args.batch_size, args.max_chars,
+                rng)]
+
+        if args.prefetch > 0:
+            batch_iter = data.Prefetcher(encoded, batches, args.prefetch,
+                                         args.prefetch_threads)
+        else:
+            batch_iter = (data.gather_batch(encoded, indices)
+                          for indices in batches)
+
+        epoch_stats = metrics.StepStats()
+        input_start = time.time()
+
+        for batch in batch_iter:
+            if stop.is_set():
+                break
+
+            timings = defaultdict(float)
+            timings["input"] = time.time() - input_start
+
+            feed_start = time.time()
+            feed = encoder_model.feed(batch)
+            feed.update(decoder_model.feed(batch))
+            timings["feed"] = time.time() - feed_start
+
+            try:
+                step_start = time.time()
+                enc_loss, dec_loss, _ = session.run(
+                    [encoder_model.loss, decoder_model.loss, trainer],
+                    feed_dict=feed, options=run_options)
+                timings["step"] = time.time() - step_start
+            except tf.errors.DeadlineExceededError:
+                logger.warn("Worker %d step timed out" % task)
+                input_start = time.time()
+                continue
+
+            enc_loss_num += np.sum(enc_loss)
+            enc_loss_denom += enc_loss.shape[0]
+            dec_loss_num += np.sum(dec_loss)
+            dec_loss_denom += np.sum(batch.decoder_mask)
+            step += 1
+
+            with examples.get_lock():
+                examples.value += enc_loss.shape[0]
+
+            window_stats.add(batch, timings)
+            epoch_stats.add(batch, timings)
+
+            if metrics_log is not None and step % args.log_steps == 0:
+                metrics_log.write("steps", worker=task, step=step,
+                                  epoch=epoch, **window_stats.summary())
+                window_stats.reset()
+
+            input_start = time.time()
+
+        if enc_loss_denom > 0:
+            logger.info("Worker %d epoch %d, encoder loss %.3f, decoder loss "
+                        "%.3f, %.1f s" % (task, epoch,
+                                          enc_loss_num / enc_loss_denom,
+                                          dec_loss_num / dec_loss_denom,
+                                          time.time() - epoch_start))
+
+            if metrics_log is not None:
+                metrics_log.write(
+                    "epoch", worker=task, step=step, epoch=epoch,
+                    encoder_loss=float(enc_loss_num / enc_loss_denom),
+                    decoder_loss=float(dec_loss_num / dec_loss_denom),
+                    **epoch_stats.summary())
+
+    if is_chief and save:
+        saver.save(session, "%s/params" % args.data_dir)
+        logger.info("Saved parameters")
+
+    if metrics_log is not None:
+        metrics_log.close()
+
+    supervisor.request_stop()
+
+
+def train_parallel(args, encoded, vocab_size, duration=None, save=True,
+                   metrics_path=None):
+    """Train with several worker processes sharing one set of parameters.
+
+    The parameters live in a parameter server process on localhost. Each
+    worker trains on its own shard of the dataset, and their gradients are
+    either averaged synchronously or applied as they come in.
+
+    Args:
+        args: The parsed command line arguments
+        encoded: The EncodedColors of the whole dataset
+        vocab_size (int): Number of characters in the vocabulary
+        duration (float): Seconds to train for once the first step has run,
+            or None to train until interrupted
+        save (bool): Save the parameters at the end of the run
+        metrics_path (str): Path of the metrics log the workers append their
+            records to, or None to not record metrics
+
+    Returns:
+        float: Examples trained on per second, across all workers.
+    """
+    ports = free_ports(args.workers + 1)
+    cluster = tf.train.ClusterSpec({
+        "ps": ["localhost:%d" % ports[0]],
+        "worker": ["localhost:%d" % p for p in ports[1:]],
+    })
+
+    stop = multiprocessing.Event()
+    examples = multiprocessing.Value("q", 0)
+
+    ps = multiprocessing.Process(target=run_ps, args=(cluster,))
+    ps.daemon = True
+    ps.start()
+
+    workers = []
+
+    for task in range(args.workers):
+        worker = multiprocessing.Process(
+            target=train_worker,
+            args=(args, encoded, vocab_size, cluster, task, stop, examples,
+                  save, metrics_path),
+        )
+        worker.start()
+        workers.append(worker)
+
+    logger.warn("Started %d workers, stop with Ctrl-C" % args.workers)
+
+    start = None
+    start_examples = 0
+    last_log = time.time()
+    last_examples = 0
+
+    try:
+        while any(w.is_alive() for w in workers):
+            time.sleep(1.0)
+
+            now = time.time()
+            count = examples.value
+
+            if start is None and count > 0:
+                start = now
+                start_examples = count
+
+            if now - last_log >= 60.0:
+                logger.info("%.1f examples/s" % (
+                    (count - last_examples) / (now - last_log)))
+                last_log = now
+                last_examples = count
+
+            if duration is not None and start is not None and \
+                    now - start >= duration:
+                break
+    except KeyboardInterrupt:
+        logger.warn("Stopping training")
+
+    end = time.time()
+    end_examples = examples.value
+
+    stop.set()
+
+    for worker in workers:
+        worker.join()
+
+    ps.terminate()
+
+    if start is None or end <= start:
+        return 0.0
+
+    return (end_examples - start_examples) / (end - start)
@@ -0,0 +1,42 @@
+"""Sampling from the decoder's output distribution.
+"""
+import numpy as np
+
+
+def sample_categorical(probs, temperature=1.0, top_k=None, rng=np.random):
+    """Pick one index per row of a batch of probability vectors.
+
+    Args:
+        probs: A [batch size, vocab size] array of probabilities
+        temperature (float): Values below 1.0 make the distribution sharper,
+            values above 1.0 flatter
+        top_k (int): Only sample from the `top_k` most likely indices of each
+            row, or None to sample from all of them
+        rng: The random number generator to use
+
+    Returns:
+        An int32 [batch size] array of sampled indices.
+    """
+    original = probs
+    probs = np.asarray(probs, np.float64)
+
+    if temperature != 1.0:
+        probs = np.power(probs, 1.0 / temperature)
+
+    if top_k is not None and top_k < probs.shape[1]:
+        # Zero out everything below each row's k-th largest probability
+        kth = np.partition(probs, -top_k, axis=1)[:, -top_k, np.newaxis]
+        probs = np.where(probs < kth, 0.0, probs)
+
+    # Inverse CDF: count how many cumulative sums are below a uniform draw.
+    # Rows don't need to be normalized since the draw is scaled per row.
+    cdf = np.cumsum(probs, axis=1)
+    val = rng.rand(probs.shape[0], 1) * cdf[:, -1:]
+
+    ids = np.minimum(np.sum(cdf <= val, axis=1), probs.shape[1] - 1)
+
+    # Rows with nothing left to sample fall back to their most likely index
+    empty = cdf[:, -1] <= 0.0
+    ids[empty] = np.argmax(np.asarray(original, np.float64)[empty], axis=1)
+
+    return ids.astype(np.int32)
@@ -1,17 +1,241 @@
+import gzip
+import hashlib
 import html
 import json
+import logging
+import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from colorbot import constants
 from colorbot.data import Color, hex_to_rgb
 
+logger = logging.getLogger(__name__)
 
-def valspar():
+
+class NotCached(Exception):
+    """Raised when fetching a URL that isn't cached in offline mode.
+
+    Attributes:
+        sources (list): Names of the sources without a cached copy, when
+            raised by `scrape_all`
+    """
+
+    def __init__(self, message, sources=None):
+        super(NotCached, self).__init__(message)
+        self.sources = sources or []
+
+
+class ResponseCache(object):
+    """On-disk cache of response bodies, keyed by URL.
+
+    Each URL is stored as a gzipped body and a small JSON file with the
+    validators (ETag and Last-Modified) to revalidate it with.
+    """
+
+    def __init__(self, path):
+        """Open the cache, creating its directory if needed.
+
+        Args:
+            path (str): The cache directory
+        """
+        self.path = path
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.path, key)
+        return base + ".gz", base + ".json"
+
+    def get(self, url):
+        """Look up a URL.
+
+        Args:
+            url (str): The URL
+
+        Returns:
+            A tuple of the body bytes and the dict of validators, or None if
+            the URL isn't cached.
+        """
+        body_path, meta_path = self._paths(url)
+
+        try:
+            with open(meta_path) as f:
+                meta = json.loads(f.read())
+
+            with gzip.open(body_path, "rb") as f:
+                body = f.read()
+        except (IOError, ValueError):
+            return None
+
+        return body, meta
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Store a response.
+
+        Args:
+            url (str): The URL
+            body (bytes): The response body
+            etag (str): The response's ETag header
+            last_modified (str): The response's Last-Modified header
+        """
+        body_path, meta_path = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched": time.time(),
+        }
+
+        # Write the body first, metadata without a body is treated as a miss
+        # anyway, and replace the old files in one step each
+        with gzip.open(body_path + ".tmp", "wb") as f:
+            f.write(body)
+
+        os.replace(body_path + ".tmp", body_path)
+
+        with open(meta_path + ".tmp", "w") as f:
+            f.write(json.dumps(meta))
+
+        os.replace(meta_path + ".tmp", meta_path)
+
+
+def retryable(error):
+    """Check if a failed request is worth retrying.
+
+    Connection errors, timeouts and server errors may go away on their own,
+    other errors, like a 404, won't.
+
+    Args:
+        error: The requests.RequestException
+
+    Returns:
+        bool: True if the request should be retried.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    return isinstance(error, requests.HTTPError) and \
+        error.response is not None and error.response.status_code >= 500
+
+
+class Fetcher(object):
+    """Fetch URLs through a shared, pooled HTTP session.
+
+    Requests that fail with a connection error, a timeout or a server error
+    are retried with exponential backoff. With a cache, cached responses are
+    revalidated with the server and only downloaded again if they changed.
+    Safe to use from several threads.
+
+    Attributes:
+        timeout (float): Seconds to wait for the server before giving up on
+            an attempt
+        retries (int): Number of retries after the first attempt fails
+        backoff (float): Seconds to wait before the first retry, doubled for
+            each following one
+        cache: A ResponseCache, or None
+        offline (bool): Only use the cache, never the network
+        stats: Dict of URL to a dict of "attempts", "bytes", "seconds" and
+            whether the body came from the cache ("cached")
+    """
+
+    def __init__(self, timeout=30.0, retries=3, backoff=1.0, pool_size=10,
+                 cache=None, offline=False):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.offline = offline
+        self.stats = {}
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Fetch a URL.
+
+        Args:
+            url (str): The URL
+
+        Returns:
+            bytes: The response body.
+        """
+        start = time.time()
+        cached = self.cache.get(url) if self.cache is not None else None
+
+        if self.offline:
+            if cached is None:
+                raise NotCached("%s is not cached" % url)
+
+            self._record(url, 0, cached[0], start, True)
+            return cached[0]
+
+        headers = {}
+
+        if cached is not None:
+            if cached[1]["etag"] is not None:
+                headers["If-None-Match"] = cached[1]["etag"]
+            if cached[1]["last_modified"] is not None:
+                headers["If-Modified-Since"] = cached[1]["last_modified"]
+
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            try:
+                response = self.session.get(url, headers=headers,
+                                            timeout=self.timeout)
+                response.raise_for_status()
+                break
+            except requests.RequestException as e:
+                if attempt > self.retries or not retryable(e):
+                    raise
+
+                wait = self.backoff * 2 ** (attempt - 1)
+                logger.warn("Error fetching %s (%s), retrying in %.1f s" % (
+                    url, e, wait))
+                time.sleep(wait)
+
+        if response.status_code == 304:
+            self._record(url, attempt, cached[0], start, True)
+            return cached[0]
+
+        if self.cache is not None:
+            self.cache.put(url, response.content,
+                           response.headers.get("ETag"),
+                           response.headers.get("Last-Modified"))
+
+        self._record(url, attempt, response.content, start, False)
+        return response.content
+
+    def _record(self, url, attempts, body, start, cached):
+        with self._lock:
+            self.stats[url] = {
+                "attempts": attempts,
+                "bytes": len(body),
+                "seconds": time.time() - start,
+                "cached": cached,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def valspar(fetcher):
     url = "http://www.valsparpaint.com/vservice/json/colors/color-wall?localeId=1001&channelId=1001"
 
-    result = requests.get(url)
-    data = result.json()
+    data = json.loads(fetcher.get(url).decode("utf-8"))
 
     seen_ids = set()
 
@@ -39,10 +263,9 @@ def valspar():
                 yield c
 
 
-def sherwin_williams():
+def sherwin_williams(fetcher):
     url = "http://www.sherwin-williams.com/homeowners/color/find-and-explore-colors/paint-colors-by-family/json/full/"
-    result = requests.get(url)
-    data = result.json()
+    data = json.loads(fetcher.get(url).decode("utf-8"))
 
     for family_name, family in data.items():
         for color in family["items"]:
@@ -64,11 +287,10 @@ def sherwin_williams():
             yield c
 
 
-def behr():
+def behr(fetcher):
     url = "http://www.behr.com/mainService/services/colornx/all.js"
 
-    response = requests.get(url)
-    data_str = response.content.decode("utf-8")[15:-1]
+    data_str = fetcher.get(url).decode("utf-8")[15:-1]
 
     data = json.loads(data_str)
 
@@ -92,11 +314,10 @@ def behr():
             yield Color(name_fmt, *rgb)
 
 
-def benjamin_moore():
+def benjamin_moore(fetcher):
     url = "http://67.222.214.23/bmServices/ColorExplorer/colorexplorer.svc/Colors_GetByFilter?locale=en_US&collectionCode=&familyCode=&trendCode="
 
-    response = requests.get(url)
-    data = response.json()
+    data = json.loads(fetcher.get(url).decode("utf-8"))
 
     for color in data:
         name = color["colorName"].lower()
@@ -113,12 +334,10 @@ def benjamin_moore():
         yield Color(name_fmt, r, g, b)
 
 
-def dulux():
+def dulux(fetcher):
     url = "https://www.dulux.co.uk/en/api/products/colors"
 
-    result = requests.get(url)
-
-    data = result.json()
+    data = json.loads(fetcher.get(url).decode("utf-8"))
 
     for color in data["colors"]:
         name = color["name"].lower()
@@ -135,12 +354,10 @@ def dulux():
         yield Color(name_fmt, r, g, b)
 
 
-def ppg():
+def ppg(fetcher):
     url = "https://pittsburghpaintsandstains.com/color/paint-colors"
 
-    result = requests.get(url)
-
-    page = result.content.decode("utf-8")
+    page = fetcher.get(url).decode("utf-8")
 
     pattern = """<a href=".*?" style="background-color:rgb\\(([0-9]+), ([0-9]+), ([0-9]+)\\);" .*? title="(.*?) &ndash; .*?>"""
 
@@ -167,11 +384,10 @@ def ppg():
             yield Color(name_fmt, r, g, b)
 
 
-def colorhexa():
+def colorhexa(fetcher):
     url = "http://www.colorhexa.com/color-names"
 
-    result = requests.get(url)
-    page = result.content.decode("utf-8")
+    page = fetcher.get(url).decode("utf-8")
 
     # parsing HTML with regex, grumble grumble
     pattern = """<a class="t." href="/([a-z0-9]{6})">(.*?)</a></td>"""
@@ -202,3 +418,50 @@ color_sources = [
     ppg,
     colorhexa,
 ]
+
+
+def scrape_all(sources, fetcher, threads=None):
+    """Scrape several sources concurrently.
+
+    Args:
+        sources: List of source functions, like `color_sources`
+        fetcher: The Fetcher to fetch with
+        threads (int): Number of sources scraped at once, defaults to all
+
+    Returns:
+        A list with a (colors, stats) tuple for each source, in the order of
+        `sources`. The stats are a dict with the "colors" count and the
+        "seconds" the source took.
+
+    Raises:
+        NotCached: If the fetcher is offline and some sources aren't cached,
+            once every source has been tried
+    """
+    def scrape(source):
+        start = time.time()
+        colors = list(source(fetcher))
+        seconds = time.time() - start
+
+        logger.info("Got %d colors from \"%s\" in %.1f s" % (
+            len(colors), source.__name__, seconds))
+
+        return colors, {"colors": len(colors), "seconds": seconds}
+
+    with ThreadPoolExecutor(threads or len(sources)) as executor:
+        futures = [executor.submit(scrape, source) for source in sources]
+
+        # Collected in source order, so the result doesn't depend on which
+        # source finishes first
+        results = []
+        missing = []
+
+        for source, future in zip(sources, futures):
+            try:
+                results.append(future.result())
+            except NotCached:
+                missing.append(source.__name__)
+
+    if missing:
+        raise NotCached("No cached copy of %s" % ", ".join(missing), missing)
+
+    return results
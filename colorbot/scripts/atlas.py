@@ -0,0 +1,138 @@
+import argparse
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+from colorbot import atlas, binfile, constants
+from colorbot.dataset import load_dataset
+from colorbot.inference import load_model
+from colorbot.trie import NameTrie
+
+logger = logging.getLogger(__name__)
+
+_model = None
+
+
+def _init_worker(vocab, hidden_size, param_path, name_set, trie):
+    global _model
+    _model = load_model(vocab, hidden_size, param_path, name_set, trie=trie)
+
+
+def _model_max_length():
+    return _model.max_length
+
+
+def _name_cells(job):
+    start, rgbs, names_per_cell = job
+    return start, _model.name_pools(rgbs.tolist(), names_per_cell)
+
+
+def build_atlas():
+    args = argparse.ArgumentParser("Precompute names for a grid of colors.")
+    args.add_argument("-n", "--hidden-size", type=int, default=150,
+                      help="hidden layer size")
+    args.add_argument("-w", "--weights", type=str, default=None,
+                      help="exported .npz weights to use instead of the "
+                           "TensorFlow checkpoint")
+    args.add_argument("--trie", action="store_true",
+                      help="avoid existing names while sampling instead of "
+                           "rejecting them afterwards, disables the in-graph "
+                           "sampler")
+    args.add_argument("-g", "--grid-size", type=int, default=32,
+                      help="number of cells along each RGB axis")
+    args.add_argument("-k", "--names-per-cell", type=int, default=8,
+                      help="number of names to store per cell")
+    args.add_argument("-j", "--processes", type=int,
+                      default=multiprocessing.cpu_count(),
+                      help="number of worker processes")
+    args.add_argument("-o", "--output", type=str, default=None,
+                      help="output file (default: data_dir/atlas.bin)")
+    args.add_argument("data_dir", type=str, help="data directory")
+
+    args = args.parse_args()
+
+    param_path = args.weights or "%s/params" % args.data_dir
+    output_path = args.output or "%s/atlas.bin" % args.data_dir
+
+    colors = load_dataset(args.data_dir)
+    vocab = colors.vocab
+    name_set = set(colors.names())
+
+    trie = NameTrie(name_set, vocab) if args.trie else None
+
+    pool = multiprocessing.Pool(
+        args.processes, _init_worker,
+        (vocab, args.hidden_size, param_path, name_set, trie))
+
+    # Names are stored without their start and end symbols
+    symbols = len(constants.START_SYMBOL) + len(constants.END_SYMBOL)
+    max_length = pool.apply(_model_max_length) - symbols
+
+    vocab_size = len(vocab) // 2
+    cells = args.grid_size ** 3
+    k = args.names_per_cell
+    dtype = "uint8" if vocab_size <= 256 else "uint16"
+
+    lengths_size = cells * k
+    lengths_size += -lengths_size % 8
+
+    header = {
+        "version": atlas.VERSION,
+        "grid_size": args.grid_size,
+        "names_per_cell": k,
+        "max_length": max_length,
+        "dtype": dtype,
+        "chars": [vocab[i] for i in range(vocab_size)],
+        "checkpoint": atlas.checkpoint_digest(param_path),
+        "lengths_offset": 0,
+        "ids_offset": lengths_size,
+    }
+
+    ids_size = cells * k * max_length * np.dtype(dtype).itemsize
+
+    # Build the atlas next to the old one and only replace it once it's
+    # complete, so an interrupted build never leaves a truncated atlas behind
+    tmp_path = output_path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        data_start = binfile.write_header(f, header, atlas.MAGIC)
+        f.truncate(data_start + lengths_size + ids_size)
+
+    lengths = np.memmap(tmp_path, np.uint8, "r+", data_start, (cells, k))
+    ids = np.memmap(tmp_path, np.dtype(dtype), "r+",
+                    data_start + lengths_size, (cells, k, max_length))
+
+    centers = atlas.cell_centers(args.grid_size)
+    chunk_size = 64
+    jobs = [(i, centers[i:i + chunk_size], k)
+            for i in range(0, cells, chunk_size)]
+
+    logger.info("Naming %d cells with %d processes" %
+                (cells, args.processes))
+
+    done = 0
+
+    for start, pools in pool.imap_unordered(_name_cells, jobs):
+        for i, names in enumerate(pools):
+            for j, name in enumerate(names):
+                lengths[start + i, j] = len(name)
+                ids[start + i, j, :len(name)] = [vocab[c] for c in name]
+
+        done += len(pools)
+
+        if done % (chunk_size * 64) == 0 or done == cells:
+            logger.info("Named %d/%d cells" % (done, cells))
+
+    pool.close()
+    pool.join()
+
+    lengths.flush()
+    ids.flush()
+    del lengths, ids
+
+    os.replace(tmp_path, output_path)
+
+    logger.info("Saved atlas to %s" % output_path)
+
+    exit(0)
@@ -1,34 +1,105 @@
 import argparse
-import json
 
 import tweepy
-from colorbot.data import load_vocab
+from colorbot.atlas import load_atlas
+from colorbot.dataset import load_dataset
+from colorbot.index import ColorIndex
+from colorbot.trie import NameTrie
 from colorbot.twitter.auth import get_auth
 from colorbot.twitter.bot import run
+from colorbot.twitter.ratelimit import TWEETS_PER_HOUR
 
 
 def bot():
     args = argparse.ArgumentParser(description="Run the bot")
     args.add_argument("-n", "--hidden-size", type=int, default=150,
                       help="number of hidden units")
+    args.add_argument("-w", "--weights", type=str, default=None,
+                      help="exported .npz weights to use instead of the "
+                           "TensorFlow checkpoint")
+    args.add_argument("--trie", action="store_true",
+                      help="avoid existing names while sampling instead of "
+                           "rejecting them afterwards, disables the in-graph "
+                           "sampler")
+    args.add_argument("-a", "--atlas", type=str, default=None,
+                      help="atlas of precomputed names to use")
+    args.add_argument("--no-fallback", action="store_true",
+                      help="don't run the model for colors missing in the "
+                           "atlas")
+    args.add_argument("-b", "--batch-size", type=int, default=16,
+                      help="maximum number of replies computed together")
+    args.add_argument("--batch-wait", type=float, default=5.0,
+                      help="milliseconds to wait for a batch to fill up")
+    args.add_argument("-q", "--queue-size", type=int, default=1000,
+                      help="maximum number of pending replies")
+    args.add_argument("--drop-policy", choices=("oldest", "newest"),
+                      default="oldest",
+                      help="which reply to drop when the queue is full")
+    args.add_argument("-j", "--workers", type=int, default=2,
+                      help="number of model worker threads")
+    args.add_argument("--render-threads", type=int, default=1,
+                      help="number of PNG rendering threads")
+    args.add_argument("--post-threads", type=int, default=2,
+                      help="number of reply posting threads")
+    args.add_argument("--cache-size", type=int, default=10000,
+                      help="maximum number of cached results")
+    args.add_argument("--cache-ttl", type=float, default=None,
+                      help="seconds results stay cached (default: forever)")
+    args.add_argument("--name-pool", type=int, default=5,
+                      help="number of names cached per color")
+    args.add_argument("--cache-file", type=str, default=None,
+                      help="file to keep the cache in across restarts")
+    args.add_argument("--nearest", type=int, default=0,
+                      help="number of closest real color names to mention "
+                           "when naming a color")
+    args.add_argument("--tweets-per-hour", type=float,
+                      default=TWEETS_PER_HOUR,
+                      help="sustained reply rate")
+    args.add_argument("--burst", type=int, default=10,
+                      help="maximum number of replies sent back to back")
     args.add_argument("credential_file", type=str,
                       help="path to file containing credentials")
     args.add_argument("data_dir", type=str, help="path to data directory")
 
     args = args.parse_args()
 
-    with open("%s/vocab.json" % args.data_dir) as f:
-        vocab = load_vocab(f)
+    colors = load_dataset(args.data_dir)
+    vocab = colors.vocab
+    color_list = colors.colors()
+    name_set = {c.name for c in color_list}
 
-    with open("%s/colors.json" % args.data_dir) as f:
-        color_list = json.loads(f.read())
+    index = ColorIndex(color_list)
 
-        name_set = {c[0] for c in color_list}
+    trie = NameTrie(name_set, vocab) if args.trie else None
+
+    param_path = args.weights or "%s/params" % args.data_dir
+
+    if args.atlas is not None:
+        atlas = load_atlas(args.atlas, param_path)
+    else:
+        atlas = None
 
     with open(args.credential_file) as f:
         auth = get_auth(f)
 
     api = tweepy.API(auth_handler=auth)
 
-    run(auth, name_set, api, vocab, args.hidden_size,
-        "%s/params" % args.data_dir)
+    run(auth, name_set, api, vocab, args.hidden_size, param_path,
+        max_batch_size=args.batch_size,
+        batch_wait=args.batch_wait / 1000,
+        queue_size=args.queue_size,
+        drop_policy=args.drop_policy,
+        workers=args.workers,
+        tweets_per_hour=args.tweets_per_hour,
+        burst=args.burst,
+        render_threads=args.render_threads,
+        post_threads=args.post_threads,
+        cache_size=args.cache_size,
+        cache_ttl=args.cache_ttl,
+        name_pool_size=args.name_pool,
+        cache_file=args.cache_file,
+        index=index,
+        nearest=args.nearest,
+        atlas=atlas,
+        atlas_fallback=not args.no_fallback,
+        trie=trie)
@@ -0,0 +1,102 @@
+import argparse
+import logging
+
+import numpy as np
+import tensorflow as tf
+from colorbot import atlas, dataset, encoder, decoder
+
+logger = logging.getLogger(__name__)
+
+
+def gru_variables(scope):
+    """Find the GRU cell variables created under a scope.
+
+    Args:
+        scope (str): The scope given to `dynamic_rnn`
+
+    Returns:
+        A dict mapping "gates_w", "gates_b", "candidate_w" and "candidate_b"
+        to variables.
+    """
+    variables = {}
+
+    for var in tf.trainable_variables():
+        if not var.name.startswith(scope + "/"):
+            continue
+
+        part = "gates" if "/Gates/" in var.name else "candidate"
+        kind = "w" if len(var.get_shape()) == 2 else "b"
+
+        variables["%s_%s" % (part, kind)] = var
+
+    return variables
+
+
+def model_weights(session, encoder_model, decoder_model):
+    """Get the weights of both models as NumPy arrays.
+
+    Args:
+        session: The session the parameters are loaded into
+        encoder_model: The Encoder
+        decoder_model: The Decoder
+
+    Returns:
+        A dict of weight arrays, as `NumpyModel` expects them.
+    """
+    variables = {
+        "encoder_embed": encoder_model.embed_params,
+        "encoder_output_w": encoder_model.output_w,
+        "encoder_output_b": encoder_model.output_b,
+        "decoder_embed": decoder_model.embed_params,
+        "decoder_state_w": decoder_model.state_w,
+        "decoder_state_b": decoder_model.state_b,
+        "decoder_output_w": decoder_model.output_w,
+        "decoder_output_b": decoder_model.output_b,
+    }
+
+    for scope in ("Encoder", "Decoder"):
+        for k, var in gru_variables(scope).items():
+            variables["%s_%s" % (scope.lower(), k)] = var
+
+    keys = sorted(variables.keys())
+    values = session.run([variables[k] for k in keys])
+
+    return dict(zip(keys, values))
+
+
+def export():
+    args = argparse.ArgumentParser("Export model weights for NumPy serving.")
+    args.add_argument("-n", "--hidden-size", type=int, default=150,
+                      help="hidden layer size")
+    args.add_argument("-o", "--output", type=str, default=None,
+                      help="output file (default: data_dir/params.npz)")
+    args.add_argument("data_dir", type=str, help="data directory")
+
+    args = args.parse_args()
+
+    output_path = args.output or "%s/params.npz" % args.data_dir
+
+    # The vocab the model was trained with
+    vocab = dataset.load_dataset(args.data_dir).vocab
+
+    logger.info("Loading model")
+    session = tf.Session()
+
+    encoder_model = encoder.Encoder(args.hidden_size, len(vocab) // 2)
+    decoder_model = decoder.Decoder(args.hidden_size, len(vocab) // 2)
+
+    saver = tf.train.Saver()
+    session.run(tf.initialize_all_variables())
+    saver.restore(session, "%s/params" % args.data_dir)
+
+    weights = model_weights(session, encoder_model, decoder_model)
+
+    # Lets an atlas built from the checkpoint be served with these weights
+    weights["checkpoint"] = np.array(
+        atlas.checkpoint_digest("%s/params" % args.data_dir))
+
+    logger.info("Saving weights to %s" % output_path)
+    with open(output_path, "wb") as f:
+        np.savez(f, **weights)
+
+    exit(0)
@@ -1,8 +1,9 @@
 import argparse
-import json
 
 import tweepy
-from colorbot.data import load_vocab
+from colorbot.atlas import load_atlas
+from colorbot.dataset import load_dataset
+from colorbot.trie import NameTrie
 from colorbot.twitter.auth import get_auth
 from colorbot.twitter.post import post_color
 
@@ -11,26 +12,43 @@ def post():
     args = argparse.ArgumentParser(description="Post a color")
     args.add_argument("-n", "--hidden-size", type=int, default=150,
                       help="number of hidden units")
+    args.add_argument("-w", "--weights", type=str, default=None,
+                      help="exported .npz weights to use instead of the "
+                           "TensorFlow checkpoint")
+    args.add_argument("--trie", action="store_true",
+                      help="avoid existing names while sampling instead of "
+                           "rejecting them afterwards, disables the in-graph "
+                           "sampler")
+    args.add_argument("-a", "--atlas", type=str, default=None,
+                      help="atlas of precomputed names to use")
+    args.add_argument("--no-fallback", action="store_true",
+                      help="don't run the model for colors missing in the "
+                           "atlas")
     args.add_argument("credential_file", type=str,
                       help="path to file containing credentials")
     args.add_argument("data_dir", type=str, help="path to data directory")
 
     args = args.parse_args()
 
-    with open("%s/vocab.json" % args.data_dir) as f:
-        vocab = load_vocab(f)
+    colors = load_dataset(args.data_dir)
+    vocab = colors.vocab
+    name_set = set(colors.names())
 
-    with open("%s/colors.json" % args.data_dir) as f:
-        color_list = json.loads(f.read())
+    trie = NameTrie(name_set, vocab) if args.trie else None
 
-        name_set = {c[0] for c in color_list}
+    param_path = args.weights or "%s/params" % args.data_dir
+
+    if args.atlas is not None:
+        atlas = load_atlas(args.atlas, param_path)
+    else:
+        atlas = None
 
     with open(args.credential_file) as f:
         auth = get_auth(f)
 
     api = tweepy.API(auth_handler=auth)
 
-    post_color(name_set, api, vocab, args.hidden_size,
-               "%s/params" % args.data_dir)
+    post_color(name_set, api, vocab, args.hidden_size, param_path, atlas,
+               not args.no_fallback, trie)
 
     exit(0)
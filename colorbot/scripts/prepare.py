@@ -1,52 +1,133 @@
 import argparse
-import json
 import logging
 import os
 
-from colorbot import data, scrape
+from colorbot import data, dataset, merge, scrape
 
 logger = logging.getLogger(__name__)
 
 
 def prepare_data():
     args = argparse.ArgumentParser("Prepare the training dataset")
+    args.add_argument("-j", "--threads", type=int, default=None,
+                      help="number of sources scraped at once (default: all)")
+    args.add_argument("-t", "--timeout", type=float, default=30.0,
+                      help="seconds to wait for a source's server")
+    args.add_argument("-r", "--retries", type=int, default=3,
+                      help="number of times to retry a failed request")
+    args.add_argument("-c", "--cache-dir", type=str, default=None,
+                      help="directory to cache responses in (default: "
+                           "data_dir/cache)")
+    args.add_argument("--no-cache", action="store_true",
+                      help="don't cache responses")
+    args.add_argument("--offline", action="store_true",
+                      help="only use cached responses")
+    args.add_argument("-i", "--incremental", action="store_true",
+                      help="merge new and changed colors into the existing "
+                           "dataset instead of rebuilding it")
+    args.add_argument("-d", "--duplicates", choices=merge.POLICIES,
+                      default=merge.FIRST,
+                      help="how to handle a name found in several sources: "
+                           "keep the first (default) or last source's color, "
+                           "average them, or keep them all")
     args.add_argument("data_dir", type=str, help="data directory")
 
-    args = args.parse_args()
+    parser = args
+    args = parser.parse_args()
+
+    if args.offline and args.no_cache:
+        parser.error("--offline needs the cache")
 
     if not os.path.exists(args.data_dir):
         logger.debug("Creating data dir: %s" % args.data_dir)
         os.mkdir(args.data_dir)
 
-    colors = []
-
-    for source in scrape.color_sources:
-        logger.info("Getting colors from source \"%s\"", source.__name__)
-
-        count = 0
-
-        for color in source():
-            colors.append(color)
-            count += 1
-
-        logger.info("Got %d colors" % count)
-
-    def sorter(x):
-        mag = (x.r + 1) ** 2 * (x.g + 1) ** 2 * (x.b + 1) ** 2
-        return mag, x.r, x.g, x.b
-
-    colors.sort(key=sorter)
-
-    vocab = data.build_vocab(colors)
+    if args.no_cache:
+        cache = None
+    else:
+        cache = scrape.ResponseCache(args.cache_dir or
+                                     "%s/cache" % args.data_dir)
+
+    fetcher = scrape.Fetcher(args.timeout, args.retries, cache=cache,
+                             offline=args.offline)
+
+    try:
+        results = scrape.scrape_all(scrape.color_sources, fetcher,
+                                    args.threads)
+    except scrape.NotCached as e:
+        parser.error("no cached copy of %s, run without --offline first" %
+                     ", ".join(e.sources))
+    finally:
+        fetcher.close()
+
+    for url, stats in sorted(fetcher.stats.items()):
+        logger.debug("%s: %d attempts, %d bytes, %.1f s%s" % (
+            url, stats["attempts"], stats["bytes"], stats["seconds"],
+            " (cached)" if stats["cached"] else ""))
+
+    sources = [source.__name__ for source in scrape.color_sources]
+    index = merge.SourceIndex(args.duplicates, sources)
+    index_path = "%s/index.json" % args.data_dir
+
+    encoded = data.encode_colors([], {})
+    vocab = {}
+
+    if args.incremental:
+        if not os.path.exists(index_path):
+            logger.warn("No index in %s, rebuilding the dataset" %
+                        args.data_dir)
+        else:
+            with open(index_path) as f:
+                loaded = index.load(f)
+
+            if not loaded:
+                logger.warn("Index was built with another duplicate policy, "
+                            "rebuilding the dataset")
+                index = merge.SourceIndex(args.duplicates, sources)
+            else:
+                existing = dataset.load_dataset(args.data_dir)
+
+                if len(existing) != index.count:
+                    parser.error("index.json doesn't match the dataset, "
+                                 "rebuild it without -i")
+
+                encoded = existing.encoded
+                vocab = existing.vocab
+
+    changed = []
+
+    for source, (source_colors, _) in zip(sources, results):
+        changed.extend(index.update(source, source_colors))
+
+    encoded, vocab, updated, added, removed = merge.merge(
+        index, changed, encoded, vocab)
+
+    logger.info("%d names changed, updated %d colors, added %d, removed "
+                "%d" % (len(set(changed)), updated, added, removed))
+
+    if index.count > 0 and updated == 0 and added == 0 and removed == 0 and \
+            os.path.exists("%s/colors.bin" % args.data_dir):
+        with open(index_path, "w") as f:
+            index.save(f)
+
+        logger.info("Dataset is up to date")
+        exit(0)
 
     logger.info("Saving vocab to: %s/vocab.json" % args.data_dir)
     with open("%s/vocab.json" % args.data_dir, "w") as f:
         data.save_vocab(vocab, f)
 
-    logger.info("Saving colors to %s/colors.json" % args.data_dir)
-    with open("%s/colors.json" % args.data_dir, "w") as f:
-        f.write(json.dumps(colors))
+    # The old file may still be mapped, so replace it rather than overwrite
+    logger.info("Saving colors to %s/colors.bin" % args.data_dir)
+    with open("%s/colors.bin.tmp" % args.data_dir, "wb") as f:
+        dataset.write_encoded(f, encoded, vocab)
+
+    os.replace("%s/colors.bin.tmp" % args.data_dir,
+               "%s/colors.bin" % args.data_dir)
+
+    with open(index_path, "w") as f:
+        index.save(f)
 
-    logger.info("Saved %d colors" % len(colors))
+    logger.info("Saved %d colors" % len(encoded.lengths))
 
     exit(0)
@@ -1,10 +1,11 @@
 import argparse
-import json
 import logging
 import random
 
-import tensorflow as tf
-from colorbot import data, encoder, decoder, constants
+from colorbot import data, constants
+from colorbot.dataset import load_dataset
+from colorbot.inference import load_model
+from colorbot.trie import NameTrie
 
 logger = logging.getLogger(__name__)
 
@@ -56,92 +57,56 @@ def sample():
                       help="hidden layer size")
     args.add_argument("-b", "--batch-size", type=int, default=50,
                       help="batch size")
+    args.add_argument("-w", "--weights", type=str, default=None,
+                      help="exported .npz weights to use instead of the "
+                           "TensorFlow checkpoint")
+    args.add_argument("--trie", action="store_true",
+                      help="avoid existing names while sampling instead of "
+                           "rejecting them afterwards, disables the in-graph "
+                           "sampler")
+    args.add_argument("-t", "--temperature", type=float, default=1.0,
+                      help="sampling temperature")
+    args.add_argument("-k", "--top-k", type=int, default=None,
+                      help="only sample from the k most likely characters")
     args.add_argument("data_dir", type=str, help="data directory")
 
     args = args.parse_args()
 
-    with open("%s/vocab.json" % args.data_dir) as f:
-        vocab = data.load_vocab(f)
+    known = load_dataset(args.data_dir)
+    vocab = known.vocab
+    name_set = set(known.names())
 
-    with open("%s/colors.json" % args.data_dir) as f:
-        colors_list = json.loads(f.read())
+    trie = NameTrie(name_set, vocab) if args.trie else None
 
-        name_set = {c[0] for c in colors_list}
+    model = load_model(vocab, args.hidden_size,
+                       args.weights or "%s/params" % args.data_dir, name_set,
+                       temperature=args.temperature, top_k=args.top_k,
+                       trie=trie)
 
-    session = tf.Session()
+    colors = []
 
-    encoder_model = encoder.Encoder(args.hidden_size, len(vocab) // 2)
-    decoder_model = decoder.Decoder(args.hidden_size, len(vocab) // 2)
+    while len(colors) < 30:
+        color = (
+            2 * random.random() - 1.0,
+            2 * random.random() - 1.0,
+            2 * random.random() - 1.0,
+        )
 
-    saver = tf.train.Saver()
-    session.run(tf.initialize_all_variables())
-    saver.restore(session, "%s/params" % args.data_dir)
+        # Name color
+        name = None
 
-    colors = []
+        while name is None:
+            name = model.name(color)
 
-    color = (
-        2 * random.random() - 1.0,
-        2 * random.random() - 1.0,
-        2 * random.random() - 1.0,
-    )
+        # Guess the color back from the name
+        output = model.guess(constants.START_SYMBOL + name +
+                             constants.END_SYMBOL)
 
-    while len(colors) < 30:
+        hex = data.rgb_to_hex(*output)
 
-        # Name color
-        name = [vocab[constants.START_SYMBOL]]
-        state = None
-
-        while len(name) < 50 and vocab[name[-1]] != constants.END_SYMBOL:
-            if state is None:
-                output, state = session.run(
-                    [decoder_model.output, decoder_model.final_state],
-                    feed_dict={
-                        decoder_model.state: [color],
-                        decoder_model.input: [[name[-1]]],
-                        decoder_model.length: [1],
-                        decoder_model.mask: [[1.0]],
-                    },
-                )
-            else:
-                output, state = session.run(
-                    [decoder_model.output, decoder_model.final_state],
-                    feed_dict={
-                        decoder_model.initial_state: state,
-                        decoder_model.input: [[name[-1]]],
-                        decoder_model.length: [1],
-                        decoder_model.mask: [[1.0]],
-                    },
-                )
-
-            val = random.random()
-
-            for i in range(output[0].shape[0]):
-                if val < output[0][i]:
-                    name.append(i)
-                    break
-                else:
-                    val -= output[0][i]
-
-        str_name = "".join(vocab[i] for i in name)
-
-        if str_name[-1] == constants.END_SYMBOL and str_name not in name_set:
-            output = session.run(
-                encoder_model.output,
-                feed_dict={
-                    encoder_model.input: [name],
-                    encoder_model.length: [len(name)],
-                },
-            )
-
-            hex = data.rgb_to_hex(*output[0].tolist())
-
-            colors.append((data.rgb_to_hex(*color), str_name[1:-1], hex))
-
-            color = (
-                2 * random.random() - 1.0,
-                2 * random.random() - 1.0,
-                2 * random.random() - 1.0,
-            )
+        colors.append((data.rgb_to_hex(*color), name, hex))
+
+    model.close()
 
     content = ""
 
@@ -1,42 +1,268 @@
 import argparse
-import json
 import logging
-import random
+import time
+from collections import defaultdict
 
 import numpy as np
 import tensorflow as tf
-from colorbot import data, encoder, decoder
+from colorbot import (data, dataset, encoder, decoder, checkpoint,
+                      metrics, parallel)
 
 logger = logging.getLogger(__name__)
 
 
-def train():
+def train_step(session, encoder_model, decoder_model, batch, fused=True,
+               timings=None, traces=None):
+    """Run one training step of both models on a batch.
+
+    Args:
+        session: The TF session
+        encoder_model: The Encoder
+        decoder_model: The Decoder
+        batch: The Batch
+        fused (bool): Train both models in a single `session.run`, sharing
+            one feed, instead of one call per model. The models don't depend
+            on each other, so TF can run them in parallel.
+        timings: Optional defaultdict(float) to add the seconds spent
+            building the feed ("feed") and running the models to. Fused
+            steps add to "step", separate ones to "encoder" and "decoder".
+        traces: Optional list, if given the models are run with full tracing
+            and the RunMetadata of each `session.run` is appended to it
+
+    Returns:
+        A tuple of the [batch size] encoder loss array and the
+        [batch size * seq len] per-token decoder loss array.
+    """
+    run_kwargs = {}
+
+    if traces is not None:
+        run_kwargs["options"] = tf.RunOptions(
+            trace_level=tf.RunOptions.FULL_TRACE)
+
+    def run(fetches, feed):
+        if traces is not None:
+            run_kwargs["run_metadata"] = tf.RunMetadata()
+            traces.append(run_kwargs["run_metadata"])
+
+        return session.run(fetches, feed_dict=feed, **run_kwargs)
+
+    start = time.time()
+
+    if fused:
+        feed = encoder_model.feed(batch)
+        feed.update(decoder_model.feed(batch))
+        fed = time.time()
+
+        enc_loss, dec_loss, _, _ = run(
+            [encoder_model.loss, decoder_model.loss,
+             encoder_model.trainer, decoder_model.trainer],
+            feed,
+        )
+        done = time.time()
+
+        if timings is not None:
+            timings["feed"] += fed - start
+            timings["step"] += done - fed
+    else:
+        feed = encoder_model.feed(batch)
+        fed = time.time()
+
+        enc_loss, _ = run([encoder_model.loss, encoder_model.trainer], feed)
+        enc_done = time.time()
+
+        feed = decoder_model.feed(batch)
+        dec_fed = time.time()
+
+        dec_loss, _ = run([decoder_model.loss, decoder_model.trainer], feed)
+        done = time.time()
+
+        if timings is not None:
+            timings["feed"] += (fed - start) + (dec_fed - enc_done)
+            timings["encoder"] += enc_done - fed
+            timings["decoder"] += done - dec_fed
+
+    return enc_loss, dec_loss
+
+
+def write_trace(traces, path):
+    """Write Chrome trace timelines of traced session runs.
+
+    Args:
+        traces: List of RunMetadata
+        path (str): Path prefix, the i-th trace is written to
+            `path-<i>.json`, to be opened in chrome://tracing
+    """
+    from tensorflow.python.client import timeline
+
+    for i, run_metadata in enumerate(traces):
+        trace = timeline.Timeline(run_metadata.step_stats)
+
+        with open("%s-%d.json" % (path, i), "w") as f:
+            f.write(trace.generate_chrome_trace_format())
+
+
+def validate(session, encoder_model, decoder_model, encoded, batches):
+    """Compute the models' losses over held out colors.
+
+    Args:
+        session: The TF session
+        encoder_model: The Encoder
+        decoder_model: The Decoder
+        encoded: The EncodedColors
+        batches: List of arrays of indices into `encoded`
+
+    Returns:
+        A tuple of the mean encoder loss per color and the mean decoder loss
+        per character.
+    """
+    enc_loss_num = 0
+    enc_loss_denom = 0
+    dec_loss_num = 0
+    dec_loss_denom = 0
+
+    for indices in batches:
+        batch = data.gather_batch(encoded, indices)
+
+        feed = encoder_model.feed(batch)
+        feed.update(decoder_model.feed(batch))
+
+        enc_loss, dec_loss = session.run(
+            [encoder_model.loss, decoder_model.loss], feed_dict=feed)
+
+        enc_loss_num += np.sum(enc_loss)
+        enc_loss_denom += enc_loss.shape[0]
+        dec_loss_num += np.sum(dec_loss)
+        dec_loss_denom += np.sum(batch.decoder_mask)
+
+    return (float(enc_loss_num / enc_loss_denom),
+            float(dec_loss_num / dec_loss_denom))
+
+
+def parallel_conflicts(parser, args):
+    """Find the options given that data parallel training doesn't support.
+
+    Args:
+        parser: The ArgumentParser
+        args: The parsed command line arguments
+
+    Returns:
+        A list of the names of the options that were changed from their
+        defaults.
+    """
+    return ["--%s" % dest.replace("_", "-")
+            for dest in parallel.UNSUPPORTED_OPTIONS
+            if getattr(args, dest) != parser.get_default(dest)]
+
+
+def build_parser():
+    """Build the command line argument parser.
+    """
     args = argparse.ArgumentParser("Train the model.")
     args.add_argument("-n", "--hidden-size", type=int, default=150,
                       help="hidden layer size")
     args.add_argument("-b", "--batch-size", type=int, default=50,
                       help="batch size")
+    args.add_argument("-c", "--max-chars", type=int, default=None,
+                      help="batch names of similar length together, with at "
+                           "most this many characters per batch including "
+                           "padding (replaces --batch-size)")
+    args.add_argument("-p", "--prefetch", type=int, default=4,
+                      help="number of batches to build ahead of training "
+                           "(0 to build them in the training thread)")
+    args.add_argument("--prefetch-threads", type=int, default=1,
+                      help="number of threads building batches")
+    args.add_argument("-s", "--seed", type=int, default=None,
+                      help="random seed, for reproducible runs")
+    args.add_argument("--separate-steps", action="store_true",
+                      help="train the encoder and decoder in separate "
+                           "session runs instead of one fused run")
+    args.add_argument("-w", "--workers", type=int, default=1,
+                      help="number of data parallel worker processes")
+    args.add_argument("--async", action="store_true", dest="async_updates",
+                      help="apply each worker's updates as they come in "
+                           "instead of averaging them synchronously")
+    args.add_argument("-v", "--validation", type=float, default=0.05,
+                      help="fraction of the colors held out for validation")
+    args.add_argument("--checkpoint-steps", type=int, default=None,
+                      help="save a checkpoint every this many steps")
+    args.add_argument("--checkpoint-minutes", type=float, default=10.0,
+                      help="save a checkpoint every this many minutes")
+    args.add_argument("-r", "--resume", action="store_true",
+                      help="resume from the latest checkpoint")
+    args.add_argument("--patience", type=int, default=None,
+                      help="stop once neither validation loss has improved "
+                           "for this many epochs")
+    args.add_argument("-m", "--metrics", type=str, default=None,
+                      help="JSON lines file to append metrics to (default "
+                           "metrics.jsonl in the data directory)")
+    args.add_argument("--log-steps", type=int, default=100,
+                      help="write step timings and throughput every this "
+                           "many steps")
+    args.add_argument("--trace-steps", type=str, default=None,
+                      help="comma separated steps to write Chrome trace "
+                           "timelines of, to timeline-<step>-<run>.json in "
+                           "the data directory")
     args.add_argument("data_dir", type=str, help="data directory")
 
-    args = args.parse_args()
+    return args
+
 
-    logger.info("Loading vocab")
-    with open("%s/vocab.json" % args.data_dir) as f:
-        vocab = data.load_vocab(f)
+def train():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.workers > 1 and parallel_conflicts(parser, args):
+        parser.error("%s can't be used with --workers" %
+                     ", ".join(parallel_conflicts(parser, args)))
 
     logger.info("Loading colors")
-    colors = []
-    with open("%s/colors.json" % args.data_dir) as f:
-        json_list = json.loads(f.read())
-        for color_tuple in json_list:
-            colors.append(data.Color(*color_tuple))
+    colors = dataset.load_dataset(args.data_dir)
+    vocab = colors.vocab
+    encoded = colors.encoded
+
+    if args.workers > 1:
+        parallel.train_parallel(
+            args, encoded, len(vocab) // 2,
+            metrics_path=args.metrics or "%s/metrics.jsonl" % args.data_dir)
+        exit(0)
+
+    metrics_log = metrics.MetricsLog(
+        args.metrics or "%s/metrics.jsonl" % args.data_dir)
+    metrics_log.write_run(args)
+
+    if args.trace_steps:
+        trace_steps = set(int(x) for x in args.trace_steps.split(","))
+    else:
+        trace_steps = set()
 
-    random.shuffle(colors)
+    rng = np.random.RandomState(args.seed)
 
-    batches = data.yield_batches(colors, args.batch_size)
-    prepared_batches = list(data.prepare_batch(b, vocab) for b in batches)
+    train_idx, valid_idx = data.validation_split(len(encoded.lengths),
+                                                 args.validation)
+    train_lengths = encoded.lengths[train_idx]
+
+    valid_batches = [valid_idx[b] for b in data.index_batches(
+        encoded.lengths[valid_idx], args.batch_size, args.max_chars,
+        np.random.RandomState(0))]
+
+    logger.info("%d training colors, %d validation colors" % (
+        len(train_idx), len(valid_idx)))
+
+    if args.patience is not None and len(valid_idx) == 0:
+        parser.error("--patience needs validation colors, raise -v")
+
+    if args.max_chars is None:
+        batches = [train_idx[b] for b in data.index_batches(
+            train_lengths, args.batch_size, rng=rng)]
+
+        logger.info("Padding ratio %.3f" % data.padding_ratio(
+            encoded.lengths, batches))
 
     logger.info("Building model")
+
+    if args.seed is not None:
+        tf.set_random_seed(args.seed)
+
     session = tf.Session()
     encoder_model = encoder.Encoder(args.hidden_size, len(vocab) // 2)
     decoder_model = decoder.Decoder(args.hidden_size, len(vocab) // 2)
@@ -45,53 +271,201 @@ def train():
 
     saver = tf.train.Saver()
 
+    state_path = "%s/train_state.json" % args.data_dir
+    state = {
+        "step": 0,
+        "epoch": 0,
+        "best_encoder_loss": None,
+        "best_decoder_loss": None,
+        "bad_epochs": 0,
+        "best_checkpoint": None,
+    }
+
+    if args.resume:
+        saved_state = checkpoint.load_state(state_path)
+
+        if saved_state is not None:
+            state.update(saved_state)
+            path = saved_state["checkpoint"]
+        else:
+            path = tf.train.latest_checkpoint(args.data_dir)
+
+        if path is None:
+            logger.warn("No checkpoint to resume from, starting over")
+        else:
+            logger.info("Resuming from %s at step %d" % (path, state["step"]))
+            saver.restore(session, path)
+
+    writer = checkpoint.CheckpointWriter(
+        tf.all_variables(), "%s/params" % args.data_dir, state_path,
+        best_path="%s/params-best" % args.data_dir)
+    last_checkpoint = time.time()
+    window_stats = metrics.StepStats()
+    stopped_early = False
+
     try:
         logger.warn("Starting training, stop with Ctrl-C")
 
-        epoch = 0
-
         while True:
-            epoch += 1
+            # The epoch only counts once it's done, so resuming from a
+            # checkpoint saved part way through repeats it from the start
+            epoch = state["epoch"] + 1
+            epoch_start = time.time()
 
             enc_loss_num = 0
             enc_loss_denom = 0
             dec_loss_num = 0
             dec_loss_denom = 0
 
-            for batch in prepared_batches:
-                enc_loss, _ = session.run(
-                    [encoder_model.loss, encoder_model.trainer],
-                    feed_dict={
-                        encoder_model.input: batch.encoder_input,
-                        encoder_model.length: batch.encoder_length,
-                        encoder_model.target: batch.encoder_target,
-                    },
-                )
+            if args.max_chars is not None:
+                # Rebuild the length buckets every epoch
+                batches = [train_idx[b] for b in data.index_batches(
+                    train_lengths, args.batch_size, args.max_chars, rng)]
+
+                logger.info("Epoch %d, %d batches, padding ratio %.3f" % (
+                    epoch, len(batches),
+                    data.padding_ratio(encoded.lengths, batches)))
+
+            if args.prefetch > 0:
+                batch_iter = data.Prefetcher(encoded, batches, args.prefetch,
+                                             args.prefetch_threads)
+            else:
+                batch_iter = (data.gather_batch(encoded, indices)
+                              for indices in batches)
+
+            steps = 0
+            epoch_stats = metrics.StepStats()
+            input_start = time.time()
+
+            for batch in batch_iter:
+                timings = defaultdict(float)
+                timings["input"] = time.time() - input_start
+                traces = [] if state["step"] + 1 in trace_steps else None
+
+                enc_loss, dec_loss = train_step(
+                    session, encoder_model, decoder_model, batch,
+                    not args.separate_steps, timings, traces)
 
                 enc_loss_num += np.sum(enc_loss)
                 enc_loss_denom += enc_loss.shape[0]
+                dec_loss_num += np.sum(dec_loss)
+                dec_loss_denom += np.sum(batch.decoder_mask)
+                steps += 1
+                state["step"] += 1
 
-                dec_loss, _ = session.run(
-                    [decoder_model.loss, decoder_model.trainer],
-                    feed_dict={
-                        decoder_model.state: batch.decoder_state,
-                        decoder_model.input: batch.decoder_input,
-                        decoder_model.length: batch.decoder_length,
-                        decoder_model.mask: batch.decoder_mask,
-                        decoder_model.label: batch.decoder_label,
-                    },
-                )
+                window_stats.add(batch, timings)
+                epoch_stats.add(batch, timings)
 
-                dec_loss_num += np.sum(dec_loss)
-                dec_loss_denom += dec_loss.shape[0]
+                if traces is not None:
+                    write_trace(traces, "%s/timeline-%d" % (
+                        args.data_dir, state["step"]))
+
+                if state["step"] % args.log_steps == 0:
+                    metrics_log.write("steps", step=state["step"],
+                                      epoch=epoch, **window_stats.summary())
+                    window_stats.reset()
 
-            logger.info("Epoch %d, encoder loss %.3f, decoder loss %.3f" % (
-                epoch, enc_loss_num / enc_loss_denom,
-                dec_loss_num / dec_loss_denom))
+                if (args.checkpoint_steps is not None and
+                        state["step"] % args.checkpoint_steps == 0) or \
+                        time.time() - last_checkpoint >= \
+                        args.checkpoint_minutes * 60.0:
+                    save_start = time.time()
+                    writer.save(session, state["step"], state)
+                    last_checkpoint = time.time()
+
+                    window_stats.exclude(last_checkpoint - save_start)
+                    epoch_stats.exclude(last_checkpoint - save_start)
+
+                input_start = time.time()
+
+            state["epoch"] = epoch
+            epoch_time = time.time() - epoch_start
+
+            logger.info("Epoch %d, encoder loss %.3f, decoder loss %.3f, "
+                        "%.1f s, %.1f steps/s" % (
+                            epoch, enc_loss_num / enc_loss_denom,
+                            dec_loss_num / dec_loss_denom, epoch_time,
+                            steps / epoch_time))
+
+            if args.prefetch > 0:
+                logger.info("Waited %.2f s for input" % batch_iter.wait_time)
+
+            summary = epoch_stats.summary()
+
+            logger.info("Epoch %d, %.1f examples/s, %.1f chars/s, padding "
+                        "efficiency %.3f" % (
+                            epoch, summary["examples_per_sec"],
+                            summary["chars_per_sec"],
+                            summary["padding_efficiency"]))
+
+            if len(valid_batches) > 0:
+                valid_start = time.time()
+                enc_valid, dec_valid = validate(session, encoder_model,
+                                                decoder_model, encoded,
+                                                valid_batches)
+                window_stats.exclude(time.time() - valid_start)
+
+                logger.info("Epoch %d, validation encoder loss %.3f, decoder "
+                            "loss %.3f" % (epoch, enc_valid, dec_valid))
+            else:
+                enc_valid = dec_valid = None
+
+            metrics_log.write(
+                "epoch", step=state["step"], epoch=epoch,
+                encoder_loss=float(enc_loss_num / enc_loss_denom),
+                decoder_loss=float(dec_loss_num / dec_loss_denom),
+                valid_encoder_loss=enc_valid, valid_decoder_loss=dec_valid,
+                **summary)
+
+            if enc_valid is None:
+                continue
+
+            improved = False
+
+            if state["best_encoder_loss"] is None or \
+                    enc_valid < state["best_encoder_loss"]:
+                state["best_encoder_loss"] = enc_valid
+                improved = True
+
+            if state["best_decoder_loss"] is None or \
+                    dec_valid < state["best_decoder_loss"]:
+                state["best_decoder_loss"] = dec_valid
+                improved = True
+
+            if improved:
+                state["bad_epochs"] = 0
+
+                # Keep the weights of the last epoch that improved either
+                # loss, the numbered checkpoints are rotated out
+                writer.save(session, state["step"], state, best=True)
+            else:
+                state["bad_epochs"] += 1
+
+            if args.patience is not None and \
+                    state["bad_epochs"] >= args.patience:
+                logger.warn("No improvement for %d epochs, stopping" %
+                            state["bad_epochs"])
+                stopped_early = True
+                break
 
     except KeyboardInterrupt:
         logger.warn("Stopping training")
 
-    saver.save(session, "%s/params" % args.data_dir)
+    writer.close()
+    metrics_log.close()
+
+    if writer.best_checkpoint is not None:
+        state["best_checkpoint"] = writer.best_checkpoint
+
+    # Resumed state from before the best checkpoint was recorded has none
+    if stopped_early and state["best_checkpoint"] is not None:
+        logger.info("Restoring the best parameters from %s" %
+                    state["best_checkpoint"])
+        saver.restore(session, state["best_checkpoint"])
+
+    # Keep the checkpoint index of the writer's numbered checkpoints intact
+    state["checkpoint"] = saver.save(session, "%s/params" % args.data_dir,
+                                     latest_filename="checkpoint_final")
+    checkpoint.save_state(state_path, state)
 
     exit(0)
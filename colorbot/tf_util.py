@@ -17,3 +17,51 @@ def bias(shape):
     """
     var = tf.Variable(tf.zeros(shape))
     return var
+
+
+class SplitOptimizer(tf.train.Optimizer):
+    """Apply the gradients of each group of variables with its own optimizer.
+
+    This lets a single wrapper, like `tf.train.SyncReplicasOptimizer`, handle
+    several models that are each trained by their own optimizer. The global
+    step is incremented once per update, after every group is updated.
+    """
+
+    def __init__(self, groups, name="Split"):
+        """Create the optimizer.
+
+        Args:
+            groups: List of (optimizer, variables) tuples. Gradients are
+                applied in this order, which decides the names of variables
+                the optimizers create, like Adam's `beta1_power`.
+            name (str): Name for the update operation
+        """
+        super(SplitOptimizer, self).__init__(False, name)
+
+        self._groups = [(optimizer, set(v.op.name for v in variables))
+                        for optimizer, variables in groups]
+
+    def apply_gradients(self, grads_and_vars, global_step=None, name=None):
+        grads_and_vars = list(grads_and_vars)
+        updates = []
+
+        for optimizer, names in self._groups:
+            updates.append(optimizer.apply_gradients(
+                [(g, v) for g, v in grads_and_vars if v.op.name in names]))
+
+        if global_step is None:
+            return tf.group(*updates, name=name or self._name)
+
+        with tf.control_dependencies(updates):
+            return tf.assign_add(global_step, 1, name=name or self._name).op
+
+    def get_slot(self, var, name):
+        for optimizer, names in self._groups:
+            if var.op.name in names:
+                return optimizer.get_slot(var, name)
+
+        return None
+
+    def get_slot_names(self):
+        return sorted(set(name for optimizer, _ in self._groups
+                          for name in optimizer.get_slot_names()))
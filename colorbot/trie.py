@@ -0,0 +1,93 @@
+"""Character trie of existing color names.
+"""
+import numpy as np
+from colorbot import constants
+
+
+class NameTrie(object):
+    """Trie over the character ids of a set of names, stored in flat arrays.
+
+    Node 0 is the root. Edges are stored as a sorted array of
+    `parent * vocab size + id` keys with a matching array of child nodes, so
+    a whole batch of transitions is one `searchsorted`.
+
+    Attributes:
+        vocab_size (int): Number of characters in the vocabulary
+        terminal: A bool [nodes] array, True for nodes that end a name
+    """
+
+    def __init__(self, names, vocab):
+        """Build the trie.
+
+        Args:
+            names: Iterable of names, including start/end symbols
+            vocab: The vocabulary dict
+        """
+        self.vocab_size = len(vocab) // 2
+
+        edges = {}
+        terminal = [False]
+
+        for name in names:
+            node = 0
+
+            # Walk everything but the end symbol
+            for c in name[:-len(constants.END_SYMBOL)]:
+                key = node * self.vocab_size + vocab[c]
+                child = edges.get(key)
+
+                if child is None:
+                    child = len(terminal)
+                    edges[key] = child
+                    terminal.append(False)
+
+                node = child
+
+            terminal[node] = True
+
+        keys = np.fromiter(edges.keys(), np.int64, len(edges))
+        children = np.fromiter(edges.values(), np.int32, len(edges))
+        order = np.argsort(keys)
+
+        self._keys = keys[order]
+        self._children = children[order]
+        self.terminal = np.array(terminal, np.bool_)
+
+    def __len__(self):
+        return len(self.terminal)
+
+    def step(self, nodes, ids):
+        """Follow an edge from each of several nodes.
+
+        Args:
+            nodes: An int32 [batch size] array of nodes, -1 for sequences that
+                already left the trie
+            ids: An int32 [batch size] array of character ids
+
+        Returns:
+            An int32 [batch size] array of child nodes, -1 where there is no
+            such edge.
+        """
+        if len(self._keys) == 0:
+            # No names, so the root has no children
+            return np.full(np.shape(nodes), -1, np.int32)
+
+        keys = nodes.astype(np.int64) * self.vocab_size + ids
+        pos = np.minimum(np.searchsorted(self._keys, keys),
+                         len(self._keys) - 1)
+
+        found = (nodes >= 0) & (self._keys[pos] == keys)
+
+        return np.where(found, self._children[pos], -1).astype(np.int32)
+
+    def is_name(self, nodes):
+        """Check which nodes end an existing name.
+
+        Args:
+            nodes: An int32 [batch size] array of nodes, -1 for sequences that
+                left the trie
+
+        Returns:
+            A bool [batch size] array.
+        """
+        return (nodes >= 0) & self.terminal[np.maximum(nodes, 0)]
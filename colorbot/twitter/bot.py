@@ -1,21 +1,46 @@
 import io
 import logging
+import os
+import random
 import re
 import signal
 import threading
 import time
 
-import numpy as np
-import tensorflow as tf
 import tweepy
 from colorbot import constants
 from colorbot.data import hex_to_rgb, rgb_to_hex
-from colorbot.decoder import Decoder
-from colorbot.encoder import Encoder
+from colorbot.inference import load_model
+from colorbot.twitter.cache import ResultCache
 from colorbot.twitter.drawing import create_png
+from colorbot.twitter.pipeline import Stage
+from colorbot.twitter.ratelimit import TokenBucket, TWEETS_PER_HOUR
+from colorbot.twitter.tasks import TaskQueue, DROP_OLDEST
 
 logger = logging.getLogger(__name__)
 
+TWEET_LENGTH = 140
+"""int: Maximum number of characters in a tweet"""
+
+
+def add_nearest(status, names):
+    """Mention as many of the nearest real color names as fit in a tweet.
+
+    Args:
+        status (str): The reply text
+        names: List of real color names, closest first
+
+    Returns:
+        str: The reply text, with the names that fit.
+    """
+    for count in range(len(names), 0, -1):
+        full = "%s (close to %s)" % (status, ", ".join(names[:count]))
+
+        if len(full) <= TWEET_LENGTH:
+            return full
+
+    return status
+
 
 class GlobalState(object):
     """Class to hold global application state.
@@ -24,10 +49,20 @@ class GlobalState(object):
         api: The Tweepy API instance
         name_set (set): A set of strings of existing color names
         vocab: The encoder/decoder vocabulary
-        hidden_size (int): The model's hidden layer size
-        param_path (str): Path to the saved model parameters
+        model: The loaded model instance, shared by all tasks
+        max_batch_size (int): Maximum number of tasks handled together
+        batch_wait (float): Seconds to wait for more tasks to batch
+        limiter: TokenBucket pacing the Twitter API calls
+        render_stage: Stage rendering guessed colors
+        post_stage: Stage posting replies
+        cache: ResultCache of names and guesses
+        name_pool_size (int): Number of names cached per color
+        index: ColorIndex of the dataset, or None
+        nearest (int): Number of nearest real color names to add to replies
+        atlas: NameAtlas of precomputed names, or None
+        atlas_fallback (bool): Run the model for colors missing in the atlas
         stop (bool): True if the worker threads should stop
-        tasks: List of dicts describing tasks to do
+        tasks: TaskQueue of pending tasks
         lock: Mutex to control shared access to these attributes
         has_tasks: Condition notified when tasks is changed
     """
@@ -36,186 +71,199 @@ class GlobalState(object):
         self.api = None
         self.name_set = None
         self.vocab = None
-        self.hidden_size = None
-        self.param_path = None
+        self.model = None
+        self.max_batch_size = 1
+        self.batch_wait = 0.0
+        self.limiter = None
+        self.render_stage = None
+        self.post_stage = None
+        self.cache = ResultCache()
+        self.name_pool_size = 1
+        self.index = None
+        self.nearest = 0
+        self.atlas = None
+        self.atlas_fallback = True
 
         self.stop = False
 
-        self.tasks = []
+        self.tasks = TaskQueue()
 
         self.lock = threading.Lock()
         self.has_tasks = threading.Condition(lock=self.lock)
 
 
-def name_color(hex, status_id, screen_name, global_state):
-    """Name a color and post to Twitter.
+def name_colors(tasks, global_state):
+    """Name colors and queue the replies for posting.
 
-    Acquire the lock before using.
+    Colors with a cached pool of names or names in the atlas are answered from
+    those, all others are named with one batched model run (unless atlas
+    fallback is disabled).
 
     Args:
-        hex (str): The hex color code string (6 chars)
-        status_id (str): The ID of the status to reply to
-        screen_name (str): The screen name to reply to
+        tasks: List of "name" task dicts
         global_state: A global state instance
     """
-    logger.info("Naming color %s" % hex)
-
-    r, g, b = hex_to_rgb(hex)
-
-    # Set up session and models
-    session = tf.Session()
-
-    encoder = Encoder(global_state.hidden_size,
-                      len(global_state.vocab) // 2)
-    decoder = Decoder(global_state.hidden_size,
-                      len(global_state.vocab) // 2)
-
-    session.run(tf.initialize_all_variables())
-
-    # Load params from file
-    saver = tf.train.Saver()
-    saver.restore(session, global_state.param_path)
-
-    # Name color
-    name = None
-    tries = 50
-
-    # Try up to `tries` times to get a valid name
-    while name is None and tries > 0:
-        tries -= 1
-
-        name_seq = [global_state.vocab[constants.START_SYMBOL]]
-        state = None
-
-        # Sample from model until:
-        #   - We get a sequence longer than 50 (too long, quit), OR
-        #   - The returned symbol is the end symbol
-        while (len(name_seq) < 50 and
-                       global_state.vocab[
-                           name_seq[-1]] != constants.END_SYMBOL):
-
-            if state is None:
-                # Provide color to generate first hidden state
-                state, output = session.run(
-                    [decoder.final_state, decoder.output],
-                    feed_dict={
-                        decoder.state: [[r, g, b]],
-                        decoder.input: [[name_seq[-1]]],
-                        decoder.length: [1],
-                        decoder.mask: [[1.0]],
-                    },
-                )
-            else:
-                # Use the last hidden state
-                state, output = session.run(
-                    [decoder.final_state, decoder.output],
-                    feed_dict={
-                        decoder.initial_state: state,
-                        decoder.input: [[name_seq[-1]]],
-                        decoder.length: [1],
-                        decoder.mask: [[1.0]],
-                    },
-                )
-
-            # Weighted random pick from output PMF
-            val = np.random.rand()
-
-            for i, prob in enumerate(output[0]):
-                if prob > val:
-                    name_seq.append(i)
-                    break
-                else:
-                    val -= prob
-
-        # Turn the output sequence into strings
-        name_seq_str = "".join(global_state.vocab[i] for i in name_seq)
-
-        # If name generation is successful, set name
-        # We skip this and try again if the loop exited before generating the
-        # end symbol, or if it generated an existing color name
-        if (global_state.vocab[name_seq[-1]] == constants.END_SYMBOL and
-                    name_seq_str not in global_state.name_set):
-            name = name_seq_str[1:-1]
-
-    # Clean up session
-    session.close()
-    tf.reset_default_graph()
-
-    # Try to tweet
-    if name is None:
-        logger.warn("Giving up on naming")
-    else:
-        logger.info("Replying with name %s" % name)
-        status = "@%s %s" % (screen_name, name)
+    cache = global_state.cache
+    pools = {}
+    misses = []
 
-        try:
-            global_state.api.update_status(status, status_id)
-        except tweepy.TweepError as e:
-            logger.error("Failed replying with color name: %s" % e)
+    for task in tasks:
+        pool = cache.get("name:%s" % task["hex"])
+
+        # Look up precomputed names
+        if pool is None and global_state.atlas is not None:
+            pool = global_state.atlas.names(hex_to_rgb(task["hex"])) or None
+
+        if pool is None:
+            misses.append(task)
+        else:
+            pools[task["hex"]] = pool
+
+    if global_state.atlas is not None and not global_state.atlas_fallback:
+        misses = []
+
+    if len(misses) > 0:
+        logger.info("Naming colors %s" % ", ".join(t["hex"] for t in misses))
 
+        new_pools = global_state.model.name_pools(
+            [hex_to_rgb(t["hex"]) for t in misses],
+            global_state.name_pool_size)
 
-def guess_color(name, status_id, screen_name, global_state):
-    """Guess a color value, upload it to twitter.
+        for task, pool in zip(misses, new_pools):
+            if len(pool) > 0:
+                cache.put("name:%s" % task["hex"], pool)
+                pools[task["hex"]] = pool
 
-    Acquire the lock before using.
+    for task in tasks:
+        pool = pools.get(task["hex"])
+
+        if pool is None:
+            logger.warn("Giving up on naming %s" % task["hex"])
+            continue
+
+        # Mention the closest real colors too
+        nearest = []
+
+        if global_state.index is not None and global_state.nearest > 0:
+            nearest = [n for n, _ in global_state.index.nearest(
+                hex_to_rgb(task["hex"]), global_state.nearest)]
+
+        for reply in task["replies"]:
+            # Vary the names given for the same color
+            name = random.choice(pool)
+
+            logger.info("Named %s %s" % (task["hex"], name))
+
+            status = add_nearest(
+                "@%s %s" % (reply["screen_name"], name), nearest)
+
+            global_state.post_stage.put({
+                "status": status,
+                "status_id": reply["status_id"],
+            })
+
+
+def guess_colors(tasks, global_state):
+    """Guess color values and queue them for rendering.
+
+    Names in the dataset index get their real color and names with a cached
+    guess are answered from the cache. All others are guessed with one
+    batched model run.
 
     Args:
-        name (str): The name of the color
-        status_id (str): The ID of the status to reply to
-        screen_name (str): The screen name to reply to
+        tasks: List of "guess" task dicts
         global_state: A global state instance
     """
+    cache = global_state.cache
+    rgbs = {}
+    misses = []
+
+    for task in tasks:
+        # Known names get their real color
+        if global_state.index is not None:
+            rgb = global_state.index.lookup(task["name"])
+        else:
+            rgb = None
+
+        if rgb is None:
+            rgb = cache.get("guess:%s" % task["name"])
 
-    logger.info("Guessing color for \"%s\"" % name)
+        if rgb is None:
+            misses.append(task)
+        else:
+            rgbs[task["name"]] = tuple(rgb)
 
-    # Set up model
-    session = tf.Session()
+    if len(misses) > 0:
+        logger.info("Guessing colors for %s" % ", ".join(
+            "\"%s\"" % t["name"] for t in misses))
 
-    encoder = Encoder(global_state.hidden_size,
-                      len(global_state.vocab) // 2)
-    decoder = Decoder(global_state.hidden_size,
-                      len(global_state.vocab) // 2)
+        new_rgbs = global_state.model.guess_batch([t["name"] for t in misses])
 
-    session.run(tf.initialize_all_variables())
+        for task, rgb in zip(misses, new_rgbs):
+            cache.put("guess:%s" % task["name"], list(rgb))
+            rgbs[task["name"]] = rgb
 
-    # Load model parameters
-    saver = tf.train.Saver()
-    saver.restore(session, global_state.param_path)
+    for task in tasks:
+        rgb = rgbs[task["name"]]
 
-    # Feed name into model
-    enc_name = [global_state.vocab[c] for c in name]
+        logger.info("Guessed %s" % rgb_to_hex(*rgb))
 
-    output = session.run(
-        encoder.output,
-        feed_dict={
-            encoder.input: [enc_name],
-            encoder.length: [len(enc_name)],
-        },
-    )
+        global_state.render_stage.put({
+            "task": task,
+            "rgb": rgb,
+        })
 
-    # Turn model output into hex
-    r, g, b = output[0].tolist()
-    hex_str = rgb_to_hex(r, g, b)
 
-    # Clean up model
-    session.close()
-    tf.reset_default_graph()
+def render_guess(item, global_state):
+    """Render a guessed color and queue the replies for posting.
+
+    Args:
+        item: Dict with the "guess" "task" and the guessed "rgb"
+        global_state: A global state instance
+    """
+    task = item["task"]
+    name = task["name"]
+    r, g, b = item["rgb"]
 
-    logger.info("Guessed %s" % hex_str)
+    # Turn model output into hex
+    hex_str = rgb_to_hex(r, g, b)
 
     # Create PNG file
     png_data = create_png(r, g, b)
-    png_file = io.BytesIO(png_data)
 
-    # Upload to twitter
-    status = "@%s %s - %s" % (screen_name, name[:50], hex_str)
+    for reply in task["replies"]:
+        global_state.post_stage.put({
+            "status": "@%s %s - %s" % (reply["screen_name"], name[:50],
+                                       hex_str),
+            "status_id": reply["status_id"],
+            "filename": "%s.png" % name,
+            "png_data": png_data,
+        })
+
+
+def post_reply(item, global_state):
+    """Post a reply to Twitter, waiting for the rate limiter.
+
+    Args:
+        item: Dict with the "status" text, the "status_id" to reply to, and
+            optionally a "filename" and "png_data" to upload with it
+        global_state: A global state instance
+    """
+    if not global_state.limiter.acquire():
+        return  # Stopping
+
+    logger.info("Replying with %s" % item["status"])
 
     try:
-        global_state.api.update_with_media("%s.png" % name, status,
-                                           in_reply_to_status_id=status_id,
-                                           file=png_file)
+        if "png_data" in item:
+            global_state.api.update_with_media(
+                item["filename"], item["status"],
+                in_reply_to_status_id=item["status_id"],
+                file=io.BytesIO(item["png_data"]))
+        else:
+            global_state.api.update_status(item["status"], item["status_id"])
     except tweepy.TweepError as e:
-        logging.error("Failed to tweet guessed color: %s" % e)
+        logger.error("Failed to reply: %s" % e)
 
 
 class StreamListener(tweepy.StreamListener):
@@ -265,15 +313,8 @@ class StreamListener(tweepy.StreamListener):
                 hex_str = hex_match.group(2)
 
                 # Tell the worker thread to handle this
-                task = {
-                    "type": "name",
-                    "hex": hex_str,
-                    "status_id": id,
-                    "screen_name": screen_name,
-                }
-
                 with self.state.has_tasks:
-                    self.state.tasks.append(task)
+                    self.state.tasks.put("name", hex_str, id, screen_name)
                     self.state.has_tasks.notify()
 
             elif name_match is not None:
@@ -290,20 +331,23 @@ class StreamListener(tweepy.StreamListener):
                                   constants.END_SYMBOL)
 
                     # Tell worker thread to guess
-                    task = {
-                        "type": "guess",
-                        "name": input_name,
-                        "status_id": id,
-                        "screen_name": screen_name,
-                    }
-
                     with self.state.has_tasks:
-                        self.state.tasks.append(task)
+                        self.state.tasks.put("guess", input_name, id,
+                                             screen_name)
                         self.state.has_tasks.notify()
 
 
 def worker(state):
-    """Twitter reply worker thread.
+    """Model worker thread.
+
+    This is the first stage of the reply pipeline: results are handed to the
+    render and post stages, so several of these can run at once and never
+    wait for the network.
+
+    Pending tasks are handled in batches: once a task arrives, the worker
+    waits up to `state.batch_wait` seconds for more, or until
+    `state.max_batch_size` tasks are pending, then runs all "name" tasks and
+    all "guess" tasks through the model together.
 
     Args:
         state: The global state instance
@@ -315,46 +359,118 @@ def worker(state):
             while state.stop is False and len(state.tasks) == 0:
                 state.has_tasks.wait()
 
+            # Give more tasks a chance to arrive
+            deadline = time.time() + state.batch_wait
+
+            while (state.stop is False and
+                    len(state.tasks) < state.max_batch_size):
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    break
+
+                state.has_tasks.wait(remaining)
+
             # Check if stop is requested
             if state.stop is not False:
                 logger.debug("Worker thread exiting")
                 return  # Stop
 
-            # get task
-            task = state.tasks.pop()
+            # get tasks
+            batch = state.tasks.get_batch(state.max_batch_size)
+            stats = state.tasks.stats()
+
+        stats["render"] = state.render_stage.depth()
+        stats["post"] = state.post_stage.depth()
+        cache_stats = state.cache.stats()
+
+        logger.debug("Worker thread handling %d tasks (%d pending, %d "
+                     "merged, %d dropped, %d to render, %d to post, %d cache "
+                     "hits, %d cache misses)" % (
+                         len(batch), stats["depth"], stats["merged"],
+                         stats["dropped"], stats["render"], stats["post"],
+                         cache_stats["hits"], cache_stats["misses"]))
 
-            logger.debug("Worker thread handling task: %r" % task)
+        # Handle tasks
+        name_tasks = [t for t in batch if t["type"] == "name"]
+        guess_tasks = [t for t in batch if t["type"] == "guess"]
 
-            # Handle task
-            if task["type"] == "name":
-                name_color(task["hex"], task["status_id"], task["screen_name"],
-                           state)
-            elif task["type"] == "guess":
-                guess_color(task["name"], task["status_id"],
-                            task["screen_name"], state)
+        if len(name_tasks) > 0:
+            name_colors(name_tasks, state)
 
-        # Don't try to handle anything for a short while
-        time.sleep(10)
+        if len(guess_tasks) > 0:
+            guess_colors(guess_tasks, state)
 
 
-def run(auth, name_set, api, vocab, hidden_size, param_path):
+def run(auth, name_set, api, vocab, hidden_size, param_path, *,
+        max_batch_size=16, batch_wait=0.005, queue_size=1000,
+        drop_policy=DROP_OLDEST, workers=2, tweets_per_hour=TWEETS_PER_HOUR,
+        burst=10, render_threads=1, post_threads=2, cache_size=10000,
+        cache_ttl=None, name_pool_size=5, cache_file=None, index=None,
+        nearest=0, atlas=None, atlas_fallback=True, trie=None):
     """Run the bot.
 
+    Everything after `param_path` is keyword-only.
+
     Args:
         auth: Tweepy auth handler instance
         name_set: Set of real color names
         api: Tweepy API instance
         vocab: The model vocabulary dict
         hidden_size (int): The model's hidden size
-        param_path (str): Path of the model parameters file
+        param_path (str): Path of the model parameters file, or of exported
+            .npz weights
+        max_batch_size (int): Maximum number of tasks handled together
+        batch_wait (float): Seconds to wait for more tasks to batch
+        queue_size (int): Maximum number of pending tasks
+        drop_policy (str): Which task to drop when the queue is full, "oldest"
+            or "newest"
+        workers (int): Number of model worker threads
+        tweets_per_hour (float): Sustained rate of replies
+        burst (int): Maximum number of replies sent back to back
+        render_threads (int): Number of PNG rendering threads
+        post_threads (int): Number of reply posting threads
+        cache_size (int): Maximum number of cached results
+        cache_ttl (float): Seconds results stay cached, or None for no limit
+        name_pool_size (int): Number of names cached per color
+        cache_file (str): File to load the cache from at startup and save it
+            to when exiting, or None
+        index: ColorIndex of the dataset, or None
+        nearest (int): Number of nearest real color names to add to replies
+        atlas: NameAtlas of precomputed names, or None
+        atlas_fallback (bool): Run the model for colors missing in the atlas
+        trie: NameTrie of the existing names to avoid while sampling, or None
     """
 
     state = GlobalState()
+    state.tasks = TaskQueue(queue_size, drop_policy)
     state.api = api
     state.name_set = name_set
     state.vocab = vocab
-    state.hidden_size = hidden_size
-    state.param_path = param_path
+    state.max_batch_size = max_batch_size
+    state.batch_wait = batch_wait
+    state.limiter = TokenBucket(tweets_per_hour / 3600, burst)
+    state.cache = ResultCache(cache_size, cache_ttl)
+    state.name_pool_size = name_pool_size
+    state.index = index
+    state.nearest = nearest
+    state.atlas = atlas
+    state.atlas_fallback = atlas_fallback
+
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file) as f:
+            state.cache.load(f)
+
+    state.render_stage = Stage(
+        "render", lambda item: render_guess(item, state), render_threads,
+        queue_size)
+    state.post_stage = Stage(
+        "post", lambda item: post_reply(item, state), post_threads,
+        queue_size)
+
+    # Load the model once, every task reuses it
+    state.model = load_model(vocab, hidden_size, param_path, name_set,
+                             trie=trie)
 
     def term_handler(*args):
         raise KeyboardInterrupt("SIGTERM")
@@ -363,9 +479,16 @@ def run(auth, name_set, api, vocab, hidden_size, param_path):
 
     listener = StreamListener(state)
 
-    logger.info("Starting worker thread")
-    worker_thread = threading.Thread(target=worker, args=(state,))
-    worker_thread.start()
+    state.post_stage.start()
+    state.render_stage.start()
+
+    logger.info("Starting %d worker threads" % workers)
+    worker_threads = []
+
+    for i in range(workers):
+        worker_thread = threading.Thread(target=worker, args=(state,))
+        worker_thread.start()
+        worker_threads.append(worker_thread)
 
     while True:
         try:
@@ -383,7 +506,24 @@ def run(auth, name_set, api, vocab, hidden_size, param_path):
         state.stop = True
         state.has_tasks.notify_all()
 
-    worker_thread.join()
+    # Wake up threads waiting to tweet, queued replies are dropped
+    state.limiter.close()
+
+    for worker_thread in worker_threads:
+        worker_thread.join()
+
+    state.render_stage.stop()
+    state.post_stage.stop()
+
+    state.model.close()
+
+    logger.info("Cache hits: %(hits)d, misses: %(misses)d" %
+                state.cache.stats())
+
+    if cache_file is not None:
+        logger.info("Saving cache to %s" % cache_file)
+        with open(cache_file, "w") as f:
+            state.cache.save(f)
 
     logger.info("Exiting")
     exit(0)
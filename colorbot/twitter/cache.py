@@ -0,0 +1,122 @@
+"""Cache of model results.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """Thread safe LRU cache with optional expiry.
+
+    Keys are strings, values anything JSON serializable, so the cache can be
+    saved to and loaded from a file.
+
+    Attributes:
+        max_size (int): Maximum number of entries, the least recently used
+            entry is evicted past this
+        ttl (float): Seconds an entry stays valid, or None to keep entries
+            until they're evicted
+        hits (int): Number of successful lookups
+        misses (int): Number of failed lookups
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Look up an entry.
+
+        Args:
+            key (str): The key
+
+        Returns:
+            The value, or None if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] is not None and \
+                    entry[0] < time.time():
+                # Expired
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Add or replace an entry.
+
+        Args:
+            key (str): The key
+            value: The value
+        """
+        expires = None if self.ttl is None else time.time() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Get cache statistics.
+
+        Returns:
+            A dict with the current "size" and the "hits" and "misses" counts.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def save(self, f):
+        """Save the entries to a json file.
+
+        Args:
+            f: The file object to write to
+        """
+        with self._lock:
+            entries = [[k, e[0], e[1]] for k, e in self._entries.items()]
+
+        f.write(json.dumps(entries))
+
+    def load(self, f):
+        """Load entries from a json file, skipping expired ones.
+
+        Args:
+            f: The file object
+        """
+        entries = json.loads(f.read())
+        now = time.time()
+
+        with self._lock:
+            for key, expires, value in entries:
+                if expires is None or expires >= now:
+                    self._entries[key] = (expires, value)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        logger.info("Loaded %d cached results" % len(self._entries))
@@ -1,4 +1,64 @@
-import pngcanvas
+import functools
+import struct
+import zlib
+
+WIDTH = 150
+"""int: Width of the images in pixels"""
+
+HEIGHT = 150
+"""int: Height of the images in pixels"""
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(kind, data):
+    """Build a PNG chunk.
+
+    Args:
+        kind (bytes): The 4 byte chunk type
+        data (bytes): The chunk data
+
+    Returns:
+        bytes: The chunk, including its length and CRC
+    """
+    crc = zlib.crc32(kind + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+# The image is a single color, so it's stored as a 1 bit indexed image with a
+# one entry palette. Every pixel is index 0, so the image data is the same for
+# every color and only the palette changes.
+_IHDR = png_chunk(b"IHDR", struct.pack(
+    ">IIBBBBB",
+    WIDTH, HEIGHT,
+    1,  # bit depth
+    3,  # color type: indexed
+    0,  # compression: deflate
+    0,  # filter method
+    0,  # interlace: none
+))
+
+# Each scanline is a filter type byte (0, none) followed by the packed pixels
+_IDAT = png_chunk(b"IDAT", zlib.compress(
+    b"\x00" * ((1 + (WIDTH + 7) // 8) * HEIGHT), 9))
+
+_IEND = png_chunk(b"IEND", b"")
+
+
+@functools.lru_cache(maxsize=4096)
+def solid_png(r, g, b):
+    """Create a PNG filled with a single color.
+
+    Args:
+        r (int): R value on [0, 255]
+        g (int): G value on [0, 255]
+        b (int): B value on [0, 255]
+
+    Returns:
+        bytes: PNG image bytes
+    """
+    plte = png_chunk(b"PLTE", bytes((r, g, b)))
+    return PNG_SIGNATURE + _IHDR + plte + _IDAT + _IEND
 
 
 def create_png(r, g, b):
@@ -13,6 +73,4 @@ def create_png(r, g, b):
     g = round((g + 1) / 2 * 255)
     b = round((b + 1) / 2 * 255)
 
-    canvas = pngcanvas.PNGCanvas(150, 150, bgcolor=(r, g, b, 0xff))
-    data = canvas.dump()
-    return data
+    return solid_png(r, g, b)
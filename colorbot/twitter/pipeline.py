@@ -0,0 +1,76 @@
+"""Multi-threaded processing stages connected by bounded queues.
+"""
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage(object):
+    """A pool of threads that handle items from a bounded queue.
+
+    `put` blocks while the queue is full, so a slow stage holds back the stages
+    feeding it instead of buffering without limit.
+
+    Attributes:
+        name (str): Name of the stage, for logging
+        handler: Function called with each item
+        threads (int): Number of threads
+    """
+
+    def __init__(self, name, handler, threads=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.threads = threads
+
+        self._queue = queue.Queue(queue_size)
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+
+            if item is _STOP:
+                logger.debug("Stage %s thread exiting" % self.name)
+                return
+
+            try:
+                self.handler(item)
+            except Exception as e:
+                logger.exception("Stage %s failed handling item: %s" %
+                                 (self.name, e))
+
+    def start(self):
+        """Start the threads.
+        """
+        logger.info("Starting stage %s with %d threads" %
+                    (self.name, self.threads))
+
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Handle the items already queued, then stop the threads.
+        """
+        for thread in self._threads:
+            self._queue.put(_STOP)
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+
+    def put(self, item):
+        """Queue an item, waiting while the queue is full.
+        """
+        self._queue.put(item)
+
+    def depth(self):
+        """Get the approximate number of queued items.
+        """
+        return self._queue.qsize()
@@ -0,0 +1,83 @@
+"""Rate limiting for Twitter API calls.
+"""
+import threading
+import time
+
+TWEETS_PER_HOUR = 100
+"""int: Twitter allows 300 tweets (including replies) per 3 hours"""
+
+
+class TokenBucket(object):
+    """Thread safe token bucket rate limiter.
+
+    Tokens are added at a constant rate up to a maximum, and every call to
+    `acquire` takes one, waiting for it if the bucket is empty.
+
+    Attributes:
+        rate (float): Tokens added per second
+        capacity (float): Maximum number of tokens, i.e. the largest burst
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """Create a full bucket.
+
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum number of tokens
+            clock: Function returning the current time in seconds
+        """
+        self.rate = rate
+        self.capacity = capacity
+
+        self._clock = clock
+        self._tokens = capacity
+        self._last = clock()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting until one is available.
+
+        Args:
+            timeout (float): Give up after this many seconds, or None to wait
+                as long as needed
+
+        Returns:
+            bool: True if a token was taken, False if timed out or closed.
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+
+        with self._cond:
+            while not self._closed:
+                self._refill()
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+
+                wait = (1 - self._tokens) / self.rate
+
+                if deadline is not None:
+                    remaining = deadline - self._clock()
+
+                    if remaining <= 0:
+                        return False
+
+                    wait = min(wait, remaining)
+
+                self._cond.wait(wait)
+
+            return False
+
+    def close(self):
+        """Make all current and future `acquire` calls return False.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,121 @@
+"""Queue of pending reply tasks.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "oldest"
+"""str: Drop policy that discards the oldest pending task to make room"""
+
+DROP_NEWEST = "newest"
+"""str: Drop policy that rejects new tasks while the queue is full"""
+
+
+class TaskQueue(object):
+    """FIFO queue of tasks that merges identical pending requests.
+
+    Tasks are dicts with a "type" ("name" or "guess"), the input ("hex" or
+    "name") and a list of "replies", each a dict with the "status_id" and
+    "screen_name" to reply to. A request for the same input as a pending task
+    is added to that task's replies, so it's only computed once.
+
+    Not thread safe, hold a lock while using it.
+
+    Attributes:
+        capacity (int): Maximum number of pending tasks
+        drop_policy (str): DROP_OLDEST or DROP_NEWEST
+        dropped (int): Number of replies dropped because the queue was full
+        merged (int): Number of replies merged into a pending task
+    """
+
+    def __init__(self, capacity=1000, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("Unknown drop policy: %s" % drop_policy)
+
+        self.capacity = capacity
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.merged = 0
+
+        self._tasks = OrderedDict()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def put(self, task_type, value, status_id, screen_name):
+        """Add a request to the queue.
+
+        Args:
+            task_type (str): "name" or "guess"
+            value (str): The hex code to name, or the name to guess
+            status_id (str): The ID of the status to reply to
+            screen_name (str): The screen name to reply to
+
+        Returns:
+            bool: False if the request was dropped.
+        """
+        if task_type == "name":
+            value = value.lower()
+            input_key = "hex"
+        else:
+            input_key = "name"
+
+        key = (task_type, value)
+        reply = {
+            "status_id": status_id,
+            "screen_name": screen_name,
+        }
+
+        if key in self._tasks:
+            self._tasks[key]["replies"].append(reply)
+            self.merged += 1
+            return True
+
+        if len(self._tasks) >= self.capacity:
+            if self.drop_policy == DROP_NEWEST:
+                self.dropped += 1
+                logger.warning("Task queue full, dropping new task")
+                return False
+
+            _, oldest = self._tasks.popitem(last=False)
+            self.dropped += len(oldest["replies"])
+            logger.warning("Task queue full, dropping oldest task")
+
+        self._tasks[key] = {
+            "type": task_type,
+            input_key: value,
+            "replies": [reply],
+        }
+
+        return True
+
+    def get_batch(self, max_size):
+        """Remove and return the oldest tasks.
+
+        Args:
+            max_size (int): Maximum number of tasks to return
+
+        Returns:
+            A list of task dicts, oldest first.
+        """
+        batch = []
+
+        while len(batch) < max_size and len(self._tasks) > 0:
+            _, task = self._tasks.popitem(last=False)
+            batch.append(task)
+
+        return batch
+
+    def stats(self):
+        """Get queue statistics.
+
+        Returns:
+            A dict with the current "depth" and the "dropped" and "merged"
+            counts.
+        """
+        return {
+            "depth": len(self._tasks),
+            "dropped": self.dropped,
+            "merged": self.merged,
+        }
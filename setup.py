@@ -5,7 +5,6 @@ reqs = [
     "numpy",
     "requests",
     "tweepy",
-    "pngcanvas",
 ]
 
 setup(
@@ -19,6 +18,8 @@ setup(
         "console_scripts": [
             "colorbot_prepare = colorbot.scripts.prepare:prepare_data",
             "colorbot_train = colorbot.scripts.train:train",
+            "colorbot_export = colorbot.scripts.export:export",
+            "colorbot_atlas = colorbot.scripts.atlas:build_atlas",
             "colorbot_sample = colorbot.scripts.sample:sample",
             "colorbot_auth = colorbot.scripts.auth:auth",
             "colorbot_post = colorbot.scripts.post:post",
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from colorbot import atlas, binfile
+
+CHARS = ["\x00", "\x02", "\x03", "a", "b"]
+
+
+def write_atlas(path, param_path, version=atlas.VERSION):
+    """Write a grid size 1 atlas with the names "ab" and "b"."""
+    header = {
+        "version": version,
+        "grid_size": 1,
+        "names_per_cell": 3,
+        "max_length": 2,
+        "dtype": "uint8",
+        "chars": CHARS,
+        "checkpoint": atlas.checkpoint_digest(param_path),
+        "lengths_offset": 0,
+        "ids_offset": 8,
+    }
+
+    with open(path, "wb") as f:
+        binfile.write_header(f, header, atlas.MAGIC)
+        f.write(np.array([2, 1, 0, 0, 0, 0, 0, 0], np.uint8).tobytes())
+        f.write(np.array([[3, 4], [4, 0], [0, 0]], np.uint8).tobytes())
+
+
+@pytest.fixture
+def params(tmpdir):
+    param_path = str(tmpdir.join("params"))
+
+    for suffix, content in ((".index", b"index"), (".data", b"weights")):
+        with open(param_path + suffix, "wb") as f:
+            f.write(content)
+
+    return param_path
+
+
+def test_load_matching_atlas(tmpdir, params):
+    path = str(tmpdir.join("atlas.bin"))
+    write_atlas(path, params)
+
+    loaded = atlas.load_atlas(path, params)
+
+    assert loaded is not None
+    assert loaded.names((0.3, -0.9, 0.9)) == ["ab", "b"]
+
+
+def test_stale_atlas_is_ignored(tmpdir, params):
+    path = str(tmpdir.join("atlas.bin"))
+    write_atlas(path, params)
+
+    # Training again changes the checkpoint files
+    with open(params + ".data", "wb") as f:
+        f.write(b"new weights")
+
+    assert atlas.load_atlas(path, params) is None
+
+
+def test_digest_ignores_other_files(tmpdir, params):
+    digest = atlas.checkpoint_digest(params)
+
+    for name in ("params-best.index", "params.npz", "paramsfoo"):
+        tmpdir.join(name).write("other")
+
+    assert atlas.checkpoint_digest(params) == digest
+
+
+def test_exported_weights_match_their_checkpoint(tmpdir, params):
+    path = str(tmpdir.join("atlas.bin"))
+    npz_path = str(tmpdir.join("params.npz"))
+    write_atlas(path, params)
+
+    with open(npz_path, "wb") as f:
+        np.savez(f, decoder_embed=np.zeros([2, 2], np.float32),
+                 checkpoint=np.array(atlas.checkpoint_digest(params)))
+
+    assert atlas.load_atlas(path, npz_path) is not None
+
+    with open(npz_path, "wb") as f:
+        np.savez(f, decoder_embed=np.zeros([2, 2], np.float32),
+                 checkpoint=np.array("0" * 64))
+
+    assert atlas.load_atlas(path, npz_path) is None
+
+
+def test_version_mismatch_is_rejected(tmpdir, params):
+    path = str(tmpdir.join("atlas.bin"))
+    write_atlas(path, params, version=atlas.VERSION + 1)
+
+    with pytest.raises(ValueError):
+        atlas.load_atlas(path, params)
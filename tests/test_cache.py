@@ -0,0 +1,104 @@
+import io
+
+import pytest
+
+from colorbot.twitter import cache
+from colorbot.twitter.cache import ResultCache
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_get_and_stats():
+    results = ResultCache()
+    results.put("ff0000", "Red")
+
+    assert results.get("ff0000") == "Red"
+    assert results.get("00ff00") is None
+    assert results.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_evicts_least_recently_used():
+    results = ResultCache(max_size=2)
+    results.put("a", 1)
+    results.put("b", 2)
+
+    # Using "a" makes "b" the least recently used
+    assert results.get("a") == 1
+
+    results.put("c", 3)
+
+    assert results.get("b") is None
+    assert results.get("a") == 1
+    assert results.get("c") == 3
+    assert len(results) == 2
+
+
+def test_put_refreshes_entry():
+    results = ResultCache(max_size=2)
+    results.put("a", 1)
+    results.put("b", 2)
+    results.put("a", 10)
+    results.put("c", 3)
+
+    assert results.get("a") == 10
+    assert results.get("b") is None
+
+
+def test_ttl_expiry(clock):
+    results = ResultCache(ttl=60.0)
+    results.put("a", 1)
+
+    clock.now += 59.0
+    assert results.get("a") == 1
+
+    clock.now += 2.0
+    assert results.get("a") is None
+    assert len(results) == 0
+
+
+def test_save_load_round_trip(clock):
+    results = ResultCache(ttl=60.0)
+    results.put("old", "Old")
+    clock.now += 30.0
+    results.put("new", ["New", 1])
+
+    saved = io.StringIO()
+    results.save(saved)
+
+    # By the time it's loaded, "old" has expired
+    clock.now += 40.0
+    loaded = ResultCache(ttl=60.0)
+    loaded.load(io.StringIO(saved.getvalue()))
+
+    assert len(loaded) == 1
+    assert loaded.get("old") is None
+    assert loaded.get("new") == ["New", 1]
+
+
+def test_load_trims_to_max_size():
+    results = ResultCache()
+
+    for i in range(5):
+        results.put(str(i), i)
+
+    saved = io.StringIO()
+    results.save(saved)
+
+    # Loading into a smaller cache keeps the most recently used entries
+    loaded = ResultCache(max_size=3)
+    loaded.load(io.StringIO(saved.getvalue()))
+
+    assert [loaded.get(str(i)) for i in range(5)] == [None, None, 2, 3, 4]
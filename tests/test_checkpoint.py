@@ -0,0 +1,27 @@
+import os
+
+from colorbot import checkpoint
+
+
+def test_state_round_trip(tmpdir):
+    path = str(tmpdir.join("train_state.json"))
+    state = {"step": 120, "epoch": 3, "best_encoder_loss": 0.25,
+             "best_checkpoint": "data/params-best"}
+
+    checkpoint.save_state(path, state)
+
+    assert checkpoint.load_state(path) == state
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_save_state_replaces_old_state(tmpdir):
+    path = str(tmpdir.join("train_state.json"))
+
+    checkpoint.save_state(path, {"step": 1})
+    checkpoint.save_state(path, {"step": 2})
+
+    assert checkpoint.load_state(path) == {"step": 2}
+
+
+def test_missing_state(tmpdir):
+    assert checkpoint.load_state(str(tmpdir.join("train_state.json"))) is None
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from colorbot import constants, data
+
+
+def loop_batch(batch, vocab):
+    """The per-row batch building `gather_batch` replaced."""
+    batch_size = len(batch)
+    max_len = max(len(c.name) for c in batch)
+
+    encoder_input = np.zeros([batch_size, max_len], np.int32)
+    encoder_length = np.zeros([batch_size], np.int32)
+    encoder_target = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
+
+    decoder_state = np.zeros([batch_size, constants.COLOR_SIZE], np.float32)
+    decoder_input = np.zeros([batch_size, max_len - 1], np.int32)
+    decoder_length = np.zeros([batch_size], np.int32)
+    decoder_mask = np.zeros([batch_size, max_len - 1], np.float32)
+    decoder_label = np.zeros([batch_size, max_len - 1], np.int32)
+
+    for i, color in enumerate(batch):
+        enc_name = [vocab[c] for c in color.name]
+
+        encoder_input[i, :len(enc_name)] = enc_name
+        encoder_length[i] = len(enc_name)
+        encoder_target[i, :] = color.r, color.g, color.b
+
+        decoder_state[i, :] = color.r, color.g, color.b
+        decoder_input[i, :len(enc_name) - 1] = enc_name[:-1]
+        decoder_length[i] = len(enc_name) - 1
+        decoder_mask[i, :len(enc_name) - 1] = 1.0
+        decoder_label[i, :len(enc_name) - 1] = enc_name[1:]
+
+    return data.Batch(
+        encoder_input,
+        encoder_length,
+        encoder_target,
+        decoder_state,
+        decoder_input,
+        decoder_length,
+        decoder_mask,
+        decoder_label,
+    )
+
+
+def random_colors(count, rng):
+    chars = "abcdefghijklmnopqrstuvwxyz '-"
+    colors = []
+
+    for _ in range(count):
+        name = "".join(rng.choice(list(chars), rng.randint(1, 25)))
+        rgb = rng.uniform(-1.0, 1.0, 3).astype(np.float32).tolist()
+        colors.append(data.Color("\x02%s\x03" % name, *rgb))
+
+    return colors
+
+
+@pytest.fixture
+def colors():
+    return random_colors(200, np.random.RandomState(0))
+
+
+def test_gather_batch_matches_loop(colors):
+    vocab = data.build_vocab(colors)
+    encoded = data.encode_colors(colors, vocab)
+    indices = np.random.RandomState(1).permutation(len(colors))
+
+    for start in range(0, len(indices), 50):
+        batch_indices = indices[start:start + 50]
+        expected = loop_batch([colors[i] for i in batch_indices], vocab)
+        batch = data.gather_batch(encoded, batch_indices)
+
+        for field in data.Batch._fields:
+            actual = getattr(batch, field)
+            reference = getattr(expected, field)
+
+            assert actual.shape == reference.shape, field
+            assert np.array_equal(actual, reference), field
+
+
+def test_prepare_batch_matches_loop(colors):
+    vocab = data.build_vocab(colors)
+    expected = loop_batch(colors, vocab)
+    batch = data.prepare_batch(colors, vocab)
+
+    for field in data.Batch._fields:
+        assert np.array_equal(getattr(batch, field),
+                              getattr(expected, field)), field
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_prefetcher_keeps_order(colors, threads):
+    encoded = data.encode_colors(colors, data.build_vocab(colors))
+    batches = [np.arange(i, min(i + 7, len(colors)))
+               for i in range(0, len(colors), 7)]
+
+    prefetched = list(data.Prefetcher(encoded, batches, 4, threads))
+
+    assert len(prefetched) == len(batches)
+
+    for batch, indices in zip(prefetched, batches):
+        expected = data.gather_batch(encoded, indices)
+
+        assert np.array_equal(batch.encoder_input, expected.encoder_input)
+
+
+@pytest.mark.parametrize("max_chars", [30, 100, 1000])
+def test_bucket_indices(max_chars):
+    rng = np.random.RandomState(0)
+    lengths = rng.randint(3, 28, 500)
+
+    batches = data.bucket_indices(lengths, max_chars, rng)
+    everything = np.concatenate(batches)
+
+    assert sorted(everything.tolist()) == list(range(len(lengths)))
+
+    for indices in batches:
+        assert len(indices) * lengths[indices].max() <= max_chars
+
+
+def test_bucket_indices_keeps_long_names():
+    # A name longer than the budget still gets a batch of its own
+    batches = data.bucket_indices([5, 40, 6], 10, np.random.RandomState(0))
+
+    assert sorted(sorted(b.tolist()) for b in batches) == [[0], [1], [2]]
+
+
+def test_index_batches_by_size():
+    batches = data.index_batches(np.ones(23, np.int32), 5,
+                                 rng=np.random.RandomState(0))
+
+    assert [len(b) for b in batches] == [5, 5, 5, 5, 3]
+    assert sorted(np.concatenate(batches).tolist()) == list(range(23))
+
+
+def test_validation_split():
+    train, valid = data.validation_split(1000, 0.05, seed=3)
+
+    assert len(valid) == 50
+    assert len(np.intersect1d(train, valid)) == 0
+    assert sorted(np.concatenate([train, valid]).tolist()) == \
+        list(range(1000))
+
+    again_train, again_valid = data.validation_split(1000, 0.05, seed=3)
+
+    assert np.array_equal(train, again_train)
+    assert np.array_equal(valid, again_valid)
+
+    _, other_valid = data.validation_split(1000, 0.05, seed=4)
+
+    assert not np.array_equal(valid, other_valid)
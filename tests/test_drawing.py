@@ -0,0 +1,103 @@
+import struct
+import zlib
+
+import pytest
+
+from colorbot.twitter.drawing import (WIDTH, HEIGHT, PNG_SIGNATURE,
+                                      create_png, solid_png)
+
+
+def read_chunks(png):
+    """Split a PNG into (type, data) chunks, checking every CRC."""
+    assert png[:8] == PNG_SIGNATURE
+
+    chunks = []
+    pos = 8
+
+    while pos < len(png):
+        length, = struct.unpack(">I", png[pos:pos + 4])
+        kind = png[pos + 4:pos + 8]
+        data = png[pos + 8:pos + 8 + length]
+        crc, = struct.unpack(">I", png[pos + 8 + length:pos + 12 + length])
+
+        assert crc == zlib.crc32(kind + data) & 0xffffffff
+        chunks.append((kind, data))
+        pos += 12 + length
+
+    assert pos == len(png)
+
+    return chunks
+
+
+def decode(png):
+    """Decode an unfiltered indexed or RGBA PNG into rows of RGB tuples."""
+    chunks = read_chunks(png)
+    kinds = [kind for kind, _ in chunks]
+
+    assert kinds[0] == b"IHDR"
+    assert chunks[-1] == (b"IEND", b"")
+
+    width, height, depth, color_type, compression, filter_method, \
+        interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+
+    assert (compression, filter_method, interlace) == (0, 0, 0)
+
+    raw = zlib.decompress(b"".join(d for k, d in chunks if k == b"IDAT"))
+
+    if color_type == 3:
+        plte = dict(chunks)[b"PLTE"]
+        palette = [tuple(plte[i:i + 3]) for i in range(0, len(plte), 3)]
+        stride = (width * depth + 7) // 8
+    else:
+        assert (color_type, depth) == (6, 8)
+        stride = width * 4
+
+    assert len(raw) == (1 + stride) * height
+
+    rows = []
+
+    for y in range(height):
+        line = raw[y * (1 + stride):(y + 1) * (1 + stride)]
+
+        # Filter type 0, none
+        assert line[0] == 0
+        line = line[1:]
+
+        if color_type == 3:
+            per_byte = 8 // depth
+            indices = [(line[x // per_byte] >>
+                        (8 - depth * (x % per_byte + 1))) & ((1 << depth) - 1)
+                       for x in range(width)]
+            rows.append([palette[i] for i in indices])
+        else:
+            assert all(a == 0xff for a in line[3::4])
+            rows.append([tuple(line[x * 4:x * 4 + 3]) for x in range(width)])
+
+    return width, height, rows
+
+
+def test_solid_png_is_valid():
+    png = solid_png.__wrapped__(12, 200, 34)
+
+    assert [kind for kind, _ in read_chunks(png)] == \
+        [b"IHDR", b"PLTE", b"IDAT", b"IEND"]
+
+    width, height, rows = decode(png)
+
+    assert (width, height) == (WIDTH, HEIGHT) == (150, 150)
+    assert all(pixel == (12, 200, 34) for row in rows for pixel in row)
+
+
+def test_create_png_scales_colors():
+    _, _, rows = decode(create_png(-1.0, 0.0, 1.0))
+
+    assert rows[0][0] == (0, 128, 255)
+
+
+@pytest.mark.parametrize("rgb", [(0, 0, 0), (255, 255, 255), (17, 99, 230)])
+def test_matches_pngcanvas(rgb):
+    pngcanvas = pytest.importorskip("pngcanvas")
+
+    canvas = pngcanvas.PNGCanvas(WIDTH, HEIGHT, bgcolor=rgb + (0xff,))
+
+    assert decode(solid_png(*rgb)) == decode(canvas.dump())
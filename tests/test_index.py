@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from colorbot.index import ColorIndex
+
+
+def build(rgb):
+    return ColorIndex([("\x02c%d\x03" % i,) + tuple(c)
+                       for i, c in enumerate(rgb.tolist())])
+
+
+def check_nearest(index, query, k):
+    found = index.nearest(query, k)
+    dists = np.sum((np.array([c for _, c in found], np.float32).reshape(
+        [-1, 3]) - np.float32(query)) ** 2, 1)
+    expected = np.sort(np.sum((index.rgb - np.float32(query)) ** 2, 1))[:k]
+
+    assert len(found) == min(k, len(index))
+    assert np.allclose(dists, expected)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_nearest_matches_brute_force(k):
+    rng = np.random.RandomState(0)
+    index = build(rng.uniform(-1.0, 1.0, [2000, 3]))
+
+    for query in rng.uniform(-1.0, 1.0, [50, 3]).tolist():
+        check_nearest(index, query, k)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_nearest_far_from_clustered_colors(k):
+    rng = np.random.RandomState(0)
+    centers = rng.uniform(0.3, 1.0, [5, 3])
+    rgb = centers[rng.randint(5, size=2000)] + rng.normal(0, 0.03, [2000, 3])
+    index = build(np.clip(rgb, -1.0, 1.0))
+
+    for query in [(-1.0, -1.0, -1.0), (-1.0, 1.0, -1.0), (0.0, 0.0, 0.0)]:
+        check_nearest(index, query, k)
+
+
+def test_nearest_with_few_colors():
+    index = build(np.array([[0.5, 0.5, 0.5], [-0.9, 0.2, 0.1]]))
+
+    assert [n for n, _ in index.nearest((0.4, 0.4, 0.4), 5)] == ["c0", "c1"]
+    assert build(np.zeros([0, 3])).nearest((0.0, 0.0, 0.0), 3) == []
@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+import pytest
+
+from colorbot import constants, data
+from colorbot.inference import NumpyModel, gru, load_model, softmax
+
+NAMES = ["\x02red\x03", "\x02teal\x03", "\x02moss green\x03"]
+
+HIDDEN_SIZE = 4
+
+
+def sig(x):
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def test_gru_matches_hand_computed_cell():
+    # 1 unit cell, the gate weights have rows [x, h] and columns [r, u]
+    gates_w = np.array([[0.7, -1.2], [0.4, 0.9]])
+    gates_b = np.array([0.1, -0.3])
+    candidate_w = np.array([[1.5], [-0.8]])
+    candidate_b = np.array([0.2])
+    x, h = 0.5, -0.3
+
+    r = sig(0.7 * x + 0.4 * h + 0.1)
+    u = sig(-1.2 * x + 0.9 * h - 0.3)
+    c = math.tanh(1.5 * x - 0.8 * (r * h) + 0.2)
+    expected = u * h + (1 - u) * c
+
+    new_h = gru(np.array([[x]]), np.array([[h]]), gates_w, gates_b,
+                candidate_w, candidate_b)
+
+    assert new_h.shape == (1, 1)
+    assert new_h[0, 0] == pytest.approx(expected)
+
+
+def random_weights(vocab_size, rng):
+    shapes = {
+        "embed": [vocab_size, HIDDEN_SIZE],
+        "gates_w": [2 * HIDDEN_SIZE, 2 * HIDDEN_SIZE],
+        "gates_b": [2 * HIDDEN_SIZE],
+        "candidate_w": [2 * HIDDEN_SIZE, HIDDEN_SIZE],
+        "candidate_b": [HIDDEN_SIZE],
+    }
+    weights = {}
+
+    for model in ("encoder", "decoder"):
+        for k, shape in shapes.items():
+            weights["%s_%s" % (model, k)] = rng.normal(0, 0.5, shape)
+
+    weights["encoder_output_w"] = rng.normal(0, 0.5, [HIDDEN_SIZE, 3])
+    weights["encoder_output_b"] = rng.normal(0, 0.5, [3])
+    weights["decoder_state_w"] = rng.normal(0, 0.5, [3, HIDDEN_SIZE])
+    weights["decoder_state_b"] = rng.normal(0, 0.5, [HIDDEN_SIZE])
+    weights["decoder_output_w"] = rng.normal(0, 0.5, [HIDDEN_SIZE,
+                                                       vocab_size])
+    weights["decoder_output_b"] = rng.normal(0, 0.5, [vocab_size])
+
+    return {k: v.astype(np.float32) for k, v in weights.items()}
+
+
+@pytest.fixture
+def numpy_model(tmpdir):
+    vocab = data.build_vocab([data.Color(n, 0, 0, 0) for n in NAMES])
+    weights = random_weights(len(vocab) // 2, np.random.RandomState(0))
+    path = str(tmpdir.join("params.npz"))
+
+    with open(path, "wb") as f:
+        np.savez(f, **weights)
+
+    return load_model(vocab, HIDDEN_SIZE, path), weights
+
+
+def test_load_model_serves_npz_with_numpy(numpy_model):
+    model, _ = numpy_model
+
+    assert isinstance(model, NumpyModel)
+
+
+def test_step(numpy_model):
+    model, w = numpy_model
+    ids = np.array([1, 3], np.int32)
+    state = np.random.RandomState(1).normal(0, 1, [2, HIDDEN_SIZE])
+
+    probs, new_state = model._step(ids, state)
+
+    expected_state = gru(w["decoder_embed"][ids], state,
+                         w["decoder_gates_w"], w["decoder_gates_b"],
+                         w["decoder_candidate_w"], w["decoder_candidate_b"])
+    expected_probs = softmax(np.dot(expected_state, w["decoder_output_w"]) +
+                             w["decoder_output_b"])
+
+    assert np.allclose(new_state, expected_state)
+    assert np.allclose(probs, expected_probs)
+    assert np.allclose(probs.sum(1), 1.0)
+
+
+def test_guess_ignores_padding(numpy_model):
+    model, _ = numpy_model
+
+    together = model.guess_batch(NAMES)
+
+    for name, guess in zip(NAMES, together):
+        assert np.allclose(model.guess(name), guess)
+
+
+def test_numpy_matches_tensorflow(tmpdir):
+    tf = pytest.importorskip("tensorflow")
+
+    from colorbot import decoder, encoder
+    from colorbot.model import Model
+    from colorbot.scripts.export import model_weights
+
+    vocab = data.build_vocab([data.Color(n, 0, 0, 0) for n in NAMES])
+    param_path = str(tmpdir.join("params"))
+    npz_path = str(tmpdir.join("params.npz"))
+
+    with tf.Graph().as_default():
+        session = tf.Session()
+        encoder_model = encoder.Encoder(HIDDEN_SIZE, len(vocab) // 2)
+        decoder_model = decoder.Decoder(HIDDEN_SIZE, len(vocab) // 2)
+        session.run(tf.initialize_all_variables())
+
+        tf.train.Saver().save(session, param_path)
+
+        with open(npz_path, "wb") as f:
+            np.savez(f, **model_weights(session, encoder_model,
+                                        decoder_model))
+
+        session.close()
+
+    tf_model = Model(vocab, HIDDEN_SIZE, param_path)
+    np_model = load_model(vocab, HIDDEN_SIZE, npz_path)
+
+    assert np.allclose(tf_model.guess_batch(NAMES),
+                       np_model.guess_batch(NAMES), atol=1e-5)
+
+    rgbs = np.array([[0.5, -0.2, 0.1], [-1.0, 1.0, 0.0]], np.float32)
+    tf_state = tf_model._initial_state(rgbs)
+    np_state = np_model._initial_state(rgbs)
+
+    assert np.allclose(tf_state, np_state, atol=1e-5)
+
+    ids = np.array([vocab[constants.START_SYMBOL]] * 2, np.int32)
+    tf_probs, tf_state = tf_model._step(ids, tf_state)
+    np_probs, np_state = np_model._step(ids, np_state)
+
+    assert np.allclose(tf_probs, np_probs, atol=1e-5)
+    assert np.allclose(tf_state, np_state, atol=1e-5)
+
+    tf_model.close()
@@ -0,0 +1,130 @@
+import io
+
+import numpy as np
+import pytest
+
+from colorbot import data, merge
+
+SOURCES = ["a", "b", "c"]
+
+
+def color(name, r, g, b):
+    return data.Color("\x02%s\x03" % name, r, g, b)
+
+
+# Each run maps every source to the colors it lists
+FIRST_RUN = {
+    "a": [color("red", 0.9, -0.8, -0.8), color("blue", -0.8, -0.8, 0.9),
+          color("grey", 0.0, 0.0, 0.0), color("sand", 0.5, 0.4, 0.1)],
+    "b": [color("red", 0.8, -0.9, -0.7), color("teal", -0.9, 0.1, 0.1),
+          color("grey", 0.1, 0.1, 0.1)],
+    "c": [color("grey", -0.1, -0.1, -0.1), color("moss", -0.3, 0.2, -0.5)],
+}
+
+SECOND_RUN = {
+    # "blue" changed, "sand" dropped, "ivory" is new
+    "a": [color("red", 0.9, -0.8, -0.8), color("blue", -0.7, -0.7, 1.0),
+          color("grey", 0.0, 0.0, 0.0), color("ivory", 0.9, 0.9, 0.8)],
+    # "red" dropped but still listed by "a", "teal" gets a second source
+    "b": [color("teal", -0.9, 0.1, 0.1), color("grey", 0.1, 0.1, 0.1)],
+    # "moss" dropped by its only source, "teal" listed here too
+    "c": [color("grey", -0.1, -0.1, -0.1), color("teal", -0.8, 0.2, 0.2)],
+}
+
+
+def scrape_run(index, run, encoded, vocab):
+    changed = []
+
+    for source in SOURCES:
+        changed.extend(index.update(source, run[source]))
+
+    return merge.merge(index, changed, encoded, vocab)
+
+
+def build(policy, runs):
+    index = merge.SourceIndex(policy, SOURCES)
+    encoded = data.encode_colors([], {})
+    vocab = {}
+
+    for run in runs:
+        # Go through a saved index like separate prepare runs would
+        saved = io.StringIO()
+        index.save(saved)
+        index = merge.SourceIndex(policy, SOURCES)
+        assert index.load(io.StringIO(saved.getvalue()))
+
+        encoded, vocab, _, _, _ = scrape_run(index, run, encoded, vocab)
+
+    return index, encoded, vocab
+
+
+def rounded(rgb):
+    return tuple(np.round(np.asarray(rgb, np.float64), 5).tolist())
+
+
+def decode(encoded, vocab):
+    offsets = encoded.offsets.tolist()
+    names = ["".join(vocab[i] for i in encoded.ids[a:b].tolist())
+             for a, b in zip(offsets[:-1], offsets[1:])]
+
+    return [(name, rounded(rgb)) for name, rgb in zip(names, encoded.rgb)]
+
+
+def check_index(index, encoded, vocab):
+    rows = decode(encoded, vocab)
+
+    assert index.count == len(rows)
+    assert sorted(r for e in index.entries.values() for r in e["rows"]) == \
+        list(range(len(rows)))
+
+    for name, entry in index.entries.items():
+        assert [rows[r] for r in entry["rows"]] == [
+            (name, rounded(np.float32(c))) for c in index.resolve(name)]
+
+
+@pytest.mark.parametrize("policy", merge.POLICIES)
+def test_incremental_merge_matches_rebuild(policy):
+    index, encoded, vocab = build(policy, [FIRST_RUN, SECOND_RUN])
+    fresh_index, fresh_encoded, fresh_vocab = build(policy, [SECOND_RUN])
+
+    check_index(index, encoded, vocab)
+    check_index(fresh_index, fresh_encoded, fresh_vocab)
+
+    assert sorted(decode(encoded, vocab)) == \
+        sorted(decode(fresh_encoded, fresh_vocab))
+    assert set(index.entries) == set(fresh_index.entries)
+
+
+@pytest.mark.parametrize("policy", merge.POLICIES)
+def test_dropped_names(policy):
+    index, encoded, vocab = build(policy, [FIRST_RUN, SECOND_RUN])
+    names = set(name for name, _ in decode(encoded, vocab))
+
+    assert "\x02moss\x03" not in names
+    assert "\x02sand\x03" not in names
+    assert "\x02red\x03" in names
+    assert set(index.entries["\x02red\x03"]["colors"]) == {"a"}
+
+
+def test_rebuild_is_sorted_dark_to_light():
+    index, encoded, vocab = build(merge.KEEP, [SECOND_RUN])
+    keys = [merge.magnitude_key(color(n, *rgb))
+            for n, rgb in decode(encoded, vocab)]
+
+    assert keys == sorted(keys)
+
+
+def test_unchanged_run_changes_nothing():
+    index, encoded, vocab = build(merge.KEEP, [FIRST_RUN])
+    _, _, updated, added, removed = scrape_run(index, FIRST_RUN, encoded,
+                                               vocab)
+
+    assert (updated, added, removed) == (0, 0, 0)
+
+
+def test_repeated_listing_keeps_first():
+    index = merge.SourceIndex(merge.KEEP, SOURCES)
+    index.update("a", [color("red", 0.9, -0.8, -0.8),
+                       color("red", 0.1, 0.1, 0.1)])
+
+    assert index.resolve("\x02red\x03") == [(0.9, -0.8, -0.8)]
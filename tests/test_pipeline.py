@@ -0,0 +1,50 @@
+import threading
+
+from colorbot.twitter.pipeline import Stage
+
+
+def test_stop_drains_queue_and_joins_threads():
+    handled = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def handler(item):
+        # Hold every thread until all items are queued
+        release.wait()
+
+        with lock:
+            handled.append(item)
+
+    stage = Stage("test", handler, threads=3, queue_size=50)
+    stage.start()
+    threads = list(stage._threads)
+
+    for i in range(40):
+        stage.put(i)
+
+    release.set()
+    stage.stop()
+
+    assert sorted(handled) == list(range(40))
+    assert not any(thread.is_alive() for thread in threads)
+    assert stage.depth() == 0
+
+
+def test_failing_item_doesnt_stop_thread():
+    handled = []
+
+    def handler(item):
+        if item == 1:
+            raise ValueError("bad item")
+
+        handled.append(item)
+
+    stage = Stage("test", handler)
+    stage.start()
+
+    for i in range(3):
+        stage.put(i)
+
+    stage.stop()
+
+    assert handled == [0, 2]
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from colorbot.twitter.ratelimit import TokenBucket, TWEETS_PER_HOUR
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def fake_waits(bucket, clock):
+    """Make waiting on the bucket advance the fake clock instead of sleeping.
+    """
+    waits = []
+
+    def wait(timeout):
+        waits.append(timeout)
+        clock.advance(timeout)
+
+    bucket._cond.wait = wait
+
+    return waits
+
+
+def test_burst_then_empty(clock):
+    bucket = TokenBucket(TWEETS_PER_HOUR / 3600.0, 3, clock=clock)
+    fake_waits(bucket, clock)
+
+    assert [bucket.acquire(timeout=0) for _ in range(4)] == \
+        [True, True, True, False]
+
+
+def test_refills_at_tweets_per_hour(clock):
+    bucket = TokenBucket(TWEETS_PER_HOUR / 3600.0, 5, clock=clock)
+    fake_waits(bucket, clock)
+
+    for _ in range(5):
+        assert bucket.acquire(timeout=0)
+
+    interval = 3600.0 / TWEETS_PER_HOUR
+
+    clock.advance(interval * 0.9)
+    assert not bucket.acquire(timeout=0)
+
+    clock.advance(interval * 0.2)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+    # An idle hour only refills up to the capacity
+    clock.advance(3600.0)
+    assert [bucket.acquire(timeout=0) for _ in range(6)] == \
+        [True] * 5 + [False]
+
+
+def test_acquire_times_out(clock):
+    bucket = TokenBucket(1.0 / 60.0, 1, clock=clock)
+    waits = fake_waits(bucket, clock)
+    bucket.acquire()
+    start = clock()
+
+    assert not bucket.acquire(timeout=10.0)
+    assert clock() - start == pytest.approx(10.0)
+    assert waits == [pytest.approx(10.0)]
+
+
+def test_acquire_waits_for_a_token(clock):
+    bucket = TokenBucket(1.0 / 60.0, 1, clock=clock)
+    waits = fake_waits(bucket, clock)
+    bucket.acquire()
+
+    assert bucket.acquire()
+    assert sum(waits) == pytest.approx(60.0)
+
+
+def test_close_wakes_waiters(clock):
+    # The fake clock never moves, so waiters only wake up when closed
+    bucket = TokenBucket(1.0 / 3600.0, 1, clock=clock)
+    bucket.acquire()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        bucket.acquire())) for _ in range(3)]
+
+    for thread in threads:
+        thread.start()
+
+    # Close once every thread is blocked in acquire
+    while len(bucket._cond._waiters) < len(threads):
+        time.sleep(0.001)
+
+    bucket.close()
+
+    for thread in threads:
+        thread.join(5.0)
+        assert not thread.is_alive()
+
+    assert results == [False] * 3
+    assert not bucket.acquire()
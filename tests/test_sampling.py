@@ -0,0 +1,121 @@
+import numpy as np
+
+from colorbot.sampling import sample_categorical
+
+PROBS = np.array([0.1, 0.5, 0.05, 0.35])
+
+
+def frequencies(ids, size):
+    return np.bincount(ids, minlength=size) / len(ids)
+
+
+def test_frequencies_match_distribution():
+    rng = np.random.RandomState(0)
+    probs = np.tile(PROBS, [20000, 1])
+
+    ids = sample_categorical(probs, rng=rng)
+
+    assert ids.dtype == np.int32
+    assert np.allclose(frequencies(ids, 4), PROBS, atol=0.01)
+
+
+def test_unnormalized_rows():
+    rng = np.random.RandomState(0)
+    probs = np.tile(PROBS * 7.0, [20000, 1])
+
+    ids = sample_categorical(probs, rng=rng)
+
+    assert np.allclose(frequencies(ids, 4), PROBS, atol=0.01)
+
+
+def test_top_1_is_argmax():
+    rng = np.random.RandomState(0)
+    probs = rng.dirichlet(np.ones(6), 500)
+
+    ids = sample_categorical(probs, top_k=1, rng=rng)
+
+    assert np.array_equal(ids, np.argmax(probs, 1))
+
+
+def test_low_temperature_is_argmax():
+    rng = np.random.RandomState(0)
+    probs = rng.dirichlet(np.ones(6), 500)
+
+    # At least twice as likely as the runner up, so 0.01 is near enough to 0
+    probs[np.arange(500), np.argmax(probs, 1)] *= 2.0
+
+    ids = sample_categorical(probs, temperature=0.01, rng=rng)
+
+    assert np.array_equal(ids, np.argmax(probs, 1))
+
+
+def test_top_k_limits_choices():
+    rng = np.random.RandomState(0)
+    probs = np.tile(PROBS, [20000, 1])
+
+    ids = sample_categorical(probs, top_k=2, rng=rng)
+
+    # Only the two most likely, renormalized
+    assert np.allclose(frequencies(ids, 4), [0.0, 0.5 / 0.85, 0.0,
+                                             0.35 / 0.85], atol=0.01)
+
+
+def test_top_k_keeps_ties():
+    rng = np.random.RandomState(0)
+    probs = np.tile([0.2, 0.4, 0.2, 0.2], [20000, 1])
+
+    ids = sample_categorical(probs, top_k=2, rng=rng)
+
+    # Everything tied with the 2nd largest is kept
+    assert np.allclose(frequencies(ids, 4), [0.2, 0.4, 0.2, 0.2], atol=0.01)
+
+
+def test_top_k_of_vocab_size_is_no_op():
+    probs = np.tile(PROBS, [1000, 1])
+
+    for top_k in (4, 10):
+        expected = sample_categorical(probs, rng=np.random.RandomState(3))
+        ids = sample_categorical(probs, top_k=top_k,
+                                 rng=np.random.RandomState(3))
+
+        assert np.array_equal(ids, expected)
+
+
+def test_zero_row_falls_back_to_argmax():
+    probs = np.array([[0.0, 0.0, 0.0], [0.2, 0.3, 0.5]])
+
+    ids = sample_categorical(probs, rng=np.random.RandomState(0))
+
+    assert ids[0] == 0
+
+    # Underflows to zero at a low temperature
+    probs = np.array([[1e-30, 3e-30, 2e-30]])
+
+    ids = sample_categorical(probs, temperature=0.01,
+                             rng=np.random.RandomState(0))
+
+    assert ids.tolist() == [1]
+
+
+def test_zero_probability_never_sampled():
+    rng = np.random.RandomState(0)
+    probs = np.tile([0.0, 0.3, 0.0, 0.7, 0.0], [20000, 1])
+
+    ids = sample_categorical(probs, rng=rng)
+
+    assert set(ids.tolist()) <= {1, 3}
+
+
+def test_clamps_to_last_index():
+    class EdgeRandom(object):
+        """Draws the top of the range, where float rounding can leave the
+        draw at or above the last cumulative sum."""
+
+        def rand(self, *shape):
+            return np.ones(shape)
+
+    probs = np.tile([0.1, 0.2, 0.7], [5, 1])
+
+    ids = sample_categorical(probs, rng=EdgeRandom())
+
+    assert ids.tolist() == [2] * 5
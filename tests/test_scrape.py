@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from colorbot import scrape  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+VALSPAR_URL = "http://www.valsparpaint.com/vservice/json/colors/color-wall?localeId=1001&channelId=1001"
+COLORHEXA_URL = "http://www.colorhexa.com/color-names"
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        routes = self.server.routes
+
+        with self.server.lock:
+            self.server.hits[self.path] = \
+                self.server.hits.get(self.path, 0) + 1
+            hit = self.server.hits[self.path]
+
+        if self.path not in routes:
+            self.send_error(404)
+            return
+
+        route = routes[self.path]
+        time.sleep(route.get("delay", 0.0))
+
+        statuses = route.get("statuses", [])
+        status = statuses[hit - 1] if hit <= len(statuses) else 200
+
+        if status != 200:
+            self.send_error(status)
+            return
+
+        etag = route.get("etag")
+
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(route["body"])))
+
+        if etag is not None:
+            self.send_header("ETag", etag)
+
+        self.end_headers()
+        self.wfile.write(route["body"])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = Server(("127.0.0.1", 0), Handler)
+    httpd.routes = {
+        "/valspar": {"body": fixture("valspar.json"), "etag": '"v1"'},
+        "/colorhexa": {"body": fixture("colorhexa.html")},
+    }
+    httpd.hits = {}
+    httpd.lock = threading.Lock()
+    httpd.base = "http://127.0.0.1:%d" % httpd.server_address[1]
+
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield httpd
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class LocalFetcher(scrape.Fetcher):
+    """Fetcher that sends the sources' requests to the local server."""
+
+    def __init__(self, server, **kwargs):
+        kwargs.setdefault("backoff", 0.0)
+        super(LocalFetcher, self).__init__(**kwargs)
+        self.urls = {
+            VALSPAR_URL: server.base + "/valspar",
+            COLORHEXA_URL: server.base + "/colorhexa",
+        }
+
+    def get(self, url):
+        return super(LocalFetcher, self).get(self.urls.get(url, url))
+
+
+def test_scrape_all_keeps_source_order(server):
+    # The first source finishes last
+    server.routes["/valspar"]["delay"] = 0.3
+    sources = [scrape.valspar, scrape.colorhexa]
+
+    results = []
+
+    for _ in range(2):
+        fetcher = LocalFetcher(server)
+        results.append([colors for colors, _ in
+                        scrape.scrape_all(sources, fetcher)])
+        fetcher.close()
+
+    assert results[0] == results[1]
+
+    valspar, colorhexa = results[0]
+    assert [c.name for c in valspar] == [
+        "\x02fire engine\x03", "\x02barn door\x03", "\x02lake shore\x03"]
+    assert [c.name for c in colorhexa] == [
+        "\x02alice blue\x03", "\x02alizarin crimson\x03",
+        "\x02apricot & cream\x03"]
+
+
+def test_scrape_all_stats(server):
+    fetcher = LocalFetcher(server)
+    results = scrape.scrape_all([scrape.valspar, scrape.colorhexa], fetcher)
+
+    assert [stats["colors"] for _, stats in results] == [3, 3]
+    assert all(stats["seconds"] >= 0.0 for _, stats in results)
+
+
+def test_timeout_retries_are_bounded(server):
+    server.routes["/slow"] = {"body": b"late", "delay": 1.0}
+    fetcher = scrape.Fetcher(timeout=0.2, retries=2, backoff=0.0)
+
+    with pytest.raises(requests.Timeout):
+        fetcher.get(server.base + "/slow")
+
+    assert server.hits["/slow"] == 3
+
+
+def test_client_errors_are_not_retried(server):
+    fetcher = scrape.Fetcher(retries=3, backoff=0.0)
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.get(server.base + "/missing")
+
+    assert server.hits["/missing"] == 1
+
+
+def test_server_errors_are_retried(server):
+    server.routes["/flaky"] = {"body": b"ok", "statuses": [500]}
+    fetcher = scrape.Fetcher(retries=3, backoff=0.0)
+
+    assert fetcher.get(server.base + "/flaky") == b"ok"
+    assert fetcher.stats[server.base + "/flaky"]["attempts"] == 2
+
+
+def test_per_url_stats(server, tmp_path):
+    cache = scrape.ResponseCache(str(tmp_path))
+    url = server.base + "/valspar"
+    body = fixture("valspar.json")
+
+    fetcher = scrape.Fetcher(cache=cache)
+    assert fetcher.get(url) == body
+
+    stats = fetcher.stats[url]
+    assert stats["attempts"] == 1
+    assert stats["bytes"] == len(body)
+    assert stats["cached"] is False
+    assert stats["seconds"] >= 0.0
+
+    # Revalidated with the ETag, the server answers 304
+    fetcher = scrape.Fetcher(cache=cache)
+    assert fetcher.get(url) == body
+    assert fetcher.stats[url]["cached"] is True
+
+    fetcher = scrape.Fetcher(cache=cache, offline=True)
+    assert fetcher.get(url) == body
+    assert fetcher.stats[url]["attempts"] == 0
+    assert fetcher.stats[url]["cached"] is True
+    assert server.hits["/valspar"] == 2
+
+
+def test_offline_names_missing_sources(server, tmp_path):
+    cache = scrape.ResponseCache(str(tmp_path))
+    fetcher = LocalFetcher(server, cache=cache)
+    scrape.scrape_all([scrape.colorhexa], fetcher)
+
+    fetcher = LocalFetcher(server, cache=cache, offline=True)
+
+    with pytest.raises(scrape.NotCached) as error:
+        scrape.scrape_all([scrape.valspar, scrape.colorhexa], fetcher)
+
+    assert error.value.sources == ["valspar"]
@@ -0,0 +1,81 @@
+import pytest
+
+from colorbot.twitter.tasks import TaskQueue, DROP_NEWEST, DROP_OLDEST
+
+
+def test_fifo_order():
+    queue = TaskQueue()
+    queue.put("name", "ff0000", "1", "a")
+    queue.put("guess", "teal", "2", "b")
+    queue.put("name", "00ff00", "3", "c")
+
+    batch = queue.get_batch(2)
+
+    assert [t.get("hex", t.get("name")) for t in batch] == ["ff0000", "teal"]
+    assert batch[0]["type"] == "name"
+    assert batch[1]["type"] == "guess"
+    assert [t["hex"] for t in queue.get_batch(10)] == ["00ff00"]
+    assert queue.get_batch(10) == []
+
+
+def test_merges_identical_requests():
+    queue = TaskQueue()
+    queue.put("name", "FF0000", "1", "a")
+    queue.put("name", "ff0000", "2", "b")
+    queue.put("guess", "ff0000", "3", "c")
+
+    assert len(queue) == 2
+
+    name, guess = queue.get_batch(10)
+
+    assert name["hex"] == "ff0000"
+    assert name["replies"] == [
+        {"status_id": "1", "screen_name": "a"},
+        {"status_id": "2", "screen_name": "b"},
+    ]
+    assert guess["name"] == "ff0000"
+    assert len(guess["replies"]) == 1
+
+
+def test_drop_oldest():
+    queue = TaskQueue(capacity=2, drop_policy=DROP_OLDEST)
+    queue.put("name", "000001", "1", "a")
+    queue.put("name", "000001", "2", "b")
+    queue.put("name", "000002", "3", "c")
+
+    assert queue.put("name", "000003", "4", "d")
+    assert [t["hex"] for t in queue.get_batch(10)] == ["000002", "000003"]
+
+    # Both replies of the dropped task count
+    assert queue.dropped == 2
+
+
+def test_drop_newest():
+    queue = TaskQueue(capacity=2, drop_policy=DROP_NEWEST)
+    queue.put("name", "000001", "1", "a")
+    queue.put("name", "000002", "2", "b")
+
+    assert not queue.put("name", "000003", "3", "c")
+
+    # Merging into a pending task still works when full
+    assert queue.put("name", "000001", "4", "d")
+    assert [t["hex"] for t in queue.get_batch(10)] == ["000001", "000002"]
+    assert queue.dropped == 1
+
+
+def test_stats():
+    queue = TaskQueue(capacity=1, drop_policy=DROP_NEWEST)
+    queue.put("guess", "teal", "1", "a")
+    queue.put("guess", "teal", "2", "b")
+    queue.put("guess", "moss", "3", "c")
+
+    assert queue.stats() == {"depth": 1, "dropped": 1, "merged": 1}
+
+    queue.get_batch(1)
+
+    assert queue.stats()["depth"] == 0
+
+
+def test_unknown_drop_policy():
+    with pytest.raises(ValueError):
+        TaskQueue(drop_policy="random")
@@ -0,0 +1,45 @@
+import numpy as np
+
+from colorbot import data
+from colorbot.trie import NameTrie
+
+NAMES = ["\x02red\x03", "\x02reed\x03", "\x02blue\x03"]
+
+
+def ids(vocab, text):
+    return np.array([vocab[c] for c in text], np.int32)
+
+
+def walk(trie, vocab, texts):
+    """Step a batch of equal length strings through the trie."""
+    nodes = np.zeros([len(texts)], np.int32)
+
+    for column in zip(*texts):
+        nodes = trie.step(nodes, ids(vocab, column))
+
+    return nodes
+
+
+def test_step_and_is_name():
+    vocab = data.build_vocab([data.Color(n, 0, 0, 0) for n in NAMES])
+    trie = NameTrie(NAMES, vocab)
+
+    nodes = walk(trie, vocab, ["\x02red", "\x02ree", "\x02reb", "\x02blu"])
+
+    assert (nodes[:2] >= 0).all()
+    assert nodes[2] == -1
+    assert trie.is_name(nodes).tolist() == [True, False, False, False]
+
+    # Sequences that left the trie stay out of it
+    assert trie.step(nodes[2:3], ids(vocab, "d")).tolist() == [-1]
+
+
+def test_empty_name_set():
+    vocab = data.build_vocab([data.Color(n, 0, 0, 0) for n in NAMES])
+    trie = NameTrie([], vocab)
+
+    nodes = trie.step(np.zeros([3], np.int32), ids(vocab, "\x02rb"))
+
+    assert nodes.tolist() == [-1, -1, -1]
+    assert trie.is_name(nodes).tolist() == [False, False, False]
+    assert trie.is_name(np.zeros([1], np.int32)).tolist() == [False]